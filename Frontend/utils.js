@@ -1,28 +1,190 @@
-async function fetchSetup(url="http://localhost:8888/setup") {
+async function fetchSetup(url="http://localhost:8888/setup", lod=null) {
+    // lod: level of detail of the link geometries, null for full detail
+    if (lod !== null) url = `${url}?lod=${lod}`;
     const response = await fetch(url);
     const json = await response.json();
     return json;
 }
 
-async function fetchSnapshot(url="http://localhost:8888/snapshot") {
-    const response = await fetch(url);
+// Binary snapshot: header of the step as a little-endian float64 and 2 little-endian uint32 (number of links, value
+// type), then the link intensities
+const SNAPSHOT_HEADER_SIZE = 16;
+const SNAPSHOT_UINT32 = 0;
+const SNAPSHOT_FLOAT32 = 1;
+
+function decodeSnapshot(buffer) {
+    const header = new DataView(buffer, 0, SNAPSHOT_HEADER_SIZE);
+    const step = header.getFloat64(0, true);
+    const numberOfLinks = header.getUint32(8, true);
+    const valueType = header.getUint32(12, true);
+    let link_intensities;
+    if (valueType === SNAPSHOT_UINT32) {
+        link_intensities = new Uint32Array(buffer, SNAPSHOT_HEADER_SIZE, numberOfLinks);
+    } else if (valueType === SNAPSHOT_FLOAT32) {
+        link_intensities = new Float32Array(buffer, SNAPSHOT_HEADER_SIZE, numberOfLinks);
+    } else {
+        throw new Error(`Unknown snapshot value type: ${valueType}`);
+    }
+    return { step: step, link_intensities: link_intensities };
+}
+
+async function fetchSnapshot(url="http://localhost:8888/snapshot", step=null) {
+    // Without a step the server returns the next frame, with a step the frame of that step (rewind/scrub)
+    if (step !== null) url = `${url}?step=${step}`;
+    // Typed arrays are little-endian on all the platforms browsers run on, the server sends little-endian values
+    const response = await fetch(url, { headers: { "Accept": "application/octet-stream" } });
+    if (!response.ok) {
+        throw new Error(`Snapshot request failed: ${response.status} ${response.statusText}`);
+    }
+    if (response.headers.get("Content-Type") === "application/octet-stream") {
+        return decodeSnapshot(await response.arrayBuffer());
+    }
     const json = await response.json();
     return json;
 }
 
-async function fetchNodeInfo(node_id, url = "http://localhost:8888/node") {
-    const response = await fetch(`${url}?node_id=${node_id}`);
+// Frames pushed by the /frames WebSocket: header of 2 little-endian uint32 (kind, frame), the step as a little-endian
+// float64 and 2 little-endian uint32 (number of entries, value type). A keyframe carries the intensities of all the
+// links, a delta the changed link IDs and their values.
+const FRAME_HEADER_SIZE = 24;
+const KEYFRAME = 0;
+const DELTA_FRAME = 1;
+
+function decodeFrame(buffer) {
+    const header = new DataView(buffer, 0, FRAME_HEADER_SIZE);
+    const kind = header.getUint32(0, true);
+    const frame = header.getUint32(4, true);
+    const step = header.getFloat64(8, true);
+    const count = header.getUint32(16, true);
+    const valueType = header.getUint32(20, true);
+    let offset = FRAME_HEADER_SIZE;
+    let linkIds = null;
+    if (kind === DELTA_FRAME) {
+        linkIds = new Uint32Array(buffer, offset, count);
+        offset += 4 * count;
+    }
+    let values;
+    if (valueType === SNAPSHOT_UINT32) {
+        values = new Uint32Array(buffer, offset, count);
+    } else if (valueType === SNAPSHOT_FLOAT32) {
+        values = new Float32Array(buffer, offset, count);
+    } else {
+        throw new Error(`Unknown frame value type: ${valueType}`);
+    }
+    return { kind: kind, frame: frame, step: step, linkIds: linkIds, values: values };
+}
+
+class FrameStream {
+    /*
+    Receives the frames of the simulation from the /frames WebSocket and keeps the current link intensities.
+    onFrame({step, frame, link_intensities}) is called for every frame, onEnd() when the simulation has no more events.
+    If the connection drops while running, the stream reconnects and resumes from the next frame.
+    */
+    constructor(onFrame, onEnd = () => {}, url = "ws://localhost:8888/frames") {
+        this.url = url;
+        this.onFrame = onFrame;
+        this.onEnd = onEnd;
+        this.socket = null;
+        this.running = false;
+        this.rate = 1;
+        this.nextFrame = null; // null: start from the latest frame of the server
+        this.link_intensities = null;
+    }
+
+    send(message) {
+        if (this.socket !== null && this.socket.readyState === WebSocket.OPEN) {
+            this.socket.send(JSON.stringify(message));
+        }
+    }
+
+    connect() {
+        this.socket = new WebSocket(this.url);
+        this.socket.binaryType = "arraybuffer";
+        this.socket.onopen = () => {
+            if (this.running) {
+                this.send({ type: "start", from_frame: this.nextFrame, rate: this.rate });
+            }
+        };
+        this.socket.onmessage = (event) => {
+            if (typeof event.data === "string") {
+                const message = JSON.parse(event.data);
+                if (message.type === "end") {
+                    this.onEnd();
+                } else if (message.type === "error") {
+                    console.error("Frame stream error:", message.message);
+                }
+                return;
+            }
+            const frame = decodeFrame(event.data);
+            if (frame.kind === KEYFRAME) {
+                this.link_intensities = Float64Array.from(frame.values);
+            } else {
+                for (let i = 0; i < frame.linkIds.length; i++) {
+                    this.link_intensities[frame.linkIds[i]] = frame.values[i];
+                }
+            }
+            this.nextFrame = frame.frame + 1;
+            this.onFrame({ step: frame.step, frame: frame.frame, link_intensities: this.link_intensities });
+            this.send({ type: "ack", frame: frame.frame });
+        };
+        this.socket.onclose = () => {
+            this.socket = null;
+            if (this.running) {
+                setTimeout(() => { if (this.running && this.socket === null) this.connect(); }, 1000);
+            }
+        };
+    }
+
+    start(rate) {
+        // Frames produced elsewhere (e.g. by /snapshot) are skipped, the stream starts from the latest frame
+        this.running = true;
+        this.rate = rate;
+        this.nextFrame = null;
+        if (this.socket === null) {
+            this.connect();
+        } else {
+            this.send({ type: "start", from_frame: null, rate: this.rate });
+        }
+    }
+
+    setRate(rate) {
+        this.rate = rate;
+        this.send({ type: "rate", rate: rate });
+    }
+
+    pause() {
+        this.running = false;
+        this.send({ type: "pause" });
+    }
+}
+
+async function fetchNodeInfo(node_id, url = "http://localhost:8888/node", step = null) {
+    const response = await fetch(step === null ? `${url}?node_id=${node_id}` : `${url}?node_id=${node_id}&step=${step}`);
     const json = await response.json();
     return json;
 }
 
-async function fetchLinkInfo(link_id, url = "http://localhost:8888/link") {
-    const response = await fetch(`${url}?link_id=${link_id}`);
+async function fetchLinkInfo(link_id, url = "http://localhost:8888/link", step = null) {
+    const response = await fetch(step === null ? `${url}?link_id=${link_id}` : `${url}?link_id=${link_id}&step=${step}`);
     const json = await response.json();
     return json;
 }
 
 
+function lodForZoom(zoom, tolerances) {
+    // The coarsest level of detail whose tolerance (in degrees) is below the size of a pixel at this zoom level
+    const pixelSize = 360 / (256 * Math.pow(2, zoom));
+    let lod = 0;
+    for (let i = 0; i < tolerances.length; i++) {
+        if (tolerances[i] <= pixelSize) lod = i;
+    }
+    return lod;
+}
+
+function linkLatLngs(link) {
+    return link.geometry.map(point => new L.LatLng(point[1], point[0]));
+}
+
 function interpolateColor(intensity, M=200) {
     // M should be the max resources going through one edge
     let rho = intensity / M;
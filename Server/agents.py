@@ -1,34 +1,132 @@
 import random
 import math
+from collections import OrderedDict
 import numpy as np
-from typing import List, Tuple
+from typing import Callable, List, Tuple
 
 from common import Request
-from vehicles import Service, Vehicle, VehicleStatus
+from vehicles import Service, Vehicle, VehicleStatus, VehicleStore, VEHICLE_TYPES
+from service_index import ServiceIndex
+
+TRUCK_TYPE = VEHICLE_TYPES.index("Truck")
+RATE_CACHE_SIZE = 8 # (fleet epoch, vehicle type) entries kept by every carrier and LSP, see RateCache
+
+class RateCache:
+    """
+    Bounded least recently used cache of quote rates, keyed by (fleet epoch, vehicle type).
+    The entries of an old fleet epoch are never hit again, so they are the first ones to be evicted.
+    """
+    def __init__(self, size: int = RATE_CACHE_SIZE):
+        self.size = size
+        self.entries: OrderedDict = OrderedDict()
+
+    def get(self, key: Tuple, compute: Callable[[], Tuple]) -> Tuple:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        value = compute()
+        self.entries[key] = value
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return value
 
 class Carrier:
     """
     A carrier is an agent that has a fleet of vehicles and can provide transportation services.
     The fleet stores the ids of the vehicles in the fleet.
+    The speeds, unit costs and types of the fleet are also held as arrays, from which the quote rates are computed.
+    Only the trucks have a speed (the trains and barges run the services of the timetable), the other vehicles have a
+    nan speed and are never quoted.
     """
     def __init__(self, id):
         self.id = id
         self.fleet: List[Vehicle] = []
+        self.vehicle_types = np.empty(0, dtype=np.int8)
+        self.speeds = np.empty(0, dtype=np.float64)
+        self.unit_costs = np.empty(0, dtype=np.float64)
+        # Incremented whenever the fleet changes, so that the cached rates (here and in the LSPs) are not used anymore
+        self.fleet_epoch = 0
+        # Quote rates by (fleet epoch, vehicle type), the vehicle type None meaning the whole fleet, see rates
+        self.rate_cache = RateCache()
+
+    def __getstate__(self):
+        # The vehicles of the fleet are views of the whole vehicle store. A pickled carrier (sent to the decision
+        # workers, see solvers.py) keeps the arrays of its fleet, from which it quotes, but not the vehicles.
+        state = self.__dict__.copy()
+        state["fleet"] = []
+        return state
+
+    def set_fleet(self, vehicles: VehicleStore, indices: np.ndarray):
+        """
+        Replace the fleet by the vehicles at the given indices of the vehicle store.
+        """
+        self.fleet = [vehicles[i] for i in indices.tolist()]
+        self.vehicle_types = vehicles.type[indices].copy()
+        self.speeds = np.where(self.vehicle_types == TRUCK_TYPE, vehicles.speed[indices], np.nan)
+        self.unit_costs = vehicles.unit_cost[indices].copy()
+        self.invalidate_quotes()
 
-    def quota(self, request: Request) -> Tuple[float, float]:
+    def add_vehicle(self, vehicle: Vehicle):
+        self.fleet.append(vehicle)
+        self.vehicle_types = np.append(self.vehicle_types, VEHICLE_TYPES.index(vehicle.name))
+        self.speeds = np.append(self.speeds, getattr(vehicle, "speed_per_timestep", np.nan))
+        self.unit_costs = np.append(self.unit_costs, vehicle.unit_cost)
+        self.invalidate_quotes()
+
+    def invalidate_quotes(self):
+        self.fleet_epoch += 1
+
+    def rates(self, vehicle_type: str = None) -> Tuple[float, float]:
+        """
+        The price and the time per unit of distance of the cheapest vehicle of the fleet (of the given type).
+        The price of a vehicle is distance / speed * unit cost, so the cheapest vehicle does not depend on the distance,
+        and the quote of any request is its distance times these rates.
+        Returns:
+            (price per unit of distance, time per unit of distance), (inf, None) if the carrier has no such vehicle
+            with a speed.
+        """
+        return self.rate_cache.get((self.fleet_epoch, vehicle_type), lambda: self._rates(vehicle_type))
+
+    def _rates(self, vehicle_type: str = None) -> Tuple[float, float]:
+        price_rates = self.unit_costs / self.speeds
+        quoted = ~np.isnan(price_rates)
+        if vehicle_type is not None:
+            quoted &= self.vehicle_types == VEHICLE_TYPES.index(vehicle_type)
+        price_rates = np.where(quoted, price_rates, np.inf)
+        if len(price_rates) == 0 or np.isinf(price_rates).all():
+            return float('inf'), None
+        best = int(np.argmin(price_rates))
+        return float(price_rates[best]), float(1 / self.speeds[best])
+
+    def quota(self, request: Request, vehicle_type: str = None) -> Tuple[float, float]:
+        price_rate, time_rate = self.rates(vehicle_type)
+        if time_rate is None:
+            return price_rate, None
         distance = request.distance
-        min_price = float('inf')
-        best_time = None
+        return distance * price_rate, distance * time_rate
+
+def carrier_rates(carriers: List[Carrier], vehicle_type: str = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The price and time rates (see Carrier.rates) of the carriers as arrays, inf and nan for the carriers without
+    vehicles (of the given type).
+    """
+    rates = [carrier.rates(vehicle_type) for carrier in carriers]
+    price_rates = np.array([price_rate for price_rate, _ in rates], dtype=np.float64)
+    time_rates = np.array([np.nan if time_rate is None else time_rate for _, time_rate in rates], dtype=np.float64)
+    return price_rates, time_rates
 
-        for vehicle in self.fleet:
-            time = distance / vehicle.speed_per_timestep
-            price = time * vehicle.unit_cost
-            if price < min_price:
-                min_price = price
-                best_time = time
+def quote_matrix(carriers: List[Carrier], distances: np.ndarray, vehicle_type: str = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quote many requests against many carriers at once.
+    Args:
+        distances: the distances of the requests.
+    Returns:
+        the prices and the times, as (number of requests, number of carriers) matrices.
+    """
+    price_rates, time_rates = carrier_rates(carriers, vehicle_type)
+    distances = np.asarray(distances, dtype=np.float64)
+    return distances[:, None] * price_rates[None, :], distances[:, None] * time_rates[None, :]
 
-        return min_price, best_time
-    
 class LSP:
     """"
     A logistics service provider (LSP) is an agent that can contact carriers to provide transportation services."
@@ -37,18 +135,52 @@ class LSP:
         self.id = id
         self.carriers: List[Carrier] = np.empty(0, dtype=Carrier)
 
-    def contact_carriers(self, request: Request) -> Tuple[int, float, float]:
-        best_carrier = None
-        best_quota = None
+    @property
+    def carriers(self) -> List[Carrier]:
+        return self._carriers
 
-        for carrier in self.carriers:
-            quota = carrier.quota(request) 
-            if best_quota is None or quota[0] < best_quota[0]: 
-                best_carrier = carrier
-                best_quota = quota
+    @carriers.setter
+    def carriers(self, carriers: List[Carrier]):
+        self._carriers = carriers
+        # (fleet epoch, vehicle type) -> rates of the carriers and the index of the cheapest carrier, see best_rates
+        self.rate_cache = RateCache()
 
-        price, time = best_quota
+    def fleet_epoch(self) -> int:
+        """
+        The sum of the fleet epochs of the carriers. The epochs only increase, so the sum changes whenever the fleet
+        of any carrier of the LSP changes.
+        """
+        return sum(carrier.fleet_epoch for carrier in self.carriers)
+
+    def best_rates(self, vehicle_type: str = None) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        The rates of the carriers and the index of the carrier with the lowest price rate, recomputed only when a fleet
+        of the carriers changed. Since the quotes are linear in the distance, that carrier gives the best quote for
+        every request.
+        """
+        if len(self.carriers) == 0:
+            raise ValueError(f"LSP {self.id} has no carriers to contact")
+        def compute():
+            price_rates, time_rates = carrier_rates(self.carriers, vehicle_type)
+            return price_rates, time_rates, int(np.argmin(price_rates))
+        return self.rate_cache.get((self.fleet_epoch(), vehicle_type), compute)
+
+    def contact_carriers(self, request: Request, vehicle_type: str = None) -> Tuple[int, float, float]:
+        _, _, best = self.best_rates(vehicle_type)
+        best_carrier = self.carriers[best]
+        price, time = best_carrier.quota(request, vehicle_type)
         return best_carrier.id, self.id, price, time
+
+    def quote_requests(self, distances: np.ndarray, vehicle_type: str = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Batch version of contact_carriers for requests with the given distances.
+        Returns:
+            the ID of the best carrier, the price and the time of every request.
+        """
+        price_rates, time_rates, best = self.best_rates(vehicle_type)
+        distances = np.asarray(distances, dtype=np.float64)
+        carrier_ids = np.full(len(distances), self.carriers[best].id)
+        return carrier_ids, distances * price_rates[best], distances * time_rates[best]
     
 class Shipper:
     """"
@@ -68,9 +200,30 @@ class Shipper:
             if best_price is None or price < best_price:
                 best_price = price
                 best_offer = (carrier_id, lsp_id, price, time)
-        return best_offer[3]
+        return best_offer[3] if best_offer is not None else None
+
+    def quote_requests(self, distances: np.ndarray, vehicle_type: str = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Batch version of contact_lsps: quote requests with the given distances with all the LSPs at once.
+        Returns:
+            the IDs of the best LSP and carrier, the price and the time of every request. Without LSPs, no request
+            gets an offer: the IDs are -1, the prices inf and the times nan.
+        """
+        distances = np.asarray(distances, dtype=np.float64)
+        if len(self.lsp_list) == 0:
+            no_offer = np.full(len(distances), -1)
+            return no_offer, no_offer.copy(), np.full(len(distances), np.inf), np.full(len(distances), np.nan)
+        quotes = [lsp.quote_requests(distances, vehicle_type) for lsp in self.lsp_list]
+        prices = np.stack([price for _, price, _ in quotes])
+        best = np.argmin(prices, axis=0)
+        requests = np.arange(len(best))
+        lsp_ids = np.array([lsp.id for lsp in self.lsp_list])[best]
+        carrier_ids = np.stack([carrier_ids for carrier_ids, _, _ in quotes])[best, requests]
+        times = np.stack([time for _, _, time in quotes])[best, requests]
+        return lsp_ids, carrier_ids, prices[best, requests], times
     
-    def decision_making(self, request: Request, present_services: List[Service]) -> List[List[Tuple[bool, Service]]]:
+    def decision_making(self, request: Request, present_services: List[Service],
+                        service_index: ServiceIndex = None) -> List[List[Tuple[bool, Service]]]:
         """
         This function is called when a request arrives. It must call the decision making algorithm to decide
         which services are going to be assigned to the request. There may be services that are already created, and
@@ -88,6 +241,10 @@ class Shipper:
         destination.
 
         This function must wrap the data in a Service object, and return it.
+
+        The candidate present services of a request can be found with the service index instead of scanning them,
+        for example the services leaving the origin in the time window with room for the containers of the request:
+        service_index.query_services(request.origin, *request.time_window, min_capacity=request.amount // 24 + 1)
         """
 
         # class Service(
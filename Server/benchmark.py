@@ -0,0 +1,232 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List
+
+from environment import build_environment, FIXED_STEP
+from instance_generator import generate_instance, create_connectivity
+from instrumentation import Instrumentation
+from network import Network, build_network
+from snapshot_codec import encode_snapshot, encode_response
+from sweep import peak_memory_mb
+
+BENCHMARK_FOLDER = os.path.join("logs", "benchmark")
+RESULTS_FILE_PATH = os.path.join(BENCHMARK_FOLDER, "results.json")
+MAX_RUN_SECONDS = 60.0      # the run of a scale is cut after this, the rates are measured over the steps that ran
+REGRESSION_TOLERANCE = 0.25 # a metric regresses if it is this much (relatively) worse than its baseline
+SNAPSHOT_REPEATS = 20
+
+# ---------------------------------------------------------
+
+@dataclass
+class BenchmarkScale:
+    name: str
+    num_nodes: int
+    num_requests: int
+    num_vehicles: int
+    num_services: int
+    horizon: int                # time of the last request arrival and service departure
+
+SCALES = {scale.name: scale for scale in (
+    BenchmarkScale("small", num_nodes=10, num_requests=1_000, num_vehicles=100, num_services=500, horizon=500),
+    BenchmarkScale("medium", num_nodes=25, num_requests=10_000, num_vehicles=1_000, num_services=5_000, horizon=2_000),
+    BenchmarkScale("large", num_nodes=50, num_requests=100_000, num_vehicles=10_000, num_services=50_000, horizon=5_000),
+)}
+
+# Metrics compared against the baseline
+LOWER_IS_BETTER = ("build_seconds", "step_p50_ms", "step_p99_ms", "update_vehicles_p50_ms", "event_logger_us_per_call",
+                   "state_logger_us_per_call", "snapshot_json_ms", "snapshot_binary_ms", "peak_memory_mb")
+HIGHER_IS_BETTER = ("events_per_second",)
+
+# ---------------------------------------------------------
+
+def synthetic_network(nodes_df: pd.DataFrame) -> Network:
+    """
+    Network of straight routes between every pair of nodes, so that no route has to be fetched.
+    """
+    connectivity = create_connectivity(len(nodes_df))
+    coordinates = nodes_df[["longitude", "latitude"]].to_numpy().tolist()
+    routes = {(i, j): [coordinates[i], coordinates[j]]
+              for i, j in zip(connectivity["origin"].tolist(), connectivity["destination"].tolist())}
+    return build_network(nodes_df, connectivity, routes=routes)
+
+# ---------------------------------------------------------
+
+def latency_percentiles(prefix: str, seconds: List[float]) -> Dict[str, float]:
+    if not seconds:
+        return {}
+    milliseconds = np.array(seconds) * 1000
+    return {f"{prefix}_p{q}_ms": float(np.percentile(milliseconds, q)) for q in (50, 90, 99)} | {f"{prefix}_max_ms": float(milliseconds.max())}
+
+def run_benchmark(scale: BenchmarkScale, seed: int = 0, max_run_seconds: float = MAX_RUN_SECONDS) -> Dict[str, Any]:
+    """
+    Benchmark one scale: build the environment, run it step by step (updating the network after every step, as the
+    simulation worker of the server does) and serialize the snapshot of the last step.
+    The output of the simulation is discarded, so that the timings do not depend on the terminal.
+    Returns:
+        the metrics of the scale.
+    """
+    metrics: Dict[str, Any] = asdict(scale) | {"seed": seed}
+    instance = generate_instance(scale.num_nodes, scale.num_requests, scale.num_vehicles, scale.num_services,
+                                 scale.horizon, seed)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        network = synthetic_network(instance[1])
+        metrics["network_build_seconds"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        environment = build_environment(*instance, step_size=1, advance_mode=FIXED_STEP)
+        metrics["build_seconds"] = time.perf_counter() - start
+        metrics["initial_events"] = len(environment.events)
+
+        # Only the loggers are instrumented, the steps and the network updates are timed by the loop
+        instrumentation = Instrumentation()
+        environment.event_logger.save_event = instrumentation.timed("event_logger", environment.event_logger.save_event)
+        environment.state_logger.save_state = instrumentation.timed("state_logger", environment.state_logger.save_state)
+
+        step_seconds, update_seconds = [], []
+        run_start = time.perf_counter()
+        completed = False
+        while time.perf_counter() - run_start < max_run_seconds:
+            start = time.perf_counter()
+            vehicle_matrices = environment.step()
+            step_seconds.append(time.perf_counter() - start)
+            if vehicle_matrices is None:
+                completed = True
+                break
+            start = time.perf_counter()
+            network.update_vehicles(vehicle_matrices, changes=environment.take_matrix_changes())
+            update_seconds.append(time.perf_counter() - start)
+        run_seconds = time.perf_counter() - run_start
+
+    events = len(environment.event_logger)
+    metrics |= {
+        "completed": completed,
+        "steps": len(step_seconds),
+        "events": events,
+        "run_seconds": run_seconds,
+        "events_per_second": events / run_seconds if run_seconds > 0 else None,
+        "steps_per_second": len(step_seconds) / run_seconds if run_seconds > 0 else None,
+    }
+    metrics |= latency_percentiles("step", step_seconds)
+    metrics |= latency_percentiles("update_vehicles", update_seconds)
+    metrics["update_vehicles_seconds"] = sum(update_seconds)
+    for key in ("event_logger", "state_logger"):
+        calls, seconds = instrumentation.section_calls[key], instrumentation.section_seconds[key]
+        metrics[f"{key}_seconds"] = seconds
+        metrics[f"{key}_us_per_call"] = seconds / calls * 1e6 if calls else None
+
+    start = time.perf_counter()
+    network.update_vehicles(environment.vehicle_matrices)
+    metrics["update_vehicles_full_ms"] = (time.perf_counter() - start) * 1000
+
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        environment.event_logger.dump_binary(os.path.join(folder, "events.bin"))
+        metrics["event_log_dump_seconds"] = time.perf_counter() - start
+
+    # The two formats of /snapshot, compressed for a client that accepts gzip
+    link_intensities = network.link_intensities
+    metrics["links"] = len(link_intensities)
+    start = time.perf_counter()
+    for _ in range(SNAPSHOT_REPEATS):
+        body = json.dumps({"step": environment.time, "link_intensities": link_intensities.tolist()}).encode()
+        json_body, _ = encode_response(body, "gzip")
+    metrics["snapshot_json_ms"] = (time.perf_counter() - start) / SNAPSHOT_REPEATS * 1000
+    start = time.perf_counter()
+    for _ in range(SNAPSHOT_REPEATS):
+        binary_body, _ = encode_response(encode_snapshot(environment.time, link_intensities), "gzip")
+    metrics["snapshot_binary_ms"] = (time.perf_counter() - start) / SNAPSHOT_REPEATS * 1000
+    metrics["snapshot_json_bytes"] = len(json_body)
+    metrics["snapshot_binary_bytes"] = len(binary_body)
+
+    metrics["peak_memory_mb"] = peak_memory_mb()
+    return metrics
+
+def run_scales(scales: List[BenchmarkScale], seed: int = 0, max_run_seconds: float = MAX_RUN_SECONDS) -> Dict[str, Dict[str, Any]]:
+    """
+    Benchmark the scales one after the other, each in a fresh process, so that the peak memory of a scale is its own.
+    """
+    results = {}
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"), max_tasks_per_child=1) as executor:
+        for scale in scales:
+            metrics = executor.submit(run_benchmark, scale, seed, max_run_seconds).result()
+            print(f"{scale.name}: {metrics['events']} events in {metrics['run_seconds']:.2f} s "
+                  f"({metrics['events_per_second']:.0f} events/s, step p99 {metrics.get('step_p99_ms', 0):.2f} ms"
+                  f"{'' if metrics['completed'] else ', cut before the end'})")
+            results[scale.name] = metrics
+    return results
+
+# ---------------------------------------------------------
+
+def compare_to_baseline(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+                        tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """
+    Compare the metrics of the scales that are in both the results and the baseline.
+    Returns:
+        a description of every metric that is more than tolerance (relatively) worse than its baseline.
+    """
+    regressions = []
+    for name in results.keys() & baseline.keys():
+        current, reference = results[name], baseline[name]
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            value, reference_value = current.get(metric), reference.get(metric)
+            if value is None or not reference_value:
+                continue
+            change = value / reference_value - 1
+            worse = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+            if worse:
+                regressions.append(f"{name}.{metric}: {reference_value:.4g} -> {value:.4g} ({change:+.0%})")
+    return regressions
+
+def parse_arguments(arguments: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the simulation core on synthetic instances of increasing "
+                                                 "scale.")
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"], choices=list(SCALES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-run-seconds", type=float, default=MAX_RUN_SECONDS,
+                        help="cut the run of a scale after this many seconds")
+    parser.add_argument("--output", default=RESULTS_FILE_PATH, help="JSON file of the results")
+    parser.add_argument("--baseline", default=None, help="JSON file of a previous run to compare the results with")
+    parser.add_argument("--save-baseline", default=None, help="also save the results as a baseline to this file")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="relative change of a metric that counts as a regression")
+    return parser.parse_args(arguments)
+
+def main(arguments: List[str] = None) -> int:
+    arguments = parse_arguments(arguments)
+    results = run_scales([SCALES[name] for name in arguments.scales], arguments.seed, arguments.max_run_seconds)
+
+    for path in filter(None, (arguments.output, arguments.save_baseline)):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to {path}")
+
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(pd.DataFrame(results))
+
+    if arguments.baseline is not None:
+        with open(arguments.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, arguments.tolerance)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("No regressions against the baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,10 @@ from dataclasses import dataclass, field
 from enum import Enum
 from typing import List, Tuple, TypeAlias
 
+import numpy as np
+
+from entity_store import ColumnStore, EntityView, column_property, object_column_property
+
 AccessType: TypeAlias = Tuple[bool, bool, bool]
 
 
@@ -23,10 +27,20 @@ class Node:
 
 @dataclass
 class Link:
+    """
+    A link is a polyline from (start_longitude, start_latitude) to (end_longitude, end_latitude).
+    geometry is the list of [longitude, latitude] points of the polyline, None for a straight segment.
+    """
     start_longitude: float
     start_latitude: float
     end_longitude: float
     end_latitude: float
+    geometry: List[List[float]] = None
+
+    def points(self) -> List[List[float]]:
+        if self.geometry is None:
+            return [[self.start_longitude, self.start_latitude], [self.end_longitude, self.end_latitude]]
+        return self.geometry
 
 @dataclass
 class Vehicle:
@@ -68,22 +82,83 @@ class Event_Type(Enum):
     TRAIN_LOADING = 8
     BARGE_LOADING = 9
 
+    DECISION_DEADLINE = 10                              # the plan of a request decided in a worker process is due
+
 class Agent_Type(Enum):
     SHIPPER = 0
     LSP = 1
     CARRIER = 2
 
-@dataclass
-class Request:
-    id: int
-    origin: int                                         # Node ID
-    destination: int                                    # Node ID
-    amount: int                                         # in euro pallets
-    time_window: Tuple[int, int]                        # Lower and upper bounds
-    selected_shipper: int                               # Shipper ID
-    distance: int                                       # in km
+class RequestStatus(Enum):
+    PENDING = 0                                         # the request has not arrived yet
+    ASSIGNED = 1                                        # services have been assigned to the request
+    COMPLETED = 2
 
-    services: List[int]                                 # Number of services associated with the request
+class RequestStore(ColumnStore):
+    """
+    Columnar storage of the requests. The Request objects handed out by the store are views of its rows.
+    """
+    columns = {
+        "id": np.int64,
+        "origin": np.int32,                             # Node ID
+        "destination": np.int32,                        # Node ID
+        "amount": np.int64,                             # in euro pallets
+        "lower_bound": np.int64,                        # Time window
+        "upper_bound": np.int64,
+        "selected_shipper": np.int32,                   # Shipper ID
+        "distance": np.float64,                         # in km
+        "status": np.int8,                              # RequestStatus value
+        "services": object,                             # Number of services associated with the request
+    }
+
+    def view(self, index: int) -> 'Request':
+        return Request._view(self, index)
+
+    def count_by_status(self) -> dict:
+        counts = np.bincount(self.status, minlength=len(RequestStatus))
+        return {status.name: int(counts[status.value]) for status in RequestStatus}
+
+class Request(EntityView):
+    __slots__ = ()
+    fields = ("id", "origin", "destination", "amount", "time_window", "selected_shipper", "distance", "services")
+
+    def __init__(self, id: int, origin: int, destination: int, amount: int, time_window: Tuple[int, int],
+                 selected_shipper: int, distance: int, services: List[int], store: RequestStore = None):
+        # A request built on its own (e.g. from a record in a decision worker) is a new row of the given store, or has
+        # a store of its own
+        self._bind_new_row(store, RequestStore)
+        self.id = id
+        self.origin = origin
+        self.destination = destination
+        self.amount = amount
+        self.time_window = time_window
+        self.selected_shipper = selected_shipper
+        self.distance = distance
+        self.services = services
+
+    id = column_property("id")
+    origin = column_property("origin")
+    destination = column_property("destination")
+    amount = column_property("amount")
+    selected_shipper = column_property("selected_shipper")
+    distance = column_property("distance")
+    services = object_column_property("services", list)
+
+    @property
+    def time_window(self) -> Tuple[int, int]:
+        return (self._store.lower_bound[self._index].item(), self._store.upper_bound[self._index].item())
+
+    @time_window.setter
+    def time_window(self, time_window: Tuple[int, int]):
+        self._store.lower_bound[self._index], self._store.upper_bound[self._index] = time_window
+
+    @property
+    def status(self) -> RequestStatus:
+        return RequestStatus(self._store.status[self._index].item())
+
+    @status.setter
+    def status(self, status: RequestStatus):
+        self._store.status[self._index] = status.value
 
     def is_request_fulfilled(self):
         return sum(self.services) == 0
@@ -95,7 +170,6 @@ class Request:
     # is_splittable: bool = field(default = False)        # whether the request can be split into multiple trucks
 
 
-
 @dataclass
 class Event:
     timestamp: int
@@ -103,9 +177,10 @@ class Event:
     request_id: int = -1
     vehicle_id: int = -1
     request_service_id: int = -1
+    priority: int = 0                                   # Events with the same timestamp are processed in increasing priority
     
     def __lt__(self, other: 'Event'):
-        return self.timestamp < other.timestamp
+        return (self.timestamp, self.priority) < (other.timestamp, other.priority)
     
     def to_dict(self):
         return {
@@ -1,10 +1,13 @@
+import bisect
+import gzip
 import json
 import os
-from typing import Dict, List
+import time
+from typing import Dict, Iterator, List, Tuple
 
 import numpy as np
-from vehicles import Vehicle
-from common import Event
+from vehicles import VehicleStore, VehicleStatus, VEHICLE_TYPES
+from common import Event, Event_Type
 
 
 FOLDER_NAME = "logs"
@@ -19,16 +22,120 @@ ENVIRONMENT_STATES_FILE_PATH = os.path.join(FOLDER_NAME, ENVIRONMENT_STATES_FILE
 VEHICLE_STATES_FILE_PATH = os.path.join(FOLDER_NAME, VEHICLE_STATES_FILE)
 CALCULATIONS_FILE_PATH = os.path.join(FOLDER_NAME, CALCULATIONS_FILE)
 
+# Newline-delimited JSON files written while the simulation runs (see StreamWriter)
+EVENT_STREAM_FILE_PATH = os.path.join(FOLDER_NAME, "events.ndjson")
+EVENT_BINARY_FILE_PATH = os.path.join(FOLDER_NAME, "events.bin")
+ENVIRONMENT_STATES_STREAM_FILE_PATH = os.path.join(FOLDER_NAME, "environment_states.ndjson")
+VEHICLE_STATES_STREAM_FILE_PATH = os.path.join(FOLDER_NAME, "vehicle_states.ndjson")
+
+FLUSH_INTERVAL = 1.0        # seconds
+BUFFER_SIZE = 1000          # records
+
+class StreamWriter:
+    """
+    Appends records as newline-delimited JSON to a file while the simulation runs.
+    Records are buffered and written when the buffer is full or when flush_interval seconds passed since the last flush,
+    so memory stays bounded by the buffer and the file can be read (see read_records) while it is being written.
+    With compress=True the file is gzip-compressed and ".gz" is appended to its path.
+    """
+    def __init__(self, path: str, compress: bool = False, flush_interval: float = FLUSH_INTERVAL, buffer_size: int = BUFFER_SIZE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path + ".gz" if compress else path
+        self.file = gzip.open(self.path, "wt", encoding="utf-8") if compress else open(self.path, "w", encoding="utf-8")
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self.buffer: List[str] = []
+        self.last_flush = time.monotonic()
+        self.records_written = 0
+
+    def write(self, record):
+        self.buffer.append(json.dumps(record))
+        if len(self.buffer) >= self.buffer_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write("\n".join(self.buffer) + "\n")
+            self.records_written += len(self.buffer)
+            self.buffer.clear()
+        # For gzip files this is a sync flush, everything written so far can be decompressed
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+def read_records(path: str) -> Iterator:
+    """
+    Reads the records of a file written by a StreamWriter. The file may still be written to (or the run may have crashed),
+    so an incomplete last record is ignored.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        try:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    return
+        except EOFError:
+            # Compressed stream that is not finished yet
+            return
+
+# Edges of the histogram of the decision times, 10 bins per decade from 1 us to 1000 s
+DECISION_SECONDS_EDGES = np.logspace(-6, 3, 91)
+DECISION_PERCENTILES = (50, 90, 99)
+
 class StatisticsTracker:
     def __init__(self):
         self.total_distance_by_vehicle: Dict[str, float] = {}
         self.modal_share: Dict[str, float] = {}
+        # Lateness of the completed requests: time between the end of their time window and their completion
+        self.completed_requests = 0
+        self.late_requests = 0
+        self.total_lateness = 0.0
+        # Wall-clock seconds of the decisions of the requests (their share of the solve of their batch), as running
+        # aggregates and a histogram, from which the percentiles are estimated, and the number of requests that got
+        # the fallback plan
+        self.decisions = 0
+        self.fallback_decisions = 0
+        self.decision_seconds_total = 0.0
+        self.decision_seconds_max = 0.0
+        self.decision_seconds_histogram = np.zeros(len(DECISION_SECONDS_EDGES) + 1, dtype=np.int64)
 
     def add_distance(self, vehicle_type: str, distance: float):
         if vehicle_type not in self.total_distance_by_vehicle:
             self.total_distance_by_vehicle[vehicle_type] = 0.0
         self.total_distance_by_vehicle[vehicle_type] += distance
     
+    def add_lateness(self, lateness: float):
+        self.completed_requests += 1
+        if lateness > 0:
+            self.late_requests += 1
+            self.total_lateness += lateness
+
+    def add_decision(self, seconds: float, fallback: bool = False):
+        self.decisions += 1
+        if fallback:
+            self.fallback_decisions += 1
+        self.decision_seconds_total += seconds
+        self.decision_seconds_max = max(self.decision_seconds_max, seconds)
+        self.decision_seconds_histogram[np.searchsorted(DECISION_SECONDS_EDGES, seconds)] += 1
+
+    def decision_seconds_percentile(self, q: float) -> float:
+        """
+        Estimate of a percentile of the decision times: the upper edge of the histogram bin that contains it (at most
+        the largest time).
+        """
+        if self.decisions == 0:
+            return 0.0
+        position = int(np.searchsorted(np.cumsum(self.decision_seconds_histogram), q / 100 * self.decisions))
+        if position >= len(DECISION_SECONDS_EDGES):
+            return self.decision_seconds_max
+        return min(float(DECISION_SECONDS_EDGES[position]), self.decision_seconds_max)
+
     def total_distance_traveled(self) -> float:
         return sum(self.total_distance_by_vehicle.values())
 
@@ -47,66 +154,450 @@ class StatisticsTracker:
     def to_dict(self) -> Dict[str, float]:
         return {
             "total_distance_by_vehicle": self.total_distance_by_vehicle,
-            "modal_share": self.modal_share
+            "modal_share": self.modal_share,
+            "completed_requests": self.completed_requests,
+            "late_requests": self.late_requests,
+            "total_lateness": self.total_lateness,
+            "decisions": self.decisions,
+            "fallback_decisions": self.fallback_decisions,
+            "decision_seconds_mean": self.decision_seconds_total / self.decisions if self.decisions else 0.0,
+            "decision_seconds_max": self.decision_seconds_max,
+            **{f"decision_seconds_p{q}": self.decision_seconds_percentile(q) for q in DECISION_PERCENTILES}
         }
 
+KEYFRAME_INTERVAL = 50
+
 class EnvironmentStateLogger:
-    def __init__(self):
-        self.state_dict: Dict[int, Dict[str, np.ndarray]] = {}
-        self.vehicle_dict: Dict[int, List[Vehicle]] = {}
+    """
+    Records the state of the environment at every step as periodic keyframes and sparse deltas.
+    A keyframe stores all the vehicle matrices and all the vehicles. A delta stores only the matrix cells that changed
+    since the previous recorded step, as [i, j, type, value] entries, and only the vehicles that the environment
+    marked dirty since the previous recorded step. The environment reports the matrix cells it changes with
+    mark_changed, so that a delta does not compare the matrices.
+    Vehicles are recorded as a columnar fleet record (see fleet_record), where "index" is the position of
+    the vehicle in the fleet.
+    Any step can be rebuilt with get_state from the closest keyframe before it.
+
+    After open_streams, the frames are written to newline-delimited JSON files as they are recorded instead of
+    being kept in memory.
+    """
+    def __init__(self, keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.state_frames: Dict[int, Dict] = {}
+        self.vehicle_frames: Dict[int, Dict] = {}
+        # (first step, last step, step size, step since which the state is unchanged)
+        self.unchanged_ranges: List[Tuple[int, int, int, int]] = []
+        # Value at the previous recorded step of the matrix cells changed since then, by vehicle type and (i, j)
+        self._changed_cells: Dict[str, Dict[Tuple[int, int], int]] = {}
+        self._last_step = None
+        self._frames_since_keyframe = 0
+        self.state_stream: StreamWriter = None
+        self.vehicle_stream: StreamWriter = None
 
-    def save_state(self, step: int, state: Dict[str, np.ndarray], vehicles: List[Vehicle]):
+    def open_streams(self, compress: bool = False, flush_interval: float = FLUSH_INTERVAL):
+        self.state_stream = StreamWriter(ENVIRONMENT_STATES_STREAM_FILE_PATH, compress, flush_interval)
+        self.vehicle_stream = StreamWriter(VEHICLE_STATES_STREAM_FILE_PATH, compress, flush_interval)
+
+    def mark_changed(self, name: str, i: int, j: int, previous: int):
+        """
+        Report a change of the cell (i, j) of the matrix of a vehicle type, whose value was previous before the change.
+        """
+        self._changed_cells.setdefault(name, {}).setdefault((i, j), previous)
+
+    def save_state(self, step: int, state: Dict[str, np.ndarray], vehicles: VehicleStore):
         """
         Save the state of the environment at a given step.
         
         Args:
             step (int): The simulation step.
             state (Dict[str, np.ndarray]): The state of the environment.
-            vehicles (List[Vehicle]): The list of vehicles in the environment.
+            vehicles (VehicleStore): The vehicles in the environment.
         """
-        serializable_state = {
-            key: value.tolist() if isinstance(value, np.ndarray) else value
-            for key, value in state.items()
-        }
-        self.state_dict[step] = serializable_state
-        
-        serializable_vehicles = [vehicle.to_dict() for vehicle in vehicles]
-        self.vehicle_dict[step] = serializable_vehicles
+        dirty_indices = vehicles.take_dirty()
+
+        if self._last_step is None or self._frames_since_keyframe + 1 >= self.keyframe_interval:
+            state_frame = {"keyframe": {key: value.tolist() for key, value in state.items()}}
+            vehicle_frame = {"keyframe": fleet_record(vehicles, np.arange(len(vehicles)), include_static=True)}
+            self._frames_since_keyframe = 0
+        else:
+            state_frame = {"delta": matrix_delta(self._changed_cells, state)}
+            vehicle_frame = {"delta": fleet_record(vehicles, dirty_indices)}
+            self._frames_since_keyframe += 1
+
+        if self.state_stream is not None:
+            self.state_stream.write({"step": step, **state_frame})
+            self.vehicle_stream.write({"step": step, **vehicle_frame})
+        else:
+            self.state_frames[step] = state_frame
+            self.vehicle_frames[step] = vehicle_frame
+
+        self._changed_cells = {}
+        self._last_step = step
+
+    def has_state(self, step: int) -> bool:
+        return step == self._last_step or step in self.state_frames
+
+    def mark_unchanged(self, first_step: int, last_step: int, step_size: int, since: int):
+        """
+        Mark the steps first_step, first_step + step_size, ..., last_step as having the same state as step since.
+        Only the range is stored (and logged, see unchanged_record), the steps are resolved when they are read.
+        """
+        if self.state_stream is not None:
+            record = unchanged_record(first_step, last_step, step_size, since)
+            self.state_stream.write(record)
+            self.vehicle_stream.write(record)
+        else:
+            self.unchanged_ranges.append((first_step, last_step, step_size, since))
+
+    def unchanged_records(self) -> Dict[int, Dict]:
+        """
+        The unchanged ranges keyed by their first step, as logged by log_states.
+        """
+        return {first_step: unchanged_record(first_step, last_step, step_size, since)
+                for first_step, last_step, step_size, since in self.unchanged_ranges}
+
+    def reader(self) -> 'StateReader':
+        return StateReader(self.state_frames, self.vehicle_frames, self.unchanged_ranges)
+
+    def get_state(self, step: int):
+        """
+        Returns the (state, vehicles) at the given step, rebuilt from the closest keyframe.
+        """
+        return self.reader().get_state(step)
     
     def log_states(self):
         """
         Log the environment states to a JSON file.
-        
-        Args:
-            state_dict (Dict[int, Dict[str, np.ndarray]]): The state of the environment at each step.
-            vehicle_dict (Dict[int, List[Vehicle]]): The list of vehicles in the environment at each step.
+        Each recorded step maps to a keyframe or a delta. Each range of skipped steps is a single entry, keyed by its
+        first step, with the range and the step whose state it repeats (see unchanged_record).
+        If the states are streamed, the streams are flushed and closed instead.
         """
+        if self.state_stream is not None:
+            self.state_stream.close()
+            self.vehicle_stream.close()
+            return
+
+        records = self.unchanged_records()
         with open(ENVIRONMENT_STATES_FILE_PATH, "w") as file:
-            json.dump(self.state_dict, file, indent=4)
+            json.dump(dict(sorted({**self.state_frames, **records}.items())), file, indent=4)
 
         with open(VEHICLE_STATES_FILE_PATH, "w") as file:
-            json.dump(self.vehicle_dict, file, indent=4)
+            json.dump(dict(sorted({**self.vehicle_frames, **records}.items())), file, indent=4)
+
+def unchanged_record(first_step: int, last_step: int, step_size: int, since: int) -> Dict:
+    """
+    The record of the skipped steps first_step, first_step + step_size, ..., last_step, whose state is the one of
+    step since.
+    """
+    return {"steps": [first_step, last_step, step_size], "unchanged_since": since}
+
+def unchanged_range(step: int, record: Dict) -> Tuple[int, int, int, int]:
+    """
+    The (first step, last step, step size, since) range of an unchanged record. Files written before the ranges were
+    logged as single entries hold one {"unchanged_since": since} marker per skipped step.
+    """
+    if "steps" in record:
+        return (*record["steps"], record["unchanged_since"])
+    return step, step, 1, record["unchanged_since"]
+
+def fleet_record(vehicles: VehicleStore, indices: np.ndarray, include_static: bool = False) -> Dict[str, List]:
+    """
+    Columnar record of the state of the vehicles at the given indices: one list per attribute.
+    The attributes that never change during a run are only included if include_static is True (keyframes).
+    """
+    record = {
+        "index": indices.tolist(),
+        "current_location": np.column_stack((vehicles.location_origin[indices], vehicles.location_destination[indices])).tolist(),
+        "number_of_containers": vehicles.number_of_containers[indices].tolist(),
+        "containers": [dict(containers) if containers is not None else {} for containers in vehicles.containers[indices]],
+        "status": [VehicleStatus(status).name for status in vehicles.status[indices].tolist()],
+    }
+    if include_static:
+        record.update({
+            "vehicle_id": vehicles.vehicle_id[indices].tolist(),
+            "name": [VEHICLE_TYPES[vehicle_type] for vehicle_type in vehicles.type[indices].tolist()],
+            "max_containers": vehicles.max_containers[indices].tolist(),
+            "unit_cost": vehicles.unit_cost[indices].tolist(),
+            "emission_factor": vehicles.emission_factor[indices].tolist(),
+            "carrier_id": vehicles.carrier_id[indices].tolist(),
+        })
+    return record
+
+def apply_fleet_record(vehicles: List[Dict], record: Dict[str, List]):
+    """
+    Update the vehicle dictionaries (in the Vehicle.to_dict format) with a fleet record.
+    """
+    attributes = [attribute for attribute in record if attribute != "index"]
+    for position, index in enumerate(record["index"]):
+        vehicle = dict(vehicles[index]) if vehicles[index] is not None else {}
+        for attribute in attributes:
+            vehicle[attribute] = record[attribute][position]
+        vehicles[index] = vehicle
+
+def matrix_delta(changed_cells: Dict[str, Dict[Tuple[int, int], int]], current: Dict[str, np.ndarray]) -> List[List]:
+    """
+    Returns the [i, j, type, value] entries of the changed cells of the current matrices whose value differs from their
+    previous one, in row-major order.
+    """
+    delta = []
+    for key, matrix in current.items():
+        cells = changed_cells.get(key)
+        if not cells:
+            continue
+        for (i, j), previous in sorted(cells.items()):
+            value = matrix[i, j].item()
+            if value != previous:
+                delta.append([i, j, key, value])
+    return delta
+
+class StateReader:
+    """
+    Rebuilds the state of any step from keyframes and deltas, either in memory (EnvironmentStateLogger.reader)
+    or from the files written by EnvironmentStateLogger.log_states (StateReader.from_files).
+    The ranges of skipped steps are kept sorted by first step (they do not overlap), so that resolving a step is a
+    binary search.
+    """
+    def __init__(self, state_frames: Dict, vehicle_frames: Dict, unchanged_ranges: List[Tuple[int, int, int, int]] = ()):
+        self.state_frames = state_frames
+        self.vehicle_frames = vehicle_frames
+        self.unchanged_ranges = sorted(unchanged_ranges)
+        self.range_starts = [first_step for first_step, _, _, _ in self.unchanged_ranges]
+        self.steps = sorted(state_frames)
+
+    @classmethod
+    def from_files(cls, environment_states_path: str = ENVIRONMENT_STATES_FILE_PATH,
+                   vehicle_states_path: str = VEHICLE_STATES_FILE_PATH) -> 'StateReader':
+        with open(environment_states_path) as file:
+            state_frames = {parse_step(step): frame for step, frame in json.load(file).items()}
+        with open(vehicle_states_path) as file:
+            vehicle_frames = {parse_step(step): frame for step, frame in json.load(file).items()
+                              if "unchanged_since" not in frame}
+        unchanged_ranges = [unchanged_range(step, frame) for step, frame in state_frames.items()
+                            if "unchanged_since" in frame]
+        state_frames = {step: frame for step, frame in state_frames.items() if "unchanged_since" not in frame}
+        return cls(state_frames, vehicle_frames, unchanged_ranges)
+
+    @classmethod
+    def from_streams(cls, environment_states_path: str = ENVIRONMENT_STATES_STREAM_FILE_PATH,
+                     vehicle_states_path: str = VEHICLE_STATES_STREAM_FILE_PATH) -> 'StateReader':
+        """
+        Reads the files written by a streaming EnvironmentStateLogger, possibly while the simulation is still running.
+        """
+        frames = []
+        unchanged_ranges = []
+        for path in (environment_states_path, vehicle_states_path):
+            path_frames = {}
+            for record in read_records(path):
+                if "unchanged_since" in record:
+                    if path == environment_states_path:
+                        unchanged_ranges.append(unchanged_range(None, record))
+                else:
+                    path_frames[record.pop("step")] = record
+            frames.append(path_frames)
+        # A run in progress may have written a frame to one file only
+        state_frames, vehicle_frames = frames
+        common_steps = state_frames.keys() & vehicle_frames.keys()
+        state_frames = {step: frame for step, frame in state_frames.items() if step in common_steps}
+        return cls(state_frames, vehicle_frames, unchanged_ranges)
+
+    def resolve(self, step: int) -> int:
+        """
+        Returns the recorded step whose state is repeated at the given step.
+        """
+        position = bisect.bisect_right(self.range_starts, step) - 1
+        if position >= 0:
+            first_step, last_step, step_size, since = self.unchanged_ranges[position]
+            if step <= last_step and (step - first_step) % step_size == 0:
+                return since
+        return step
+
+    def get_state(self, step: int):
+        """
+        Returns the vehicle matrices (Dict[str, np.ndarray]) and the vehicles (List[dict]) at the given step.
+        """
+        step = self.resolve(step)
+        position = bisect.bisect_left(self.steps, step)
+        if position == len(self.steps) or self.steps[position] != step:
+            raise KeyError(f"No state recorded at step {step}")
+
+        keyframe_position = position
+        while "keyframe" not in self.state_frames[self.steps[keyframe_position]]:
+            keyframe_position -= 1
+
+        keyframe_step = self.steps[keyframe_position]
+        state = {key: np.array(value) for key, value in self.state_frames[keyframe_step]["keyframe"].items()}
+        keyframe = self.vehicle_frames[keyframe_step]["keyframe"]
+        vehicles = [None] * len(keyframe["index"])
+        apply_fleet_record(vehicles, keyframe)
+        for delta_step in self.steps[keyframe_position + 1:position + 1]:
+            for i, j, key, value in self.state_frames[delta_step]["delta"]:
+                state[key][i, j] = value
+            apply_fleet_record(vehicles, self.vehicle_frames[delta_step]["delta"])
+        return state, vehicles
+
+def parse_step(step: str):
+    # JSON object keys are strings
+    value = float(step)
+    return int(value) if value.is_integer() else value
+
+# One processed event. Little-endian so that binary logs can be memory-mapped on any machine.
+EVENT_RECORD_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("type", "u1"),                 # Event_Type value
+    ("request_id", "<i8"),
+    ("vehicle_id", "<i8"),
+    ("request_service_id", "<i8"),
+])
+
+EVENT_BLOCK_SIZE = 65536
 
 class EventLogger:
-    def __init__(self):
-        self.event_list = np.array([], dtype=Event)
+    """
+    Append-only log of the processed events, stored as EVENT_RECORD_DTYPE records in preallocated numpy blocks
+    of block_size records. A new block is allocated when the current one is full, so saving an event never copies
+    the log.
+
+    After open_stream, the records are appended to logs/events.bin (raw records, readable with read_event_log
+    while the simulation runs) or, with compress=True, to logs/events.ndjson.gz, and are not kept in memory.
+    The records of a binary log are read back from the file (see records), the compressed log keeps only the timestamp
+    and the type of the events and cannot be read back.
+    """
+    def __init__(self, block_size: int = EVENT_BLOCK_SIZE):
+        self.block_size = block_size
+        self.blocks: List[np.ndarray] = []
+        self.block = np.empty(block_size, dtype=EVENT_RECORD_DTYPE)
+        self.position = 0
+        self.number_of_events = 0
+        self.stream: StreamWriter = None
+        self.binary_file = None
+        self.binary_path: str = None
+        self.flushed_position = 0
+        self.flush_interval = FLUSH_INTERVAL
+        self.last_flush = time.monotonic()
+
+    def open_stream(self, compress: bool = False, flush_interval: float = FLUSH_INTERVAL):
+        if compress:
+            self.stream = StreamWriter(EVENT_STREAM_FILE_PATH, compress, flush_interval)
+        else:
+            os.makedirs(FOLDER_NAME, exist_ok=True)
+            self.binary_path = EVENT_BINARY_FILE_PATH
+            self.binary_file = open(self.binary_path, "wb")
+        self.flush_interval = flush_interval
+
+    def is_streaming(self) -> bool:
+        return self.stream is not None or self.binary_file is not None
 
     def save_event(self, event: Event):
-        self.event_list = np.append(self.event_list, event)
+        self.block[self.position] = (event.timestamp, event.type.value, event.request_id, event.vehicle_id, event.request_service_id)
+        self.position += 1
+        self.number_of_events += 1
+        if self.position == self.block_size:
+            self.seal_block()
+        elif self.is_streaming() and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def seal_block(self):
+        if self.is_streaming():
+            self.flush()
+        else:
+            self.blocks.append(self.block[:self.position])
+        self.block = np.empty(self.block_size, dtype=EVENT_RECORD_DTYPE)
+        self.position = 0
+        self.flushed_position = 0
+
+    def flush(self):
+        """
+        Write the records of the current block that were not written yet to the stream.
+        """
+        records = self.block[self.flushed_position:self.position]
+        if self.binary_file is not None:
+            records.tofile(self.binary_file)
+            self.binary_file.flush()
+        else:
+            for record in records_to_dicts(records):
+                self.stream.write(record)
+            self.stream.flush()
+        self.flushed_position = self.position
+        self.last_flush = time.monotonic()
+
+    def __len__(self) -> int:
+        return self.number_of_events
+
+    def records(self) -> np.ndarray:
+        """
+        Returns all the records as a single structured array. When the events are streamed to the binary log, the
+        records already written are read back from it.
+        Raises:
+            ValueError: if the events are streamed to the compressed log.
+        """
+        if self.stream is not None:
+            raise ValueError("The events are streamed to a compressed log, which keeps only their timestamp and type, "
+                             "and cannot be read back")
+        if self.binary_path is not None:
+            return np.concatenate([read_event_log(self.binary_path), self.block[self.flushed_position:self.position]])
+        return np.concatenate(self.blocks + [self.block[:self.position]])
+
+    @property
+    def event_list(self) -> List[Event]:
+        return [
+            Event(timestamp, Event_Type(type_value), request_id=request_id, vehicle_id=vehicle_id, request_service_id=request_service_id)
+            for timestamp, type_value, request_id, vehicle_id, request_service_id in self.records().tolist()
+        ]
+
+    def export_csv(self, path: str):
+        records = self.records()
+        with open(path, "w") as file:
+            file.write(",".join(EVENT_RECORD_DTYPE.names) + "\n")
+            for timestamp, type_value, request_id, vehicle_id, request_service_id in records.tolist():
+                file.write(f"{timestamp},{Event_Type(type_value).name},{request_id},{vehicle_id},{request_service_id}\n")
+
+    def dump_binary(self, path: str = EVENT_BINARY_FILE_PATH):
+        self.records().tofile(path)
 
     def log_events(self):
         """
-        Log an event to the JSON file.
-        
-        Args:
-            event (Event): Event to log. Contains timestamp, event type, and vehicle id. 
+        Log the events to the JSON file.
+        If the events are streamed, the stream is flushed and closed instead.
         """
+        if self.is_streaming():
+            self.flush()
+            if self.stream is not None:
+                self.stream.close()
+            else:
+                self.binary_file.close()
+            return
 
-        event_log_json = json.dumps([event.to_dict() for event in self.event_list], indent=4)
+        event_log_json = json.dumps(records_to_dicts(self.records()), indent=4)
 
         with open(EVENTS_FILE_PATH, "w") as file:
             file.write(event_log_json)
 
+def records_to_dicts(records: np.ndarray) -> List[Dict]:
+    return [
+        {"timestamp": timestamp, "type": Event_Type(type_value).name}
+        for timestamp, type_value in zip(records["timestamp"].tolist(), records["type"].tolist())
+    ]
+
+def read_event_log(path: str = EVENT_BINARY_FILE_PATH) -> np.ndarray:
+    """
+    Memory-map a binary event log (EVENT_RECORD_DTYPE records). Only the complete records are mapped,
+    so the log can be read while it is being written.
+    """
+    number_of_records = os.path.getsize(path) // EVENT_RECORD_DTYPE.itemsize
+    if number_of_records == 0:
+        return np.empty(0, dtype=EVENT_RECORD_DTYPE)
+    return np.memmap(path, dtype=EVENT_RECORD_DTYPE, mode="r", shape=(number_of_records,))
+
+def open_log_streams(event_logger: EventLogger, state_logger: EnvironmentStateLogger,
+                     compress: bool = False, flush_interval: float = FLUSH_INTERVAL):
+    """
+    Stream the events (binary records, or gzip-compressed newline-delimited JSON) and the environment states
+    (newline-delimited JSON) to the logs folder while the simulation runs, instead of keeping them in memory
+    until the end of the run.
+    """
+    event_logger.open_stream(compress, flush_interval)
+    state_logger.open_streams(compress, flush_interval)
+
 # class CalculationsLogger:
 
 
@@ -0,0 +1,156 @@
+import numpy as np
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, Type
+
+APPEND_MIN_CAPACITY = 64 # rows allocated by the first append to a full store, see ColumnStore.append
+
+
+class ColumnStore:
+    """
+    Struct-of-arrays storage for entities of one kind (requests, vehicles, services).
+    Every attribute of the entities is a typed numpy column of length size, so that queries and KPIs can be computed
+    with array operations. Attributes holding Python objects (lists, dicts, queues) are kept in object columns.
+
+    Subclasses define:
+        - columns: a dictionary mapping from column name to numpy dtype
+        - defaults: the initial value of the columns that are not zero (object columns are initialised with None)
+        - view(index): returns the entity object (a thin view) for a row
+
+    Rows can be added one at a time with append: the columns are then the first size rows of larger buffers, whose
+    capacity doubles when they are full.
+    """
+    columns: Dict[str, Any] = {}
+    defaults: Dict[str, Any] = {}
+
+    def __init__(self, size: int = 0):
+        self.size = size
+        self._capacity = size
+        self._buffers: Dict[str, np.ndarray] = {}
+        for name in self.columns:
+            self._buffers[name] = self._new_column(name, size)
+            setattr(self, name, self._buffers[name])
+
+    def _new_column(self, name: str, length: int) -> np.ndarray:
+        dtype = self.columns[name]
+        if dtype is object:
+            return np.empty(length, dtype=object)
+        return np.full(length, self.defaults.get(name, 0), dtype=dtype)
+
+    def append(self) -> int:
+        """
+        Add a row with the default values at the end of the store, appending n rows copies O(n) values in total.
+        Returns:
+            the index of the new row.
+        """
+        index = self.size
+        if index == self._capacity:
+            self._capacity = max(2 * self._capacity, APPEND_MIN_CAPACITY)
+            for name in self.columns:
+                buffer = self._new_column(name, self._capacity)
+                buffer[:index] = getattr(self, name)
+                self._buffers[name] = buffer
+        self.size += 1
+        for name in self.columns:
+            setattr(self, name, self._buffers[name][:self.size])
+        return index
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index: int) -> 'EntityView':
+        index = int(index)
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError(f"{type(self).__name__} index {index} out of range")
+        return self.view(index)
+
+    def __iter__(self) -> Iterator['EntityView']:
+        for index in range(self.size):
+            yield self.view(index)
+
+    def nbytes(self) -> int:
+        """
+        Memory used by the numeric columns (object columns only count their pointers).
+        """
+        return sum(getattr(self, name).nbytes for name in self.columns)
+
+
+class EntityView:
+    """
+    A thin view of one row of a ColumnStore. It holds no data of its own, reading and writing an attribute
+    reads and writes the corresponding column of the store.
+    Views have identity semantics: two views are equal (and hash alike) if they are views of the same row of the same
+    store, not if the values of their attributes are equal. Two entities built with the same values are different.
+    """
+    __slots__ = ("_store", "_index")
+    fields: Tuple[str, ...] = ()
+
+    def _bind(self, store: ColumnStore, index: int):
+        self._store = store
+        self._index = index
+
+    def _bind_new_row(self, store: Optional[ColumnStore], store_class: Type[ColumnStore]):
+        """
+        Bind an entity built on its own to a new row: appended to the given store, or else the single row of a store
+        of its own, which is freed with the entity.
+        """
+        if store is None:
+            self._bind(store_class(1), 0)
+        else:
+            self._bind(store, store.append())
+
+    @classmethod
+    def _view(cls, store: ColumnStore, index: int) -> 'EntityView':
+        view = cls.__new__(cls)
+        view._bind(store, index)
+        return view
+
+    @property
+    def index(self) -> int:
+        """
+        Position of the entity in its store.
+        """
+        return self._index
+
+    def __eq__(self, other):
+        if not isinstance(other, EntityView):
+            return NotImplemented
+        return self._store is other._store and self._index == other._index
+
+    def __hash__(self):
+        return hash((id(self._store), self._index))
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.fields)
+        return f"{type(self).__name__}({values})"
+
+
+def column_property(name: str) -> property:
+    """
+    Attribute backed by a numeric column, returned as a native Python value (numpy scalars are not JSON serializable).
+    """
+    def getter(self):
+        return getattr(self._store, name)[self._index].item()
+
+    def setter(self, value):
+        getattr(self._store, name)[self._index] = value
+
+    return property(getter, setter)
+
+
+def object_column_property(name: str, factory: Callable[[], Any] = None) -> property:
+    """
+    Attribute backed by an object column. If a factory is given, the object is created on first access,
+    so that entities that never use it do not pay for it.
+    """
+    def getter(self):
+        column = getattr(self._store, name)
+        value = column[self._index]
+        if value is None and factory is not None:
+            value = column[self._index] = factory()
+        return value
+
+    def setter(self, value):
+        getattr(self._store, name)[self._index] = value
+
+    return property(getter, setter)
@@ -1,16 +1,26 @@
-import queue
+import math
+import time
 import numpy as np
 import pandas as pd
 
 from enum import Enum
-from dataclasses import dataclass
-from typing import Tuple, List, Dict
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Tuple, List, Dict, Optional
 
 from agents import Shipper, LSP, Carrier
 from data_logger import EventLogger, EnvironmentStateLogger, StatisticsTracker
 
-from common import Request, Event, Event_Type, Agent_Type
-from vehicles import Service, Truck, Train, Barge, Vehicle, VehicleStatus
+from common import Request, RequestStore, RequestStatus, Event, Event_Type, Agent_Type
+from vehicles import Service, ServiceStore, Truck, Train, Barge, Vehicle, VehicleStore, VehicleStatus, VEHICLE_TYPES, sample_truck_speeds
+from random_streams import RandomStreams
+from instrumentation import Instrumentation
+from tracing import Tracer, TRACE, DEBUG, INFO, WARNING
+from service_index import ServiceIndex
+from solvers import (DecisionSolver, ShipperDecisionSolver, RequestPlan, check_plans, decode_plan, make_decision_executor,
+                     request_record, reserved_capacities, solve_in_worker)
+from scheduler import EventScheduler, HeapEventQueue, make_event_queue
 
 # ---------------------------------------------------------
 
@@ -21,18 +31,22 @@ num_carriers = 4
 
 LOAD_TIME = 1
 
+# Time advance modes of the environment
+FIXED_STEP = "fixed"                # every call to step advances the time by step_size
+NEXT_EVENT = "next_event"           # steps without events are skipped, the time jumps to the step of the next event
+
 # ---------------------------------------------------------
 
-class EventQueue(queue.PriorityQueue):
-    def peek(self):
-        if self.empty():
-            return None
-        return self.queue[0]
-    
-    def print_all_events(self):
-        print("Events in the queue:")
-        for event in self.queue:
-            print(event)
+# The default scheduler. See scheduler.py for the available backends.
+EventQueue = HeapEventQueue
+
+def decision_workers_error(error: BrokenProcessPool) -> RuntimeError:
+    """
+    The error raised when the decision worker processes could not start or died: the plans of the worker processes
+    would never come back, so the run stops instead of falling back on every request.
+    """
+    return RuntimeError("The decision worker processes could not start or died. They are spawned, so the script that "
+                        "runs the simulation must start it under an 'if __name__ == \"__main__\":' guard")
 
 # ---------------------------------------------------------
 
@@ -41,65 +55,166 @@ class Environment:
     """
     An environment is constructed by:
         - a counter that keeps track of the current time
-        - a list of the requests in the environment
+        - a columnar store of the requests in the environment (see entity_store.py), indexed by request ID
         - a dictionary of agents in the environment (key: type of the agent, value: list of the agents of this type)
         - a dictionary mapping from vehicle type/name to a 2D numpy array storing the number of vehicles of that type,
                 where entry (i,j) is the number of vehicles of that type going from node index i to index j. 
                 Entry (i,i) is the number of vehicles of that type sitting at node index i. 
-        - a priority queue that stores the events happening in the environment - the priority is the timestamp of the event.
-        That means that the earlier the event is happening, the higher the priority.
+        - a scheduler that stores the events happening in the environment - events are ordered by timestamp, then by priority,
+        then by the order in which they were scheduled. That means that the earlier the event is happening, the higher the priority.
     """
 
     time: int = 0
-    requests: List[Request] = None
+    requests: RequestStore = None
     agents: Dict[Agent_Type, List] = None
-    vehicles: List[Vehicle] = None
+    vehicles: VehicleStore = None
     vehicle_matrices: Dict[str, np.ndarray] = None
-    events: EventQueue = None
-    present_services: List[Service] = None
-    statistics_tracker: StatisticsTracker = StatisticsTracker()
-    event_logger: EventLogger = EventLogger()
-    state_logger: EnvironmentStateLogger = EnvironmentStateLogger()
+    events: EventScheduler = None
+    present_services: ServiceStore = None
+    # Index of the present services by origin, destination and departure time for the decision making
+    service_index: ServiceIndex = None
+    # Every environment has its own trackers and loggers, so that several environments can run in the same process
+    statistics_tracker: StatisticsTracker = field(default_factory=StatisticsTracker)
+    event_logger: EventLogger = field(default_factory=EventLogger)
+    state_logger: EnvironmentStateLogger = field(default_factory=EnvironmentStateLogger)
     step_size: int = 0
+    advance_mode: str = FIXED_STEP
+    load_statistics: Dict[str, Dict[str, float]] = None
+    # (i, j, vehicle type, delta) changes of the vehicle matrices that were not consumed by take_matrix_changes yet
+    matrix_changes: List[Tuple[int, int, str, int]] = field(default_factory=list)
+    # Random number generators of the run (see random_streams.py)
+    random_streams: RandomStreams = field(default_factory=RandomStreams.from_seed)
+    # Mean of the exponentially distributed delay added to the arrival of the services generated for requests (0: no delays)
+    arrival_delay_mean: float = 0.0
+    # Timing of the event handlers and hot sections (see instrumentation.py), None to run without instrumentation
+    instrumentation: Instrumentation = None
+    # Tracing of the event loop (see tracing.py), by default only the INFO records kept in memory
+    tracer: Tracer = field(default_factory=Tracer)
+    # Decision making of the arrived requests (see solvers.py). The requests are decided in batches of at most
+    # decision_batch_size requests that arrived in the same time step (1: every request is decided when it arrives,
+    # 0: all the requests of a time step are decided together)
+    solver: DecisionSolver = field(default_factory=ShipperDecisionSolver)
+    decision_batch_size: int = 1
+    # IDs of the arrived requests that were not handed to the solver yet
+    pending_decisions: List[int] = field(default_factory=list)
+    # Number of worker processes running the solves (see solvers.make_decision_executor), 0 to solve in the event
+    # loop. With workers the event loop goes on while a batch is solved, and the plans are applied at their
+    # DECISION_DEADLINE event, decision_deadline time units after the batch was submitted. A request gets the fallback
+    # plan of the solver instead if its solve has not returned by then, if the solve failed, or if a vehicle of its
+    # plan should already have left (see plan_is_late). By default the deadline does not wait for a solve that is still
+    # running; decision_wait gives it that many wall-clock seconds to return (None: as long as it takes).
+    # The executor is created when the first batch is submitted (unless one is given), and shut down when the
+    # simulation ends.
+    decision_processes: int = 0
+    decision_executor: Executor = None
+    decision_deadline: float = 0.0
+    decision_wait: Optional[float] = 0.0
+    # Submitted solves by request ID: (future, position of the request in the batch, wall-clock submission time)
+    pending_solves: Dict[int, Tuple[Future, int, float]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.event_handlers = {
+            Event_Type.REQUEST_ARRIVED: self.request_arrived_event,
+            Event_Type.REQUEST_COMPLETED: self.request_completed_event,
+            Event_Type.TRUCK_DEPARTED: self.vehicle_departed_event,
+            Event_Type.TRAIN_DEPARTED: self.vehicle_departed_event,
+            Event_Type.BARGE_DEPARTED: self.vehicle_departed_event,
+            Event_Type.TRUCK_ARRIVED: self.vehicle_arrived_event,
+            Event_Type.TRAIN_ARRIVED: self.vehicle_arrived_event,
+            Event_Type.BARGE_ARRIVED: self.vehicle_arrived_event,
+            Event_Type.TRAIN_LOADING: self.load_vehicle_event,
+            Event_Type.BARGE_LOADING: self.load_vehicle_event,
+            Event_Type.DECISION_DEADLINE: self.decision_deadline_event
+        }
+        if self.instrumentation is not None:
+            self.instrumentation.attach(self)
 
     def step(self):
-        self.events.print_all_events()
+        tracer = self.tracer
+        if tracer.trace:
+            tracer.emit(TRACE, "Events in the queue: {events}", self.time,
+                        events=sorted(self.events, key=lambda event: (event.timestamp, event.priority)))
         if(not self.events.empty()):
+            if self.advance_mode == NEXT_EVENT:
+                self.skip_to_next_event()
             self.time += self.step_size
-            print(f"Time: {self.time}")
+            if tracer.debug:
+                tracer.emit(DEBUG, "Time: {time}", self.time)
             while(True):
+                if self.pending_decisions and (self.events.empty() or self.time < self.events.peek().timestamp):
+                    # The plans of the batch may schedule events in this step, so the step goes on after them
+                    try:
+                        self.decide_pending_requests()
+                    except Exception as error:
+                        tracer.dump_on_error(error, self.time)
+                        raise
+                    continue
                 if (self.events.empty()):
+                    if self.decision_executor is not None:
+                        self.decision_executor.shutdown(wait=False, cancel_futures=True)
                     self.statistics_tracker.calculate_modal_share()
-                    print("No more events to process")
+                    if tracer.info:
+                        tracer.emit(INFO, "No more events to process", self.time)
                     return None
                 top_event : Event = self.events.peek()
                 if(self.time >= top_event.timestamp):
                     event = self.events.get()
                     self.event_logger.save_event(event)
-                    self.process_event(event)
+                    try:
+                        self.process_event(event)
+                    except Exception as error:
+                        tracer.dump_on_error(error, self.time)
+                        raise
                 else:
                     self.state_logger.save_state(self.time, self.vehicle_matrices, self.vehicles)
                     break
         else:
-            print("No more events to process")
+            if tracer.info:
+                tracer.emit(INFO, "No more events to process", self.time)
             return None
         return self.vehicle_matrices
+
+    def sample_arrival_delay(self) -> float:
+        if self.arrival_delay_mean <= 0:
+            return 0.0
+        return float(self.random_streams.delays.exponential(self.arrival_delay_mean))
+
+    def update_matrix(self, name: str, i: int, j: int, delta: int):
+        self.state_logger.mark_changed(name, i, j, self.vehicle_matrices[name][i][j].item())
+        self.vehicle_matrices[name][i][j] += delta
+        self.matrix_changes.append((i, j, name, delta))
+
+    def take_matrix_changes(self) -> List[Tuple[int, int, str, int]]:
+        """
+        Returns the changes of the vehicle matrices since the last call, so that the network can be updated incrementally.
+        """
+        changes = self.matrix_changes
+        self.matrix_changes = []
+        return changes
+
+    def skip_to_next_event(self):
+        """
+        Move the time to the step right before the step in which the next event is processed.
+        The state does not change in the skipped steps, so they are only marked as unchanged in the state logger,
+        and the frames of those steps are filled in lazily when the states are read or logged.
+        """
+        next_timestamp = self.events.peek().timestamp
+        steps_to_event = math.ceil((next_timestamp - self.time) / self.step_size)
+        if steps_to_event <= 1:
+            return
+
+        last_skipped_step = self.time + (steps_to_event - 1) * self.step_size
+        if not self.state_logger.has_state(self.time):
+            # Nothing was recorded yet at the current time (initial state)
+            self.state_logger.save_state(self.time, self.vehicle_matrices, self.vehicles)
+        self.state_logger.mark_unchanged(self.time + self.step_size, last_skipped_step, self.step_size, since=self.time)
+        if self.tracer.debug:
+            self.tracer.emit(DEBUG, "Skipped from time {time} to time {last_skipped_step}", self.time,
+                             last_skipped_step=last_skipped_step)
+        self.time = last_skipped_step
     
     def process_event(self, event: Event):
-        event_handlers = {
-            Event_Type.REQUEST_ARRIVED: self.request_arrived_event,
-            Event_Type.REQUEST_COMPLETED: self.request_completed_event,
-            Event_Type.TRUCK_DEPARTED: self.vehicle_departed_event,
-            Event_Type.TRAIN_DEPARTED: self.vehicle_departed_event,
-            Event_Type.BARGE_DEPARTED: self.vehicle_departed_event,
-            Event_Type.TRUCK_ARRIVED: self.vehicle_arrived_event,
-            Event_Type.TRAIN_ARRIVED: self.vehicle_arrived_event,
-            Event_Type.BARGE_ARRIVED: self.vehicle_arrived_event,
-            Event_Type.TRAIN_LOADING: self.load_vehicle_event,
-            Event_Type.BARGE_LOADING: self.load_vehicle_event
-        }
-        
-        handler = event_handlers.get(event.type)
+        handler = self.event_handlers.get(event.type)
         if handler:
             handler(event)
         else:
@@ -114,31 +229,143 @@ class Environment:
         if total > 0:
             vehicle.status = VehicleStatus.LOADING
             vehicle.number_of_containers = total
+            self.vehicles.mark_dirty(vehicle_id)
         
-        print(f"Vehicle {vehicle_id} loading at {vehicle.current_location[0]} for requests {', '.join(str(x[0]) for x in service.requests)} at time {self.time}")
+        if self.tracer.info:
+            self.tracer.emit(INFO, "Vehicle {vehicle_id} loading at {location} for requests {request_ids} at time {time}",
+                             self.time, vehicle_id=vehicle_id, location=vehicle.current_location[0],
+                             request_ids=[x[0] for x in service.requests])
 
             
             
 
 
     def request_arrived_event(self, event: Event):
-        request_id = event.request_id
-        request : Request = self.requests[request_id]
-
-        shipper_id = request.selected_shipper
-        shipper : Shipper = self.agents[Agent_Type.SHIPPER][shipper_id]
+        self.pending_decisions.append(event.request_id)
+        if 0 < self.decision_batch_size <= len(self.pending_decisions):
+            self.decide_pending_requests()
+
+    def decide_pending_requests(self):
+        """
+        Hand the pending requests to the solver, one call per shipper, and apply the plans.
+        """
+        request_ids = self.pending_decisions
+        self.pending_decisions = []
+        requests_by_shipper: Dict[int, List[Request]] = {}
+        for request_id in request_ids:
+            request: Request = self.requests[request_id]
+            requests_by_shipper.setdefault(request.selected_shipper, []).append(request)
 
-        # RUN THE DECISION MAKING ALGORITHM TO DECIDE WHICH VEHICLES WILL EXECUTE THIS REQUEST
+        # RUN THE DECISION MAKING ALGORITHM TO DECIDE WHICH VEHICLES WILL EXECUTE THESE REQUESTS
         #############################################
 
         # Assumption: the decision-making algorithm guarantees that all dependency constraints are satisfied.
         # For example, if two services must complete before a third can start, the third service's start time 
         # will be after the later of the two finish times.
 
-        request_services: List[List[bool, Service]] = shipper.decision_making(request, present_services=self.present_services)
+        for shipper_id, requests in requests_by_shipper.items():
+            shipper: Shipper = self.agents[Agent_Type.SHIPPER][shipper_id]
+            if self.decision_processes > 0 or self.decision_executor is not None:
+                self.submit_decisions(shipper, requests)
+                continue
+            start = time.perf_counter()
+            plans = self.solver.solve(shipper, requests, self.present_services, self.service_index)
+            seconds = time.perf_counter() - start
+            check_plans(plans, requests)
+            for request, plan in zip(requests, plans):
+                self.statistics_tracker.add_decision(seconds / len(requests))
+                self.apply_request_plan(request, plan)
+
+        #############################################
+
+    def submit_decisions(self, shipper: Shipper, requests: List[Request]):
+        """
+        Submit the solve of a batch to the decision executor, and schedule the decision deadline of its requests.
+        Raises:
+            RuntimeError: if the worker processes could not start or died.
+        """
+        if self.decision_executor is None:
+            self.decision_executor = make_decision_executor(self.decision_processes, self.solver,
+                                                            self.agents[Agent_Type.SHIPPER], self.present_services,
+                                                            self.service_index)
+        try:
+            future = self.decision_executor.submit(solve_in_worker, shipper.id,
+                                                   [request_record(request) for request in requests],
+                                                   reserved_capacities(self.service_index))
+        except BrokenProcessPool as error:
+            raise decision_workers_error(error) from error
+        except Exception as error:
+            # The batch could not be submitted: its requests get the fallback plan at their deadline
+            future = Future()
+            future.set_exception(error)
+        submitted = time.perf_counter()
+        for position, request in enumerate(requests):
+            self.pending_solves[request.id] = (future, position, submitted)
+            self.events.put(Event(self.time + self.decision_deadline, Event_Type.DECISION_DEADLINE, request_id=request.id))
+        if self.tracer.debug:
+            self.tracer.emit(DEBUG, "Decision of requests {request_ids} submitted, due at time {deadline}", self.time,
+                             request_ids=[request.id for request in requests], deadline=self.time + self.decision_deadline)
+
+    def decision_deadline_event(self, event: Event):
+        request_id = event.request_id
+        request: Request = self.requests[request_id]
+        future, position, submitted = self.pending_solves.pop(request_id)
+        plan = None
+        try:
+            encoded_plans, seconds = future.result(timeout=self.decision_wait)
+        except TimeoutError:
+            reason = "missed its deadline"
+        except BrokenProcessPool as error:
+            raise decision_workers_error(error) from error
+        except Exception as error:
+            # The solver raised, or the batch or its plans could not be pickled
+            reason = f"failed with {error!r}"
+        else:
+            plan = decode_plan(encoded_plans[position], self.present_services)
+            reason = "came back after a vehicle of its plan should have left" if self.plan_is_late(plan) else None
+
+        if reason is None:
+            self.statistics_tracker.add_decision(seconds / len(encoded_plans))
+        else:
+            if not any(pending[0] is future for pending in self.pending_solves.values()):
+                future.cancel()
+            shipper: Shipper = self.agents[Agent_Type.SHIPPER][request.selected_shipper]
+            plan = self.solver.fallback(shipper, request, self.present_services, self.service_index)
+            if self.plan_is_late(plan):
+                plan = None
+            self.statistics_tracker.add_decision(time.perf_counter() - submitted, fallback=True)
+            if self.tracer.warning:
+                self.tracer.emit(WARNING, "The decision of request {request_id} {reason}, the fallback plan is used",
+                                 self.time, request_id=request_id, reason=reason)
+        self.apply_request_plan(request, plan)
+
+    def plan_is_late(self, plan: RequestPlan) -> bool:
+        """
+        Whether a plan applied now would miss one of its vehicles: a generated service whose departure (LOAD_TIME after
+        its departure time) is past, or a present service that has already loaded (LOAD_TIME before its departure).
+        """
+        if plan is None:
+            return False
+        for request_service in plan:
+            for is_service_generated, _, _, service in request_service:
+                if is_service_generated:
+                    if service.departure_time + LOAD_TIME < self.time:
+                        return True
+                elif service.departure_time - LOAD_TIME <= self.time:
+                    return True
+        return False
+
+    def apply_request_plan(self, request: Request, request_services: RequestPlan):
+        request_id = request.id
+        if request_services is None:
+            # The decision making algorithm has no plan for this request, it stays pending
+            if self.tracer.info:
+                self.tracer.emit(INFO, "Request {request_id} arrived: {origin} -> {destination}, no services were assigned",
+                                 self.time, request_id=request_id, origin=request.origin, destination=request.destination)
+            return
         request.services = [len(inner_list) for inner_list in request_services]
+        request.status = RequestStatus.ASSIGNED
         
-        #############################################
         for rs_index in range(len(request_services)):
             request_service: List[bool, bool, int, Service] = request_services[rs_index]
             for is_service_generated, is_container_spawned, amount, service in request_service:
@@ -150,7 +377,8 @@ class Environment:
                     vehicle: Vehicle = self.vehicles[vehicle_id]
                     vehicle.status = VehicleStatus.LOADING
                     vehicle.services.put(service)
-                    service.requests.append([request_id, number_of_containers])
+                    self.vehicles.mark_dirty(vehicle_id)
+                    service.requests.append([request_id, number_of_containers, rs_index])
                     if is_container_spawned:
                         self.spawn_containers(vehicle, request_id, number_of_containers)
                     else:
@@ -159,24 +387,32 @@ class Environment:
                         vehicle.number_of_containers = number_of_containers
                     
                     new_event_departure = Event(service.departure_time + LOAD_TIME, choose_departed_event(vehicle), request_id=request_id, vehicle_id=vehicle_id, request_service_id=rs_index)
-                    new_event_arrival = Event(service.arrival_time, choose_arrived_event(vehicle), request_id=request_id, vehicle_id=vehicle_id, request_service_id=rs_index)
+                    # Assumption: the plan leaves enough slack for the delay before the next service of the vehicle
+                    new_event_arrival = Event(service.arrival_time + self.sample_arrival_delay(), choose_arrived_event(vehicle), request_id=request_id, vehicle_id=vehicle_id, request_service_id=rs_index)
                     self.events.put(new_event_departure)
                     self.events.put(new_event_arrival)
                 else:
-                    service.requests.append([request_id, number_of_containers])
-
+                    service.requests.append([request_id, number_of_containers, rs_index])
+                    if self.service_index is not None:
+                        self.service_index.reserve(service, number_of_containers)
 
-            
-        print(f"Request {request_id} arrived: {request.origin} -> {request.destination}")
+        if self.tracer.info:
+            self.tracer.emit(INFO, "Request {request_id} arrived: {origin} -> {destination}", self.time,
+                             request_id=request_id, origin=request.origin, destination=request.destination)
 
     def request_completed_event(self, event: Event):
         request_id = event.request_id
+        request: Request = self.requests[request_id]
+        request.status = RequestStatus.COMPLETED
+        self.statistics_tracker.add_lateness(max(0.0, self.time - request.time_window[1]))
 
         # Last vehicle to arrive for the request
         vehicle_id = event.vehicle_id
         vehicle = self.vehicles[vehicle_id]
         vehicle.status = VehicleStatus.IDLE
-        print(f"Request {request_id} completed at time {self.time}")  
+        self.vehicles.mark_dirty(vehicle_id)
+        if self.tracer.info:
+            self.tracer.emit(INFO, "Request {request_id} completed at time {time}", self.time, request_id=request_id)
         
 
     def vehicle_departed_event(self, event: Event):
@@ -188,15 +424,19 @@ class Environment:
         service_destination = current_service.destination
 
         # Update location
-        self.vehicle_matrices[vehicle.name][service_origin][service_origin] -= 1
-        self.vehicle_matrices[vehicle.name][service_origin][service_destination] += 1
-        self.vehicle_matrices["Container"][service_origin][service_origin] -= vehicle.number_of_containers
-        self.vehicle_matrices["Container"][service_origin][service_destination] += vehicle.number_of_containers
+        self.update_matrix(vehicle.name, service_origin, service_origin, -1)
+        self.update_matrix(vehicle.name, service_origin, service_destination, 1)
+        self.update_matrix("Container", service_origin, service_origin, -vehicle.number_of_containers)
+        self.update_matrix("Container", service_origin, service_destination, vehicle.number_of_containers)
         vehicle.current_location = [service_origin, service_destination]
         
         # Update status
         vehicle.status = VehicleStatus.EN_ROUTE
-        print(f"Vehicle {vehicle_id} departed from {service_origin} for requests {', '.join(str(x[0]) for x in current_service.requests)} at time {self.time}")
+        self.vehicles.mark_dirty(vehicle_id)
+        if self.tracer.info:
+            self.tracer.emit(INFO, "Vehicle {vehicle_id} departed from {origin} for requests {request_ids} at time {time}",
+                             self.time, vehicle_id=vehicle_id, origin=service_origin,
+                             request_ids=[x[0] for x in current_service.requests])
 
     def vehicle_arrived_event(self, event: Event):
         request_id = event.request_id
@@ -209,20 +449,21 @@ class Environment:
         service_destination = current_service.destination
 
         # Update location
-        self.vehicle_matrices[vehicle.name][service_origin][service_destination] -= 1
-        self.vehicle_matrices[vehicle.name][service_destination][service_destination] += 1
-        self.vehicle_matrices["Container"][service_origin][service_destination] -= vehicle.number_of_containers
-        self.vehicle_matrices["Container"][service_destination][service_destination] += vehicle.number_of_containers
+        self.update_matrix(vehicle.name, service_origin, service_destination, -1)
+        self.update_matrix(vehicle.name, service_destination, service_destination, 1)
+        self.update_matrix("Container", service_origin, service_destination, -vehicle.number_of_containers)
+        self.update_matrix("Container", service_destination, service_destination, vehicle.number_of_containers)
         vehicle.current_location = [service_destination, service_destination]
 
         vehicle.status = VehicleStatus.UNLOADING
+        self.vehicles.mark_dirty(vehicle_id)
         self.statistics_tracker.add_distance(vehicle.name, current_service.remaining_distance)
         vehicle.services.get()
 
-        for request in current_service.requests:
-            request_id = request[0]
+        for request_id, _, rs_index in current_service.requests:
             request: Request = self.requests[request_id]
-            request.services[request_id] -= 1
+            # One service less to complete in the request service the vehicle service belongs to
+            request.services[rs_index] -= 1
             if request.is_request_fulfilled():
                 new_event = Event(self.time + LOAD_TIME, Event_Type.REQUEST_COMPLETED, request_id=request_id, vehicle_id=vehicle_id)
                 self.events.put(new_event)
@@ -231,12 +472,16 @@ class Environment:
 
 
         
-        print(f"Vehicle {vehicle_id} arrived at {service_destination} for requests {', '.join(str(x[0]) for x in current_service.requests)} at time {self.time}")
+        if self.tracer.info:
+            self.tracer.emit(INFO, "Vehicle {vehicle_id} arrived at {destination} for requests {request_ids} at time {time}",
+                             self.time, vehicle_id=vehicle_id, destination=service_destination,
+                             request_ids=[x[0] for x in current_service.requests])
         
     def spawn_containers(self, vehicle: Vehicle, request_id: int, number_of_containers: int):
         # Algorithm ensures that the vehicle has enough capacity for the amount
         vehicle.load_vehicle(request_id, number_of_containers)
-        self.vehicle_matrices["Container"][vehicle.current_location[0]][vehicle.current_location[1]] += number_of_containers 
+        self.vehicles.mark_dirty(vehicle.index)
+        self.update_matrix("Container", vehicle.current_location[0], vehicle.current_location[1], number_of_containers)
 
 # ---------------------------------------------------------
 
@@ -270,70 +515,105 @@ def choose_departed_event(vehicle: Vehicle):
     else:
         raise ValueError("Unknown vehicle type")
 
-def generate_vehicles(vehicles_df: pd.DataFrame, vehicle_matrices: Dict[str, np.ndarray], vehicle_list_: List[Vehicle]):
-    vehicles_size = len(vehicles_df)
-
-    for i in range(vehicles_size):
-
-        vehicle_id = int(vehicles_df.iloc[i]['id'])
-        name = vehicles_df.iloc[i]['name']
-        initial_location = (int(vehicles_df.iloc[i]['initial_location']), int(vehicles_df.iloc[i]['initial_location']))
-        max_containers = int(vehicles_df.iloc[i]['max_containers'])
-        unit_cost = float(vehicles_df.iloc[i]['unit_cost'])
-        emission_factor = float(vehicles_df.iloc[i]['emission_factor'])
-        carrier_id = int(vehicles_df.iloc[i]['carrier_id'])
-
-        if name == "Truck":
-            vehicle = Truck(vehicle_id, name, current_location=initial_location, max_containers=max_containers, 
-                            unit_cost=unit_cost, emission_factor=emission_factor, carrier_id=carrier_id)
-        if name == "Train":
-            vehicle = Train(vehicle_id, name, current_location=initial_location, max_containers=max_containers, 
-                            unit_cost=unit_cost, emission_factor=emission_factor, carrier_id=carrier_id)
-        if name == "Barge":
-            vehicle = Barge(vehicle_id, name, current_location=initial_location, max_containers=max_containers, 
-                            unit_cost=unit_cost, emission_factor=emission_factor, carrier_id=carrier_id)
-        
-        vehicle_list_[i] = vehicle
-        vehicle_matrices[name][initial_location[0]][initial_location[1]] += 1
+def check_column(valid: np.ndarray, message: str):
+    """
+    Raise a ValueError listing the offending rows if any entry of the boolean mask is False.
+    """
+    if not valid.all():
+        rows = np.flatnonzero(~valid)
+        raise ValueError(f"{message} (rows {rows[:10].tolist()}{', ...' if len(rows) > 10 else ''})")
+
+def generate_vehicles(vehicles_df: pd.DataFrame, vehicle_matrices: Dict[str, np.ndarray], vehicle_list_: VehicleStore,
+                      rng: np.random.Generator):
+    number_of_nodes = len(next(iter(vehicle_matrices.values())))
+
+    # Each column is extracted once as a numpy array
+    vehicle_ids = vehicles_df['id'].to_numpy(dtype=int)
+    names = vehicles_df['name'].to_numpy(dtype=str)
+    initial_locations = vehicles_df['initial_location'].to_numpy(dtype=int)
+    max_containers = vehicles_df['max_containers'].to_numpy(dtype=int)
+    unit_costs = vehicles_df['unit_cost'].to_numpy(dtype=float)
+    emission_factors = vehicles_df['emission_factor'].to_numpy(dtype=float)
+    carrier_ids = vehicles_df['carrier_id'].to_numpy(dtype=int)
+
+    check_column(np.isin(names, VEHICLE_TYPES), "Unknown vehicle type")
+    check_column((initial_locations >= 0) & (initial_locations < number_of_nodes), "Vehicle initial location out of range")
+    check_column(max_containers >= 0, "Negative vehicle capacity")
+    check_column(carrier_ids >= 0, "Negative carrier id")
+    if not np.array_equal(vehicle_ids, np.arange(len(vehicle_ids))):
+        # Services and events refer to vehicles by their position in the file
+        print("Warning: vehicle ids do not match their row positions, the row positions are used as references")
+
+    vehicle_list_.vehicle_id[:] = vehicle_ids
+    for type_code, name in enumerate(VEHICLE_TYPES):
+        vehicle_list_.type[names == name] = type_code
+    vehicle_list_.location_origin[:] = initial_locations
+    vehicle_list_.location_destination[:] = initial_locations
+    vehicle_list_.max_containers[:] = max_containers
+    vehicle_list_.unit_cost[:] = unit_costs
+    vehicle_list_.emission_factor[:] = emission_factors
+    vehicle_list_.carrier_id[:] = carrier_ids
+    trucks = names == "Truck"
+    vehicle_list_.speed[trucks] = sample_truck_speeds(rng, int(trucks.sum()))
+
+    for name in vehicle_matrices:
+        located = initial_locations[names == name]
+        np.add.at(vehicle_matrices[name], (located, located), 1)
         
     print("Vehicles generated successfully")
 
 def generate_services_and_events(services_df: pd.DataFrame, dist_matrix: np.ndarray, 
-                                 vehicles: List[Vehicle], event_queue: EventQueue, present_services: List[Service]):
-    services_size = len(services_df)
-
-    for i in range(services_size):
-        origin = int(services_df.iloc[i]['origin'])
-        destination = int(services_df.iloc[i]['destination'])
-        departure_time = float(services_df.iloc[i]['departure_time'])
-        arrival_time = float(services_df.iloc[i]['arrival_time'])
-        cost = float(services_df.iloc[i]['cost'])
-        capacity = int(services_df.iloc[i]['capacity'])
-        vehicle_id = int(services_df.iloc[i]['vehicle_id'])
-        remaining_distance = dist_matrix[origin][destination]
-
-        new_service = Service(
-            origin=origin, destination=destination, departure_time=departure_time, 
-            arrival_time=arrival_time, cost=cost, capacity=capacity, 
-            vehicle_id=vehicle_id, remaining_distance=remaining_distance)
-
-        present_services[i] = new_service
+                                 vehicles: VehicleStore, event_queue: EventScheduler, present_services: ServiceStore):
+    number_of_nodes = len(dist_matrix)
+
+    origins = services_df['origin'].to_numpy(dtype=int)
+    destinations = services_df['destination'].to_numpy(dtype=int)
+    departure_times = services_df['departure_time'].to_numpy(dtype=float)
+    arrival_times = services_df['arrival_time'].to_numpy(dtype=float)
+    costs = services_df['cost'].to_numpy(dtype=float)
+    capacities = services_df['capacity'].to_numpy(dtype=int)
+    vehicle_ids = services_df['vehicle_id'].to_numpy(dtype=int)
+
+    check_column((origins >= 0) & (origins < number_of_nodes), "Service origin out of range")
+    check_column((destinations >= 0) & (destinations < number_of_nodes), "Service destination out of range")
+    check_column(departure_times <= arrival_times, "Service arrives before it departs")
+    check_column(capacities >= 0, "Negative service capacity")
+    check_column((vehicle_ids >= 0) & (vehicle_ids < len(vehicles)), "Service vehicle id out of range")
+    check_column(~vehicles.type_mask("Truck")[vehicle_ids], "Services known in advance must be executed by trains or barges")
+
+    present_services.origin[:] = origins
+    present_services.destination[:] = destinations
+    present_services.departure_time[:] = departure_times
+    present_services.arrival_time[:] = arrival_times
+    present_services.cost[:] = costs
+    present_services.capacity[:] = capacities
+    present_services.vehicle_id[:] = vehicle_ids
+    present_services.remaining_distance[:] = dist_matrix[origins, destinations]
+
+    new_events = []
+    for i, (departure_time, arrival_time, vehicle_id) in enumerate(zip(
+            departure_times.tolist(), arrival_times.tolist(), vehicle_ids.tolist())):
+        vehicle = vehicles[vehicle_id]
+        new_service = present_services[i]
         
-        load_event = Event(departure_time - LOAD_TIME, choose_loading_event(vehicles[vehicle_id]), vehicle_id=vehicle_id)
-        departure_event = Event(departure_time, type=choose_departed_event(vehicles[vehicle_id]), vehicle_id=vehicle_id)
-        arrival_event = Event(arrival_time, type=choose_arrived_event(vehicles[vehicle_id]), vehicle_id=vehicle_id)
+        load_event = Event(departure_time - LOAD_TIME, choose_loading_event(vehicle), vehicle_id=vehicle_id)
+        departure_event = Event(departure_time, type=choose_departed_event(vehicle), vehicle_id=vehicle_id)
+        arrival_event = Event(arrival_time, type=choose_arrived_event(vehicle), vehicle_id=vehicle_id)
         
-        event_queue.put(load_event)
-        event_queue.put(departure_event)
-        event_queue.put(arrival_event)
+        new_events.extend((load_event, departure_event, arrival_event))
 
-        vehicles[vehicle_id].services.put(new_service)
+        vehicle.services.put(new_service)
+
+    event_queue.put_many(new_events)
 
     print("Services generated successfully")
 
 def generate_and_assign_agents(num_shippers: int, num_lsps: int, num_carriers: int, 
-                               vehicles: List[Vehicle], agent_dict: Dict[Agent_Type, List]):
-    
+                               vehicles: VehicleStore, agent_dict: Dict[Agent_Type, List]):
+    if num_shippers < 1 or num_lsps < 1 or num_carriers < num_lsps:
+        raise ValueError(f"At least 1 shipper, 1 LSP and 1 carrier per LSP are needed, got {num_shippers} shippers, "
+                         f"{num_lsps} LSPs and {num_carriers} carriers")
+
     carriers = np.empty(num_carriers, dtype=Carrier)
     lsps = np.empty(num_lsps, dtype=LSP)
     shippers = np.empty(num_shippers, dtype=Shipper)
@@ -352,58 +632,147 @@ def generate_and_assign_agents(num_shippers: int, num_lsps: int, num_carriers: i
 
     print("Agents generated successfully")
 
-    # Hardcoded assignments
-    agent_dict[Agent_Type.SHIPPER][0].lsp_list = [agent_dict[Agent_Type.LSP][0], agent_dict[Agent_Type.LSP][1]]
-    agent_dict[Agent_Type.LSP][0].carriers = [agent_dict[Agent_Type.CARRIER][0], agent_dict[Agent_Type.CARRIER][1]]
-    agent_dict[Agent_Type.LSP][1].carriers = [agent_dict[Agent_Type.CARRIER][2], agent_dict[Agent_Type.CARRIER][3]]
-
-    for vehicle in vehicles:
-        vehicle_carrier_id = vehicle.carrier_id
-        agent_dict[Agent_Type.CARRIER][vehicle_carrier_id].fleet.append(vehicle)
+    # Every shipper contacts every LSP, and the carriers are split in consecutive blocks over the LSPs
+    # (with 2 LSPs and 4 carriers: LSP 0 contacts carriers 0 and 1, LSP 1 contacts carriers 2 and 3)
+    for shipper in shippers:
+        shipper.lsp_list = list(lsps)
+    carrier_lsps = np.arange(num_carriers) * num_lsps // num_carriers
+    for lsp in lsps:
+        lsp.carriers = list(carriers[carrier_lsps == lsp.id])
+
+    check_column((vehicles.carrier_id >= 0) & (vehicles.carrier_id < num_carriers), "Vehicle carrier id out of range")
+    # Group the vehicles by carrier in one sort, the fleets keep the order of the vehicles
+    order = np.argsort(vehicles.carrier_id, kind="stable")
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(vehicles.carrier_id, minlength=num_carriers))))
+    for carrier in carriers:
+        carrier.set_fleet(vehicles, order[bounds[carrier.id]:bounds[carrier.id + 1]])
 
     print("Agents assigned successfully")
 
-def generate_requests_and_events(requests_df : pd.DataFrame, dist_matrix, requests: List[Request], events: EventQueue):
+def generate_requests_and_events(requests_df : pd.DataFrame, dist_matrix, requests: RequestStore, events: EventScheduler,
+                                 num_shippers: int = num_shippers):
+    number_of_nodes = len(dist_matrix)
+
+    request_ids = requests_df['id'].to_numpy(dtype=int)
+    origins = requests_df['orig'].to_numpy(dtype=int)
+    destinations = requests_df['dest'].to_numpy(dtype=int)
+    amounts = requests_df['amount'].to_numpy(dtype=int)
+    # prices = requests_df['price'].to_numpy(dtype=int)
+    lower_bounds = requests_df['lw'].to_numpy(dtype=int)
+    upper_bounds = requests_df['uw'].to_numpy(dtype=int)
+    selected_shippers = requests_df['selected'].to_numpy(dtype=int) - 1
+
+    # Events refer to requests by id, which is used as the index in the list of requests
+    check_column(request_ids == np.arange(len(request_ids)), "Request ids must be 0, 1, ..., number of requests - 1")
+    check_column((origins >= 0) & (origins < number_of_nodes), "Request origin out of range")
+    check_column((destinations >= 0) & (destinations < number_of_nodes), "Request destination out of range")
+    check_column(amounts >= 0, "Negative request amount")
+    check_column(lower_bounds <= upper_bounds, "Request time window is empty")
+    check_column((selected_shippers >= 0) & (selected_shippers < num_shippers), "Request shipper id out of range")
+
+    requests.id[:] = request_ids
+    requests.origin[:] = origins
+    requests.destination[:] = destinations
+    requests.amount[:] = amounts
+    requests.lower_bound[:] = lower_bounds
+    requests.upper_bound[:] = upper_bounds
+    requests.selected_shipper[:] = selected_shippers
+    requests.distance[:] = dist_matrix[origins, destinations]
+
+    events.put_many([Event(lw, Event_Type.REQUEST_ARRIVED, request_id=request_id) 
+                     for request_id, lw in zip(request_ids.tolist(), lower_bounds.tolist())])
 
-    for i in range(len(requests_df)):
-        
-        request_id = int(requests_df.iloc[i]['id'])
-        origin = int(requests_df.iloc[i]['orig'])
-        destination = int(requests_df.iloc[i]['dest'])
-        amount = int(requests_df.iloc[i]['amount'])
-        # price = int(requests_df.iloc[i]['price'])
-        time_window: Tuple[int, int] = (int(requests_df.iloc[i]['lw']), int(requests_df.iloc[i]['uw']))
-        selected_shipper = int(requests_df.iloc[i]['selected']) - 1
-        services = []
-
-        distance = dist_matrix[origin][destination]
-        
-        new_request = Request(
-                id=request_id, origin=origin, 
-                destination=destination, amount=amount, time_window=time_window, 
-                selected_shipper=selected_shipper, distance=distance, services=services)
-        
-        requests[i] = new_request   
+    print("Requests and events created successfully")
 
-        arrived_request_event = Event(time_window[0], Event_Type.REQUEST_ARRIVED, request_id=request_id)
-        events.put(arrived_request_event) 
 
-    print("Requests and events created successfully")
+def timed_stage(load_statistics: Dict[str, Dict[str, float]], stage: str, rows: int, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    load_statistics[stage] = {"rows": rows, "seconds": time.perf_counter() - start}
+    return result
 
+def print_load_statistics(load_statistics: Dict[str, Dict[str, float]], number_of_events: int):
+    print(f"{'Stage':<10}{'Rows':>12}{'Seconds':>12}{'Rows/s':>14}")
+    for stage, statistics in load_statistics.items():
+        rows, seconds = statistics["rows"], statistics["seconds"]
+        rate = rows / seconds if seconds > 0 else float('inf')
+        print(f"{stage:<10}{rows:>12}{seconds:>12.4f}{rate:>14.0f}")
+    total_seconds = sum(statistics["seconds"] for statistics in load_statistics.values())
+    print(f"Loaded {number_of_events} initial events in {total_seconds:.4f} s")
+
+def read_instance(demand_file: str, nodes_file: str, dist_file: str, vehicles_file: str, services_file: str):
+    """
+    Read the files of an instance.
+    Returns:
+        the requests, nodes, distance matrix, vehicles and services of the instance.
+    """
+    requests_df = pd.read_csv(demand_file)
+    nodes_df = pd.read_csv(nodes_file)
+    vehicles_df = pd.read_csv(vehicles_file)
+    services_df = pd.read_csv(services_file)
+
+    with open(dist_file) as f:
+        f.readline().strip().split(',')
+        dist_matrix = pd.read_csv(f, header=None).values
+
+    return requests_df, nodes_df, dist_matrix, vehicles_df, services_df
 
 # ---------------------------------------------------------
 
 def build_environment(requests_df: pd.DataFrame, nodes_df: pd.DataFrame, 
                       dist_matrix: np.ndarray, vehicles_df: pd.DataFrame, 
-                      services_df: pd.DataFrame, step_size: int):
-    
-    vehicle_list = np.empty(len(vehicles_df), dtype=Vehicle)
-    request_list = np.empty(len(requests_df), dtype=Request)
-    present_services = np.empty(len(services_df), dtype=Service)
+                      services_df: pd.DataFrame, step_size: int, scheduler: str = "heap",
+                      advance_mode: str = FIXED_STEP, num_shippers: int = num_shippers,
+                      num_lsps: int = num_lsps, num_carriers: int = num_carriers,
+                      random_streams: RandomStreams = None, arrival_delay_mean: float = 0.0,
+                      instrumentation: Instrumentation = None, tracer: Tracer = None,
+                      solver: DecisionSolver = None, decision_batch_size: int = 1, decision_processes: int = 0,
+                      decision_deadline: float = 0.0, decision_wait: Optional[float] = 0.0):
+    """
+    Build the environment from the instance data.
+    Args:
+        scheduler (str): event scheduler backend, "heap" (default) or "calendar" (bucketed calendar queue,
+            requires an integer step_size).
+        advance_mode (str): FIXED_STEP (default) to advance the time by step_size on every step, or NEXT_EVENT
+            to jump over the steps in which no event happens.
+        num_shippers, num_lsps, num_carriers (int): the number of agents of each type. The carrier_id of the vehicles
+            and the selected shipper of the requests must refer to these agents.
+        random_streams (RandomStreams): the random number generators of the run, None for an unseeded run.
+        arrival_delay_mean (float): mean of the random delay of the arrivals of the services generated for requests.
+        instrumentation (Instrumentation): times the event handlers and the loggers of the environment, None to
+            run without instrumentation.
+        tracer (Tracer): the tracer of the event loop, None for the default (INFO records kept in memory, no output).
+        solver (DecisionSolver): decides the plans of the arrived requests, None for the decision making of the shippers.
+        decision_batch_size (int): maximum number of requests arrived in the same time step that are decided
+            together (1: every request is decided when it arrives, 0: all the requests of a time step together).
+        decision_processes (int): number of worker processes solving the batches while the simulation goes on,
+            0 to solve them in the event loop.
+        decision_deadline (float): simulated time after the submission of a batch at which its plans are applied.
+        decision_wait (float): wall-clock seconds to wait at the deadline for a solve that has not returned before
+            falling back, 0 (default) to fall back at once, None to wait as long as it takes.
+    """
+    if advance_mode not in (FIXED_STEP, NEXT_EVENT):
+        raise ValueError(f"Unknown advance mode: {advance_mode}")
+    if decision_batch_size < 0:
+        raise ValueError(f"The decision batch size must be non-negative, got {decision_batch_size}")
+    if decision_processes < 0:
+        raise ValueError(f"The number of decision processes must be non-negative, got {decision_processes}")
+    if decision_deadline < 0:
+        raise ValueError(f"The decision deadline must be non-negative, got {decision_deadline}")
+    if arrival_delay_mean < 0:
+        raise ValueError(f"The mean arrival delay must be non-negative, got {arrival_delay_mean}")
+    if random_streams is None:
+        random_streams = RandomStreams.from_seed()
+
+    vehicle_list = VehicleStore(len(vehicles_df))
+    request_list = RequestStore(len(requests_df))
+    present_services = ServiceStore(len(services_df))
     agent_dict = {}
-    event_queue = EventQueue()
+    event_queue = make_event_queue(scheduler, step_size)
 
     number_of_nodes = len(nodes_df)
+    if dist_matrix.shape != (number_of_nodes, number_of_nodes):
+        raise ValueError(f"Distance matrix of shape {dist_matrix.shape} does not match the {number_of_nodes} nodes")
     vehicle_matrices = {
         "Truck": np.zeros((number_of_nodes, number_of_nodes), dtype=int),
         "Train": np.zeros((number_of_nodes, number_of_nodes), dtype=int),
@@ -411,13 +780,31 @@ def build_environment(requests_df: pd.DataFrame, nodes_df: pd.DataFrame,
         "Container": np.zeros((number_of_nodes, number_of_nodes), dtype=int),
     }
 
-    generate_vehicles(vehicles_df, vehicle_matrices, vehicle_list)
-    generate_services_and_events(services_df, dist_matrix, vehicle_list, event_queue, present_services)
-    generate_and_assign_agents(num_shippers, num_lsps, num_carriers, vehicle_list, agent_dict)
-    generate_requests_and_events(requests_df, dist_matrix, request_list, event_queue)
+    load_statistics = {}
+    timed_stage(load_statistics, "vehicles", len(vehicles_df), 
+                generate_vehicles, vehicles_df, vehicle_matrices, vehicle_list, random_streams.vehicles)
+    timed_stage(load_statistics, "services", len(services_df), 
+                generate_services_and_events, services_df, dist_matrix, vehicle_list, event_queue, present_services)
+    service_index = timed_stage(load_statistics, "index", len(services_df),
+                                ServiceIndex, present_services, number_of_nodes)
+    timed_stage(load_statistics, "agents", num_shippers + num_lsps + num_carriers, 
+                generate_and_assign_agents, num_shippers, num_lsps, num_carriers, vehicle_list, agent_dict)
+    timed_stage(load_statistics, "requests", len(requests_df), 
+                generate_requests_and_events, requests_df, dist_matrix, request_list, event_queue, num_shippers)
+
+    if solver is None:
+        solver = ShipperDecisionSolver()
 
     print("Environment built successfully")
+    print_load_statistics(load_statistics, len(event_queue))
 
     return Environment(requests=request_list, agents=agent_dict, vehicles=vehicle_list,
-                       vehicle_matrices=vehicle_matrices, events=event_queue, present_services=present_services, step_size=step_size)
+                       vehicle_matrices=vehicle_matrices, events=event_queue, present_services=present_services,
+                       service_index=service_index, step_size=step_size,
+                       advance_mode=advance_mode, load_statistics=load_statistics, random_streams=random_streams,
+                       arrival_delay_mean=arrival_delay_mean, instrumentation=instrumentation,
+                       tracer=tracer if tracer is not None else Tracer(),
+                       solver=solver,
+                       decision_batch_size=decision_batch_size, decision_deadline=decision_deadline,
+                       decision_processes=decision_processes, decision_wait=decision_wait)
 
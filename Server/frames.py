@@ -0,0 +1,202 @@
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, List, Tuple
+
+# Number of frames kept in memory: the oldest frames are dropped when the buffer is full
+FRAME_BUFFER_SIZE = 1000
+# Number of frames the simulation worker computes ahead of the furthest frame requested by a client
+RUN_AHEAD = 200
+
+class FrameBuffer:
+    """
+    Ring buffer of the last capacity frames produced by the simulation, shared by the /snapshot, /frames, /node and
+    /link endpoints. A frame is the state of the network after one call to environment.step(), frames are numbered
+    from 0 in the order in which they are produced. Every frame stores the time of the environment (step, a float: the
+    events of next-event runs need not fall on integer times), the intensity of every link and a copy of the vehicle
+    matrices.
+
+    The buffer is written by the simulation worker thread and read by the request handlers, every access holds the
+    condition of the buffer. Threads can block on the condition (see wait_for), an event loop registers a listener
+    instead, which is called in the thread of the worker after every new frame and when the simulation finishes.
+    The memory used is capacity * (number of links + size of the vehicle matrices).
+    """
+    def __init__(self, capacity: int = FRAME_BUFFER_SIZE):
+        if capacity < 2:
+            raise ValueError(f"A frame buffer must hold at least 2 frames, got {capacity}")
+        self.capacity = capacity
+        self.steps = np.zeros(capacity, dtype=np.float64)
+        self.intensities: np.ndarray = None                         # allocated with the first frame
+        self.vehicle_matrices = [None] * capacity
+        self.end = 0                                                # number of frames produced
+        self.requested = -1                                         # furthest frame requested by a client
+        self.finished = False                                       # the simulation has no more events
+        self.error: BaseException = None                            # exception that stopped the simulation
+        self.condition = threading.Condition()
+        self.listeners: List[Callable[[], None]] = []
+
+    @property
+    def start(self) -> int:
+        """
+        The oldest frame in the buffer.
+        """
+        return max(0, self.end - self.capacity)
+
+    def append(self, step: float, link_intensities: np.ndarray, vehicle_matrices: Dict[str, np.ndarray]) -> int:
+        with self.condition:
+            if self.intensities is None:
+                self.intensities = np.zeros((self.capacity, len(link_intensities)), dtype=link_intensities.dtype)
+            slot = self.end % self.capacity
+            self.steps[slot] = step
+            self.intensities[slot] = link_intensities
+            self.vehicle_matrices[slot] = vehicle_matrices
+            self.end += 1
+            self.condition.notify_all()
+            frame = self.end - 1
+        self._notify_listeners()
+        return frame
+
+    def finish(self, error: BaseException = None):
+        with self.condition:
+            self.finished = True
+            self.error = error
+            self.condition.notify_all()
+        self._notify_listeners()
+
+    def add_listener(self, listener: Callable[[], None]):
+        """
+        Call listener (without arguments, in the thread of the writer) after every new frame and when the simulation
+        finishes. A listener must not block, an event loop schedules its wake-up (e.g. with IOLoop.add_callback).
+        """
+        self.listeners.append(listener)
+
+    def _notify_listeners(self):
+        for listener in self.listeners:
+            listener()
+
+    def _slot(self, frame: int) -> int:
+        if frame < self.start:
+            raise IndexError(f"Frame {frame} was dropped from the buffer, the oldest frame is {self.start}")
+        if frame >= self.end:
+            raise IndexError(f"Frame {frame} was not produced yet, {self.end} frames were produced")
+        return frame % self.capacity
+
+    def get(self, frame: int) -> Tuple[float, np.ndarray]:
+        """
+        Returns the step and (a copy of) the link intensities of a frame.
+        """
+        with self.condition:
+            slot = self._slot(frame)
+            return self.steps[slot].item(), self.intensities[slot].copy()
+
+    def get_vehicle_matrices(self, frame: int) -> Dict[str, np.ndarray]:
+        with self.condition:
+            return self.vehicle_matrices[self._slot(frame)]
+
+    def update(self, frame: int, keyframe: bool = False) -> Tuple[int, float, bool, np.ndarray, np.ndarray]:
+        """
+        What a streaming client needs to show a frame, read under one lock so that the worker cannot drop frames in
+        between: a keyframe if one is asked for, or if the frame or the frame before it was dropped from the buffer
+        (a dropped frame is replaced by the oldest frame of the buffer), the changed links of the frame otherwise.
+        The frame must have been produced.
+        Returns:
+            the frame, its step, whether it is a keyframe, and the link IDs (None for a keyframe) and their intensities.
+        """
+        with self.condition:
+            if frame < self.start:
+                frame, keyframe = self.start, True
+            slot = self._slot(frame)
+            step = self.steps[slot].item()
+            if keyframe or frame - 1 < self.start:
+                return frame, step, True, None, self.intensities[slot].copy()
+            link_ids = np.flatnonzero(self.intensities[slot] != self.intensities[(frame - 1) % self.capacity])
+            return frame, step, False, link_ids, self.intensities[slot, link_ids]
+
+    def frame_of_step(self, step: float) -> int:
+        """
+        The last frame whose step is at most step (steps without events have no frame in next-event mode).
+        Raises IndexError if that frame is not in the buffer.
+        """
+        with self.condition:
+            frames = np.arange(self.start, self.end)
+            position = np.searchsorted(self.steps[frames % self.capacity], step, side="right") - 1
+            if position < 0:
+                raise IndexError(f"No frame of step {step} in the buffer")
+            return int(frames[position])
+
+    def last_step(self) -> float:
+        with self.condition:
+            if self.end == 0:
+                return None
+            return self.steps[(self.end - 1) % self.capacity].item()
+
+    def request(self, frame: int):
+        """
+        Let the simulation worker know that a client needs the frames up to frame.
+        """
+        with self.condition:
+            if frame > self.requested:
+                self.requested = frame
+                self.condition.notify_all()
+
+    def wait_for(self, frame: int, timeout: float = None) -> bool:
+        """
+        Block until a frame is produced (or the simulation is finished). Returns whether the frame is available.
+        """
+        self.request(frame)
+        with self.condition:
+            self.condition.wait_for(lambda: self.end > frame or self.finished, timeout)
+            return self.end > frame
+
+
+class SimulationWorker:
+    """
+    Runs the simulation in a background thread and fills a frame buffer, at most run_ahead frames ahead of the
+    furthest frame requested by a client, so that the steps do not block the IOLoop.
+    Args:
+        frame_buffer (FrameBuffer): the buffer to fill.
+        advance (Callable[[], bool]): advances the simulation by one step, returns False when there are no more events.
+        read_frame (Callable): returns the step, link intensities and vehicle matrices after a step.
+        run_ahead (int): the number of frames to compute ahead of the clients.
+    """
+    def __init__(self, frame_buffer: FrameBuffer, advance: Callable[[], bool],
+                 read_frame: Callable[[], Tuple[int, np.ndarray, Dict[str, np.ndarray]]], run_ahead: int = RUN_AHEAD):
+        if not 0 < run_ahead < frame_buffer.capacity:
+            raise ValueError(f"run_ahead must be between 1 and the buffer size - 1 ({frame_buffer.capacity - 1}), got {run_ahead}")
+        self.frame_buffer = frame_buffer
+        self.advance = advance
+        self.read_frame = read_frame
+        self.run_ahead = run_ahead
+        self.stopped = False
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="simulation")
+        self.future: Future = None
+
+    def start(self) -> Future:
+        self.future = self.executor.submit(self.run)
+        return self.future
+
+    def stop(self):
+        with self.frame_buffer.condition:
+            self.stopped = True
+            self.frame_buffer.condition.notify_all()
+        self.executor.shutdown(wait=True)
+
+    def needs_frames(self) -> bool:
+        return self.frame_buffer.end <= self.frame_buffer.requested + self.run_ahead
+
+    def run(self):
+        frame_buffer = self.frame_buffer
+        try:
+            while True:
+                with frame_buffer.condition:
+                    frame_buffer.condition.wait_for(lambda: self.stopped or self.needs_frames())
+                    if self.stopped:
+                        return
+                if not self.advance():
+                    frame_buffer.finish()
+                    return
+                frame_buffer.append(*self.read_frame())
+        except Exception as error:
+            print(f"Simulation stopped by an error: {error!r}")
+            frame_buffer.finish(error)
+            raise
@@ -0,0 +1,83 @@
+import numpy as np
+from typing import Dict, List, Tuple
+
+# Douglas-Peucker tolerances (in degrees) of the levels of detail of the link geometries, from full detail to coarse.
+# Level 0 only drops the points that are exactly collinear with their neighbours.
+LOD_TOLERANCES = (0.0, 0.0001, 0.0005, 0.002, 0.01)
+
+def point_segment_distances(points: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """
+    Distance from each of the points to the segment start-end, in the (longitude, latitude) plane.
+    """
+    direction = end - start
+    squared_length = direction @ direction
+    if squared_length == 0:
+        return np.linalg.norm(points - start, axis=1)
+    t = np.clip((points - start) @ direction / squared_length, 0.0, 1.0)
+    return np.linalg.norm(points - (start + t[:, None] * direction), axis=1)
+
+def douglas_peucker_significance(points: np.ndarray) -> np.ndarray:
+    """
+    Run Douglas-Peucker once for all the tolerances: returns for every point of a polyline the largest tolerance at
+    which the point is still kept, so that the polyline simplified with tolerance t is points[significance > t].
+    The end points are always kept. A point is never kept at a tolerance where the point that split its range is dropped.
+    """
+    number_of_points = len(points)
+    significance = np.zeros(number_of_points)
+    significance[0] = significance[-1] = np.inf
+    ranges = [(0, number_of_points - 1, np.inf)]
+    while ranges:
+        first, last, parent_significance = ranges.pop()
+        if last - first < 2:
+            continue
+        distances = point_segment_distances(points[first + 1:last], points[first], points[last])
+        split = first + 1 + int(np.argmax(distances))
+        split_significance = min(distances[split - first - 1], parent_significance)
+        significance[split] = split_significance
+        ranges.append((first, split, split_significance))
+        ranges.append((split, last, split_significance))
+    return significance
+
+# ---------------------------------------------------------
+
+def merge_segment_chains(paths: Dict[Tuple[int, int], List[int]], number_of_segments: int) -> List[List[int]]:
+    """
+    Group the segments of the paths into chains that can be represented by a single link.
+    Segment s is merged after segment p if every path that uses s uses p right before it, and every path that uses p
+    uses s right after it. The segments of a chain are then used by exactly the same paths, so they always carry the
+    same intensity, and a chain is a contiguous run in every path that uses it.
+    Returns:
+        the chains as lists of segment IDs, in the order of their first segment.
+    """
+    predecessors = [set() for _ in range(number_of_segments)]
+    successors = [set() for _ in range(number_of_segments)]
+    for segment_ids in paths.values():
+        for k, segment in enumerate(segment_ids):
+            predecessors[segment].add(segment_ids[k - 1] if k > 0 else None)
+            successors[segment].add(segment_ids[k + 1] if k + 1 < len(segment_ids) else None)
+
+    next_segment = [None] * number_of_segments
+    merged_with_previous = np.zeros(number_of_segments, dtype=bool)
+    for segment in range(number_of_segments):
+        if len(predecessors[segment]) == 1:
+            previous = next(iter(predecessors[segment]))
+            if previous is not None and previous != segment and successors[previous] == {segment}:
+                next_segment[previous] = segment
+                merged_with_previous[segment] = True
+
+    chains = []
+    assigned = np.zeros(number_of_segments, dtype=bool)
+    # Chains start at the segments that are not merged with their predecessor, segments left after that form cycles,
+    # which are cut at their lowest segment ID
+    for heads_only in (True, False):
+        for segment in range(number_of_segments):
+            if assigned[segment] or (heads_only and merged_with_previous[segment]):
+                continue
+            chain = []
+            while segment is not None and not assigned[segment]:
+                chain.append(segment)
+                assigned[segment] = True
+                segment = next_segment[segment]
+            chains.append(chain)
+    chains.sort(key=lambda chain: chain[0])
+    return chains
@@ -1,14 +1,234 @@
+import argparse
+import os
+import time
 import pandas as pd
 import numpy as np
 import geojson
 from router import get_route
 from network import Network, build_network
-from environment import Environment, build_environment
+from environment import Environment, build_environment, num_shippers, num_carriers
+from vehicles import TRUCK_SPEED
 from typing import Tuple
 
-def generate_random_instance(num_nodes, num_requests, Tmax, local_routes = True) -> Tuple[Environment, Network]:
+# An instance as returned by environment.read_instance: requests, nodes, distance matrix, vehicles and services
+Instance = Tuple[pd.DataFrame, pd.DataFrame, np.ndarray, pd.DataFrame, pd.DataFrame]
+
+# (min longitude, max longitude, min latitude, max latitude) of the generated nodes: the Benelux
+NODE_BOUNDS = (3.0, 7.0, 50.5, 53.5)
+EARTH_RADIUS = 6371 # km
+ROAD_DETOUR_FACTOR = 1.3 # road distance / great circle distance
+
+# Requests: the time window is the truck travel time plus one of these slacks (hours)
+TIME_WINDOW_SLACKS = (24, 48, 72)
+MIN_AMOUNT = 5
+MAX_AMOUNT = 30
+
+# Fleets: the share of trucks, the other vehicles are trains and barges in equal numbers
+TRUCK_SHARE = 0.7
+VEHICLE_CAPACITIES = {"Truck": 5, "Train": 90, "Barge": 150}
+VEHICLE_UNIT_COSTS = {"Truck": 1.0, "Train": 0.4, "Barge": 0.3}
+VEHICLE_EMISSION_FACTORS = {"Truck": 1.0, "Train": 0.3, "Barge": 0.35}
+SCHEDULED_SPEEDS = {"Train": 50, "Barge": 15} # km/h
+TURNAROUND_TIME = 2 # hours between the arrival of a service and the next departure of its vehicle
+
+# ---------------------------------------------------------
+
+def generate_nodes(num_nodes: int, rng: np.random.Generator, bounds: Tuple[float, float, float, float] = NODE_BOUNDS) -> pd.DataFrame:
+    """
+    Nodes scattered uniformly over bounds, with the columns of the nodes file and their coordinates.
+    """
+    min_longitude, max_longitude, min_latitude, max_latitude = bounds
+    names = np.char.add("N", np.arange(num_nodes).astype(str))
+    return pd.DataFrame({
+        'id': np.arange(num_nodes),
+        'type': 1,
+        'name': names,
+        'long_name': np.char.add("Terminal ", np.arange(num_nodes).astype(str)),
+        'longitude': rng.uniform(min_longitude, max_longitude, num_nodes),
+        'latitude': rng.uniform(min_latitude, max_latitude, num_nodes),
+    })
+
+def distance_matrix(nodes_df: pd.DataFrame, detour_factor: float = ROAD_DETOUR_FACTOR) -> np.ndarray:
+    """
+    Road distances (km, rounded) between the nodes, estimated as their great circle distances times a detour factor.
+    """
+    longitudes = np.radians(nodes_df['longitude'].to_numpy())
+    latitudes = np.radians(nodes_df['latitude'].to_numpy())
+    haversine = (np.sin((latitudes[:, None] - latitudes[None, :]) / 2) ** 2
+                 + np.cos(latitudes[:, None]) * np.cos(latitudes[None, :])
+                 * np.sin((longitudes[:, None] - longitudes[None, :]) / 2) ** 2)
+    return np.rint(detour_factor * 2 * EARTH_RADIUS * np.arcsin(np.sqrt(haversine))).astype(np.int64)
+
+def generate_requests(num_requests: int, dist_matrix: np.ndarray, horizon: int, rng: np.random.Generator,
+                      num_shippers: int = num_shippers) -> pd.DataFrame:
+    """
+    Requests between distinct random nodes, arriving uniformly over [1, horizon). The time window of a request is long
+    enough to drive from its origin to its destination by truck, plus a slack.
+    """
+    number_of_nodes = len(dist_matrix)
+    origins = rng.integers(0, number_of_nodes, num_requests)
+    destinations = (origins + rng.integers(1, number_of_nodes, num_requests)) % number_of_nodes
+    lower_bounds = rng.integers(1, horizon, num_requests)
+    travel_times = np.ceil(dist_matrix[origins, destinations] / TRUCK_SPEED).astype(np.int64)
+    return pd.DataFrame({
+        'id': np.arange(num_requests),
+        'orig': origins,
+        'dest': destinations,
+        'amount': rng.integers(MIN_AMOUNT, MAX_AMOUNT + 1, num_requests),
+        'price': 10000,
+        'lw': lower_bounds,
+        'uw': lower_bounds + travel_times + rng.choice(TIME_WINDOW_SLACKS, num_requests),
+        'selected': rng.integers(1, num_shippers + 1, num_requests),
+    })
+
+def generate_fleet(num_vehicles: int, num_nodes: int, rng: np.random.Generator, num_carriers: int = num_carriers,
+                   truck_share: float = TRUCK_SHARE) -> pd.DataFrame:
+    """
+    Trucks followed by alternating trains and barges, at random initial locations and owned by random carriers.
+    """
+    # The trucks come first: the test plan of Shipper.decision_making uses vehicles 1 and 2 as trucks
+    num_trucks = min(num_vehicles, max(3, int(truck_share * num_vehicles)))
+    names = np.full(num_vehicles, "Truck", dtype=object)
+    names[num_trucks::2] = "Train"
+    names[num_trucks + 1::2] = "Barge"
+    return pd.DataFrame({
+        'id': np.arange(num_vehicles),
+        'name': names,
+        'initial_location': rng.integers(0, num_nodes, num_vehicles),
+        'max_containers': pd.Series(names).map(VEHICLE_CAPACITIES).to_numpy(),
+        'unit_cost': pd.Series(names).map(VEHICLE_UNIT_COSTS).to_numpy(),
+        'emission_factor': pd.Series(names).map(VEHICLE_EMISSION_FACTORS).to_numpy(),
+        'carrier_id': rng.integers(0, num_carriers, num_vehicles),
+    })
+
+def generate_timetables(vehicles_df: pd.DataFrame, dist_matrix: np.ndarray, num_services: int,
+                        rng: np.random.Generator) -> pd.DataFrame:
+    """
+    Timetables of the trains and barges: every vehicle shuttles between its initial location and another node,
+    leaving again TURNAROUND_TIME after every arrival. Service k is leg k // V of scheduled vehicle k % V, so the
+    services are spread evenly over the vehicles and the timetable of every vehicle is consistent.
+    """
+    names = vehicles_df['name'].to_numpy()
+    scheduled = np.flatnonzero(names != "Truck")
+    if num_services > 0 and len(scheduled) == 0:
+        raise ValueError("Services need at least one train or barge in the fleet")
+    number_of_nodes = len(dist_matrix)
+    home = vehicles_df['initial_location'].to_numpy()[scheduled]
+    away = (home + rng.integers(1, number_of_nodes, len(scheduled))) % number_of_nodes
+    speeds = np.where(names[scheduled] == "Train", SCHEDULED_SPEEDS["Train"], SCHEDULED_SPEEDS["Barge"])
+    travel_times = np.maximum(1, np.ceil(dist_matrix[home, away] / speeds)).astype(np.int64)
+    # The loading event happens LOAD_TIME before the first departure, so that must not be before time 0
+    first_departures = rng.integers(2, 24, len(scheduled))
+    unit_costs = vehicles_df['unit_cost'].to_numpy()[scheduled]
+    capacities = vehicles_df['max_containers'].to_numpy()[scheduled]
+
+    service = np.arange(num_services)
+    vehicle = service % max(len(scheduled), 1)
+    leg = service // max(len(scheduled), 1)
+    outbound = leg % 2 == 0
+    departure_times = first_departures[vehicle] + leg * (travel_times[vehicle] + TURNAROUND_TIME)
+    return pd.DataFrame({
+        'origin': np.where(outbound, home[vehicle], away[vehicle]),
+        'destination': np.where(outbound, away[vehicle], home[vehicle]),
+        'departure_time': departure_times,
+        'arrival_time': departure_times + travel_times[vehicle],
+        'cost': np.round(dist_matrix[home, away][vehicle] * unit_costs[vehicle], 2),
+        'capacity': capacities[vehicle],
+        'vehicle_id': scheduled[vehicle],
+    })
+
+def generate_instance(num_nodes: int, num_requests: int, num_vehicles: int, num_services: int, horizon: int,
+                      seed: int = None, num_shippers: int = num_shippers, num_carriers: int = num_carriers) -> Instance:
+    """
+    Generate a complete instance without any input file or network access.
+    Args:
+        horizon (int): the requests arrive in [1, horizon).
+        seed (int): the seed of the generator, None for a random instance.
+    Returns:
+        the requests, nodes, distance matrix, vehicles and services of the instance (as returned by read_instance).
+    """
+    if num_nodes < 2:
+        raise ValueError(f"An instance needs at least 2 nodes, got {num_nodes}")
+    if horizon < 2:
+        raise ValueError(f"The horizon must be at least 2, got {horizon}")
+    rng = np.random.default_rng(seed)
+    nodes_df = generate_nodes(num_nodes, rng)
+    dist_matrix = distance_matrix(nodes_df)
+    requests_df = generate_requests(num_requests, dist_matrix, horizon, rng, num_shippers)
+    vehicles_df = generate_fleet(num_vehicles, num_nodes, rng, num_carriers)
+    services_df = generate_timetables(vehicles_df, dist_matrix, num_services, rng)
+    return requests_df, nodes_df, dist_matrix, vehicles_df, services_df
+
+# ---------------------------------------------------------
+
+def instance_file_paths(folder: str, name: str) -> Tuple[str, str, str, str, str]:
+    """
+    Paths of the demand, nodes, distance, vehicles and services files of an instance (in the order of read_instance).
+    """
+    return tuple(os.path.join(folder, f"param_{kind}_{name}.csv") for kind in ("demand", "nodes", "dist", "vehicles", "services"))
+
+def write_instance_csv(instance: Instance, folder: str, name: str) -> Tuple[str, str, str, str, str]:
+    """
+    Write an instance as the five CSV files described in the README.
+    Returns:
+        the paths of the files, in the order of the arguments of read_instance.
+    """
+    requests_df, nodes_df, dist_matrix, vehicles_df, services_df = instance
+    os.makedirs(folder, exist_ok=True)
+    paths = instance_file_paths(folder, name)
+    demand_path, nodes_path, dist_path, vehicles_path, services_path = paths
+    requests_df.to_csv(demand_path, index=False)
+    nodes_df.to_csv(nodes_path, index=False)
+    vehicles_df.to_csv(vehicles_path, index=False)
+    services_df.to_csv(services_path, index=False)
+    with open(dist_path, "w") as f:
+        f.write(f"{dist_matrix.shape[0]},{dist_matrix.shape[1]}\n")
+        np.savetxt(f, dist_matrix, fmt="%d", delimiter=",")
+    return paths
+
+BUNDLE_TABLES = ("requests", "nodes", "vehicles", "services")
+
+def write_instance_bundle(instance: Instance, path: str):
+    """
+    Write an instance as a single binary file (an uncompressed .npz of the columns), which is much faster to write
+    and read than the CSV files for large instances.
+    """
+    requests_df, nodes_df, dist_matrix, vehicles_df, services_df = instance
+    arrays = {"dist": dist_matrix}
+    for table, df in zip(BUNDLE_TABLES, (requests_df, nodes_df, vehicles_df, services_df)):
+        for column in df.columns:
+            values = df[column].to_numpy()
+            # Strings are stored as fixed width unicode, object arrays would need pickle
+            arrays[f"{table}/{column}"] = values.astype(str) if values.dtype == object else values
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez(path, **arrays)
+
+def read_instance_bundle(path: str) -> Instance:
+    """
+    Read an instance written by write_instance_bundle.
+    Returns:
+        the requests, nodes, distance matrix, vehicles and services of the instance (as returned by read_instance).
+    """
+    with np.load(path, allow_pickle=False) as bundle:
+        tables = {table: {} for table in BUNDLE_TABLES}
+        for key in bundle.files:
+            if key != "dist":
+                table, column = key.split("/", 1)
+                tables[table][column] = bundle[key]
+        dist_matrix = bundle["dist"]
+    requests_df, nodes_df, vehicles_df, services_df = (pd.DataFrame(tables[table]) for table in BUNDLE_TABLES)
+    return requests_df, nodes_df, dist_matrix, vehicles_df, services_df
+
+# ---------------------------------------------------------
+
+def generate_random_instance(num_nodes, num_requests, Tmax, local_routes = True,
+                             rng: np.random.Generator = None, num_vehicles: int = 10,
+                             num_services: int = 20) -> Tuple[Environment, Network]:
+    # rng: the instance stream of the replication (RandomStreams.instance), a fresh unseeded generator if None
+    if rng is None:
+        rng = np.random.default_rng()
     cities = pd.read_csv('./instance_files/cities.csv', header=0)
-    random_cities = cities.sample(n=num_nodes).reset_index(drop=True)
+    random_cities = cities.sample(n=num_nodes, random_state=rng).reset_index(drop=True)
 
     nodes_df_network = pd.DataFrame({
         'long_name': random_cities['name'],
@@ -26,7 +246,7 @@ def generate_random_instance(num_nodes, num_requests, Tmax, local_routes = True)
                 if local_routes:
                     with open(f"instance_files/routes/{random_cities.iloc[i]['name']}_{random_cities.iloc[j]['name']}.geojson") as f:
                         local = geojson.load(f)
-                        distance = local['legs'][0]['distance'] / 1000 
+                        distance = local['legs'][0]['distance'] / 1000
                         route = local['geometry']['coordinates']
                 else:
                     route, distance = get_route(
@@ -36,7 +256,7 @@ def generate_random_instance(num_nodes, num_requests, Tmax, local_routes = True)
                     )
                 routes[(i, j)] = route
                 distances[i, j] = distance
-    
+
 
 
 
@@ -47,29 +267,56 @@ def generate_random_instance(num_nodes, num_requests, Tmax, local_routes = True)
         'long_name': random_cities['name']
     })
 
-    requests = []
-    for i in range(num_requests):
-        origin, dest = np.random.randint(0, num_nodes, size=2)
-        amount = np.random.randint(1, 100)
-        price = np.random.randint(1, 10000)
-        bounds = np.random.randint(1, Tmax, size=2)
-        lw = min(bounds)
-        uw = max(bounds)
-        selected = 1
-        requests.append([i, origin, dest, amount, price, lw, uw, selected])
+    requests_df = generate_requests(num_requests, distances, Tmax, rng)
+    vehicles_df = generate_fleet(num_vehicles, num_nodes, rng)
+    services_df = generate_timetables(vehicles_df, distances, num_services, rng)
 
-    requests_df = pd.DataFrame(requests, columns=['id', 'orig', 'dest', 'amount', 'price', 'lw', 'uw', 'selected'])
-
-    return build_environment(requests_df, nodes_df_env, distances), build_network(nodes_df_network, connectivity, routes)
+    environment = build_environment(requests_df, nodes_df_env, distances, vehicles_df, services_df, step_size=1)
+    return environment, build_network(nodes_df_network, connectivity, routes)
 
 
 def create_connectivity(N):
     # Create all possible pairs using numpy broadcasting
     origin, destination = np.meshgrid(np.arange(N), np.arange(N), indexing='ij')
-    
+
     # Flatten and filter out (i, i) pairs
     mask = origin != destination
     data = np.column_stack((origin[mask], destination[mask]))
-    
+
     # Create DataFrame
     return pd.DataFrame(data, columns=["origin", "destination"])
+
+# ---------------------------------------------------------
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic instance offline.")
+    parser.add_argument("--nodes", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--vehicles", type=int, default=100)
+    parser.add_argument("--services", type=int, default=500)
+    parser.add_argument("--horizon", type=int, default=1000, help="the requests arrive before this time")
+    parser.add_argument("--shippers", type=int, default=num_shippers)
+    parser.add_argument("--carriers", type=int, default=num_carriers)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--format", choices=("csv", "bundle"), default="csv")
+    parser.add_argument("--folder", default="Server/instance_files_generated")
+    parser.add_argument("--name", default=None, help="suffix of the files (default: the number of requests)")
+    arguments = parser.parse_args(arguments)
+
+    start = time.perf_counter()
+    instance = generate_instance(arguments.nodes, arguments.requests, arguments.vehicles, arguments.services,
+                                 arguments.horizon, arguments.seed, arguments.shippers, arguments.carriers)
+    print(f"Generated {arguments.requests} requests, {arguments.vehicles} vehicles and {arguments.services} services "
+          f"on {arguments.nodes} nodes in {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    name = arguments.name or str(arguments.requests)
+    if arguments.format == "csv":
+        paths = write_instance_csv(instance, arguments.folder, name)
+    else:
+        paths = [os.path.join(arguments.folder, f"instance_{name}.npz")]
+        write_instance_bundle(instance, paths[0])
+    print(f"Saved to {', '.join(paths)} in {time.perf_counter() - start:.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from common import Event, Event_Type
+from data_logger import FOLDER_NAME
+
+INSTRUMENTATION_FILE = "instrumentation.json"
+INSTRUMENTATION_FILE_PATH = os.path.join(FOLDER_NAME, INSTRUMENTATION_FILE)
+
+# Timed sections besides the event handlers
+SECTIONS = ("step", "update_vehicles", "event_logger", "state_logger")
+# The queue depth is recorded every this many steps (at the start of the run, see record_queue_depth)
+QUEUE_DEPTH_INTERVAL = 1
+# Maximum number of queue depth samples kept (even)
+QUEUE_DEPTH_SAMPLES = 4096
+
+class Instrumentation:
+    """
+    Counts and wall times of the event handlers (per event type) and of the hot sections of the simulation, and the
+    depth of the event queue over time.
+    The instrumented functions are replaced by timed wrappers when they are attached (see attach and attach_network),
+    so a run without instrumentation does not pay anything for it.
+    All the counters exist from the start, so that they can be read by another thread while the simulation runs.
+    """
+    def __init__(self, queue_depth_interval: int = QUEUE_DEPTH_INTERVAL, queue_depth_samples: int = QUEUE_DEPTH_SAMPLES):
+        self.event_counts: Dict[str, int] = {event_type.name: 0 for event_type in Event_Type}
+        self.event_seconds: Dict[str, float] = {event_type.name: 0.0 for event_type in Event_Type}
+        self.event_max_seconds: Dict[str, float] = {event_type.name: 0.0 for event_type in Event_Type}
+        self.section_calls: Dict[str, int] = {section: 0 for section in SECTIONS}
+        self.section_seconds: Dict[str, float] = {section: 0.0 for section in SECTIONS}
+        self.section_max_seconds: Dict[str, float] = {section: 0.0 for section in SECTIONS}
+        self.queue_depth_interval = queue_depth_interval
+        self.queue_depth_samples = queue_depth_samples
+        self.queue_depth: List[Tuple[float, int]] = []
+
+    def timed(self, section: str, function: Callable) -> Callable:
+        """
+        Wrap a function so that its calls are counted and timed as a section.
+        """
+        calls, seconds, max_seconds = self.section_calls, self.section_seconds, self.section_max_seconds
+        perf_counter = time.perf_counter
+        calls.setdefault(section, 0)
+        seconds.setdefault(section, 0.0)
+        max_seconds.setdefault(section, 0.0)
+
+        def timed_function(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                calls[section] += 1
+                seconds[section] += elapsed
+                if elapsed > max_seconds[section]:
+                    max_seconds[section] = elapsed
+        return timed_function
+
+    def timed_handler(self, event_type: Event_Type, handler: Callable[[Event], Any]) -> Callable[[Event], Any]:
+        """
+        Wrap the handler of an event type so that the events of the type are counted and timed.
+        """
+        name = event_type.name
+        counts, seconds, max_seconds = self.event_counts, self.event_seconds, self.event_max_seconds
+        perf_counter = time.perf_counter
+
+        def timed_handler(event: Event):
+            start = perf_counter()
+            try:
+                return handler(event)
+            finally:
+                elapsed = perf_counter() - start
+                counts[name] += 1
+                seconds[name] += elapsed
+                if elapsed > max_seconds[name]:
+                    max_seconds[name] = elapsed
+        return timed_handler
+
+    def attach(self, environment):
+        """
+        Instrument an environment: its event handlers, its step method, and its event and state loggers.
+        """
+        environment.event_handlers = {event_type: self.timed_handler(event_type, handler)
+                                      for event_type, handler in environment.event_handlers.items()}
+        environment.event_logger.save_event = self.timed("event_logger", environment.event_logger.save_event)
+        environment.state_logger.save_state = self.timed("state_logger", environment.state_logger.save_state)
+        timed_step = self.timed("step", environment.step)
+
+        def step():
+            result = timed_step()
+            if self.section_calls["step"] % self.queue_depth_interval == 0:
+                self.record_queue_depth(environment.time, len(environment.events))
+            return result
+        environment.step = step
+
+    def record_queue_depth(self, time: float, depth: int):
+        """
+        Record a sample of the queue depth. When queue_depth_samples samples are kept, every other sample is dropped
+        and the interval doubles, so the samples cover the whole run at a resolution that decreases with its length.
+        """
+        self.queue_depth.append((time, depth))
+        if len(self.queue_depth) >= self.queue_depth_samples:
+            # The samples are taken at the multiples of the interval, keep the multiples of the doubled interval
+            self.queue_depth = self.queue_depth[1::2]
+            self.queue_depth_interval *= 2
+
+    def attach_network(self, network):
+        network.update_vehicles = self.timed("update_vehicles", network.update_vehicles)
+
+    def to_dict(self) -> Dict[str, Any]:
+        def summary(calls: int, seconds: float, max_seconds: float) -> Dict[str, float]:
+            return {"calls": calls, "total_seconds": seconds,
+                    "mean_us": seconds / calls * 1e6 if calls else 0.0, "max_us": max_seconds * 1e6}
+        return {
+            "events": {name: summary(self.event_counts[name], self.event_seconds[name], self.event_max_seconds[name])
+                       for name in list(self.event_counts)},
+            "sections": {section: summary(self.section_calls[section], self.section_seconds[section],
+                                          self.section_max_seconds[section])
+                         for section in list(self.section_calls)},
+            "queue_depth_interval": self.queue_depth_interval,
+            "queue_depth": [[t, depth] for t, depth in self.queue_depth[:]],
+        }
+
+    def save(self, path: str = INSTRUMENTATION_FILE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=4)
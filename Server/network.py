@@ -6,7 +6,9 @@ from dataclasses import dataclass
 from typing import Tuple, List, Dict
 
 from common import Node, Link, Vehicle, NetworkVehicle
-from router import get_route
+from router import get_routes, OSRM_BASE_URL
+from route_cache import RouteCache, ROUTE_CACHE_PATH
+from geometry import LOD_TOLERANCES, douglas_peucker_significance, merge_segment_chains
 
 
 
@@ -21,15 +23,21 @@ class Network:
         - a dictionary from (int, int) to [int], which represents a mapping (in terms of their IDs) from source-destination node pair
           to the list of links along the path.
         - a link_id_lookup dictionary that maps (start_longitude, start_latitude, end_longitude, end_latitude) to link ID.
-        - link_vehicles is a list that records the resources on each link.
-        - node_vehicles is a list that records the resources at each node.
+        - link_intensities is an array that records the total quantity of resources on each link.
+        - vehicle_matrices are the vehicle matrices of the last update, used to list the resources at a node or on a link.
+        - lod_tolerances are the Douglas-Peucker tolerances of the levels of detail of the link geometries (see links_at_lod).
+
+    The paths are also stored as a sparse node pair -> link incidence matrix in CSR format, where the node pair (i, j)
+    is row i * number_of_nodes + j: the links of the pair are pair_link_indices[pair_link_indptr[p]:pair_link_indptr[p + 1]].
+    The transposed matrix (link -> node pairs, link_pair_indptr and link_pair_indices) is used to list the resources on a link.
     """
     nodes: List[Node]
     links: List[Link]
     paths: Dict[Tuple[int, int], List[int]]
     link_id_lookup: Dict[Tuple[float, float, float, float], int] = None
-    link_vehicles: List[List[Vehicle]] = None
-    node_vehicles: List[List[Vehicle]] = None
+    link_intensities: np.ndarray = None
+    vehicle_matrices: Dict[str, np.ndarray] = None
+    lod_tolerances: Tuple[float, ...] = LOD_TOLERANCES
     
     def __post_init__(self):
         # Compute link_id_lookup if it is not provided
@@ -38,39 +46,143 @@ class Network:
                 (link.start_longitude, link.start_latitude, link.end_longitude, link.end_latitude): idx
                 for idx, link in enumerate(self.links)
             }
-        if self.link_vehicles is None:
-            self.link_vehicles = [[] for _ in self.links]
-        if self.node_vehicles is None:
-            self.node_vehicles = [[] for _ in self.nodes]
+        if self.link_intensities is None:
+            self.link_intensities = np.zeros(len(self.links), dtype=np.int64)
+        self.build_incidence()
+        self.link_significance = [douglas_peucker_significance(np.array(link.points(), dtype=float)) for link in self.links]
 
-    def update_vehicles(self, vehicle_matrices: Dict[str, np.ndarray]):
+    def links_at_lod(self, lod: int) -> List[Dict]:
+        """
+        The links as dictionaries, with their geometry simplified with the tolerance of a level of detail.
+        Link IDs do not depend on the level of detail, only the number of points of the geometries does.
+        Negative levels count from the coarsest level (-1).
+        """
+        if not -len(self.lod_tolerances) <= lod < len(self.lod_tolerances):
+            raise ValueError(f"Level of detail must be between {-len(self.lod_tolerances)} and {len(self.lod_tolerances) - 1}, got {lod}")
+        lod %= len(self.lod_tolerances)
+        tolerance = self.lod_tolerances[lod]
+        return [
+            {
+                "start_longitude": link.start_longitude, "start_latitude": link.start_latitude,
+                "end_longitude": link.end_longitude, "end_latitude": link.end_latitude,
+                "geometry": [point for point, significance in zip(link.points(), self.link_significance[link_id]) if significance > tolerance],
+            }
+            for link_id, link in enumerate(self.links)
+        ]
+
+    def build_incidence(self):
+        number_of_nodes = len(self.nodes)
+        path_lengths = np.zeros(number_of_nodes * number_of_nodes, dtype=np.int64)
+        for (i, j), link_ids in self.paths.items():
+            path_lengths[i * number_of_nodes + j] = len(link_ids)
+
+        self.pair_link_indptr = np.zeros(number_of_nodes * number_of_nodes + 1, dtype=np.int64)
+        np.cumsum(path_lengths, out=self.pair_link_indptr[1:])
+        self.pair_link_indices = np.zeros(self.pair_link_indptr[-1], dtype=np.int64)
+        for (i, j), link_ids in self.paths.items():
+            pair = i * number_of_nodes + j
+            self.pair_link_indices[self.pair_link_indptr[pair]:self.pair_link_indptr[pair + 1]] = link_ids
+
+        # Transpose: for every link, the node pairs whose path uses it (in increasing pair order)
+        pair_of_entry = np.repeat(np.arange(number_of_nodes * number_of_nodes), path_lengths)
+        order = np.argsort(self.pair_link_indices, kind="stable")
+        self.link_pair_indices = pair_of_entry[order]
+        self.link_pair_indptr = np.zeros(len(self.links) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.pair_link_indices, minlength=len(self.links)), out=self.link_pair_indptr[1:])
+
+    def update_vehicles(self, vehicle_matrices: Dict[str, np.ndarray], changes: List[Tuple[int, int, str, int]] = None):
         """
         Utility function for updating the network
         Args:
             vehicle_matrices: a dictionary mapping from vehicle type/name to a 2D numpy array storing the number of vehicles of that type,
                 where entry (i,j) is the number of vehicles of that type going from node index i to index j. Entry (i,i) is the number
                 of vehicles of that type sitting at node index i.
+            changes: the (i, j, type, delta) changes of the matrices since the last update. If given (and the network was
+                updated with the same matrices before), only the links on the paths of the changed node pairs are updated.
+                Otherwise the link intensities are recomputed from the matrices.
         """
-        self.link_vehicles = [[] for _ in self.links]
-        self.node_vehicles = [[] for _ in self.nodes] # clear old vehicles
-        
-        for i in range(len(self.nodes)):
-            for j in range(len(self.nodes)): # for each pair of nodes
-                for name, quantities in vehicle_matrices.items():
-                    if quantities[i,j] > 0:
-                        if i == j: # if it's vehicle sitting at node
-                            self.node_vehicles[i].append(NetworkVehicle(name, i, j, quantities[i,j].item())) # item converts np.int64 (not json serializable) to native int
-                        else:
-                            for link_idx in self.paths[(i,j)]:
-                                self.link_vehicles[link_idx].append(NetworkVehicle(name, i, j, quantities[i,j].item()))
-
-def build_network(nodes: pd.DataFrame, connectivity: pd.DataFrame, routes=None) -> Network:
+        if changes is not None and self.vehicle_matrices is vehicle_matrices:
+            self.apply_changes(changes)
+            return
+
+        self.vehicle_matrices = vehicle_matrices
+        number_of_nodes = len(self.nodes)
+        pair_quantities = sum(quantities for quantities in vehicle_matrices.values()).reshape(-1).astype(np.int64)
+        pair_quantities[::number_of_nodes + 1] = 0 # vehicles sitting at nodes are not on links
+        # Sparse matrix-vector product: link intensities = incidence^T * pair quantities
+        path_lengths = np.diff(self.pair_link_indptr)
+        self.link_intensities = np.bincount(self.pair_link_indices, weights=np.repeat(pair_quantities, path_lengths),
+                                            minlength=len(self.links)).astype(np.int64)
+
+    def apply_changes(self, changes: List[Tuple[int, int, str, int]]):
+        number_of_nodes = len(self.nodes)
+        for i, j, _, delta in changes:
+            if i != j:
+                pair = i * number_of_nodes + j
+                link_ids = self.pair_link_indices[self.pair_link_indptr[pair]:self.pair_link_indptr[pair + 1]]
+                np.add.at(self.link_intensities, link_ids, delta)
+
+    def vehicles_at_node(self, node_id: int, vehicle_matrices: Dict[str, np.ndarray] = None) -> List[NetworkVehicle]:
+        """
+        The resources sitting at a node, in the given vehicle matrices (by default the ones of the last update).
+        """
+        vehicle_matrices = self.vehicle_matrices if vehicle_matrices is None else vehicle_matrices
+        if vehicle_matrices is None:
+            return []
+        return [
+            NetworkVehicle(name, node_id, node_id, quantities[node_id, node_id].item()) # item converts np.int64 (not json serializable) to native int
+            for name, quantities in vehicle_matrices.items() if quantities[node_id, node_id] > 0
+        ]
+
+    def vehicles_on_link(self, link_id: int, vehicle_matrices: Dict[str, np.ndarray] = None) -> List[NetworkVehicle]:
+        """
+        The resources on a link, in the given vehicle matrices (by default the ones of the last update).
+        """
+        vehicle_matrices = self.vehicle_matrices if vehicle_matrices is None else vehicle_matrices
+        if vehicle_matrices is None:
+            return []
+        number_of_nodes = len(self.nodes)
+        vehicles = []
+        for pair in self.link_pair_indices[self.link_pair_indptr[link_id]:self.link_pair_indptr[link_id + 1]].tolist():
+            i, j = divmod(pair, number_of_nodes)
+            for name, quantities in vehicle_matrices.items():
+                if quantities[i, j] > 0:
+                    vehicles.append(NetworkVehicle(name, i, j, quantities[i, j].item()))
+        return vehicles
+
+def merge_links(links: List[Link], paths: Dict[Tuple[int, int], List[int]]) -> Tuple[List[Link], Dict[Tuple[int, int], List[int]], List[int]]:
+    """
+    Merge the chains of segments that are used by the same paths (see geometry.merge_segment_chains) into single links.
+    Returns:
+        the merged links, the paths in terms of the merged links, and the merged link ID of every segment.
+    """
+    chains = merge_segment_chains(paths, len(links))
+    merged_links = []
+    segment_link = [0] * len(links)
+    chain_start = [False] * len(links)
+    for link_id, chain in enumerate(chains):
+        first, last = links[chain[0]], links[chain[-1]]
+        geometry = [[first.start_longitude, first.start_latitude]] + [[links[s].end_longitude, links[s].end_latitude] for s in chain]
+        merged_links.append(Link(first.start_longitude, first.start_latitude, last.end_longitude, last.end_latitude,
+                                 geometry=geometry))
+        for segment in chain:
+            segment_link[segment] = link_id
+        chain_start[chain[0]] = True
+    # Every traversal of a chain in a path starts at the first segment of the chain
+    merged_paths = {pair: [segment_link[s] for s in segment_ids if chain_start[s]] for pair, segment_ids in paths.items()}
+    return merged_links, merged_paths, segment_link
+
+def build_network(nodes: pd.DataFrame, connectivity: pd.DataFrame, routes=None,
+                  cache_path: str = ROUTE_CACHE_PATH, base_url: str = OSRM_BASE_URL, merge: bool = True) -> Network:
     """
     Build a network by reading from nodes and connectivity.
     Args:
         nodes (pd.DataFrame): DataFrame with columns ['long_name', 'longitude', 'latitude'].
         connectivity (pd.DataFrame): DataFrame with columns ['origin', 'destination'].
         routes (dict): Dictionary mapping from (origin id, destination id) to a list of (longitude, latitude) tuples.
+        cache_path (str): the route cache used when routes are not provided (None to disable the cache).
+        base_url (str): the OSRM server the routes that are not cached are fetched from.
+        merge (bool): merge the runs of segments that are used by the same paths into single links.
     Returns:
         Network: Constructed network with nodes, links, paths, and link_id_lookup.
     """
@@ -83,25 +195,29 @@ def build_network(nodes: pd.DataFrame, connectivity: pd.DataFrame, routes=None)
     unique_links = {}  # Dictionary to store unique links as key-value pairs
     links = []  # List to hold the unique Link objects
     paths = {}  # Dictionary to hold the paths
+
+    if routes is None:
+        # Fetch the routes of all the rows at once: cached routes are read from the cache, the others are fetched concurrently
+        coordinates = {
+            (int(row['origin']), int(row['destination'])): (
+                node_list[int(row['origin'])].longitude, node_list[int(row['origin'])].latitude,
+                node_list[int(row['destination'])].longitude, node_list[int(row['destination'])].latitude)
+            for _, row in connectivity.iterrows()
+        }
+        cache = RouteCache(cache_path) if cache_path is not None else None
+        try:
+            fetched = get_routes(list(coordinates.values()), cache, base_url)
+        finally:
+            if cache is not None:
+                cache.close()
+        routes = {pair: fetched[c][0] for pair, c in coordinates.items()}
  
     # Iterate over the connectivity data to create paths and populate links
     for _, row in connectivity.iterrows():
         origin_id = int(row['origin']) # NB: numpy int cannot be serialized to JSON, so we need to convert to native int
         destination_id = int(row['destination'])
         
-        # Get origin and destination coordinates
-        origin_node = node_list[origin_id]
-        dest_node = node_list[destination_id]
-        
-        if routes is None:
-            # Fetch route using get_route if routes isn't provided
-            route = get_route(
-                origin_node.longitude, origin_node.latitude,
-                dest_node.longitude, dest_node.latitude
-            )
-        else:
-            # Use the provided routes
-            route = routes[(origin_id, destination_id)]
+        route = routes[(origin_id, destination_id)]
         
         # Map the route to link IDs
         link_ids = []
@@ -126,5 +242,12 @@ def build_network(nodes: pd.DataFrame, connectivity: pd.DataFrame, routes=None)
         # Map the source-destination pair to the list of link IDs
         paths[(origin_id, destination_id)] = link_ids
     
+    if merge:
+        number_of_segments = len(links)
+        links, paths, segment_link = merge_links(links, paths)
+        # The lookup still maps the coordinates of every segment, to the link that contains it
+        unique_links = {link_key: segment_link[segment] for link_key, segment in unique_links.items()}
+        print(f"Merged {number_of_segments} route segments into {len(links)} links")
+
     # Return the constructed network
     return Network(nodes=node_list, links=links, paths=paths, link_id_lookup=unique_links)
@@ -0,0 +1,36 @@
+import numpy as np
+from dataclasses import dataclass
+
+# Streams of random numbers of a replication. Each stream is an independent generator, so that adding draws to one
+# part of the model (e.g. delays) does not change the numbers drawn by another (e.g. the truck speeds).
+STREAM_NAMES = ("vehicles", "delays", "instance")
+
+@dataclass
+class RandomStreams:
+    """
+    The random number generators of one replication:
+        - vehicles: vehicle attributes (truck speeds)
+        - delays: stochastic delays of the events
+        - instance: random instance generation
+    Streams are derived from a seed and a replication number with numpy's SeedSequence, so the streams of different
+    replications of the same seed are independent, and a replication can be reproduced on its own.
+    """
+    seed: int
+    replication: int
+    vehicles: np.random.Generator
+    delays: np.random.Generator
+    instance: np.random.Generator
+
+    @classmethod
+    def from_seed(cls, seed: int = None, replication: int = 0) -> 'RandomStreams':
+        """
+        Args:
+            seed (int): the seed of the experiment, None to draw one from the operating system (the seed that was
+                drawn is kept in the seed attribute, so the run can be reproduced).
+            replication (int): the number of the replication.
+        """
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy)
+        sequence = np.random.SeedSequence(entropy=seed, spawn_key=(replication,))
+        generators = [np.random.default_rng(child) for child in sequence.spawn(len(STREAM_NAMES))]
+        return cls(seed, replication, **dict(zip(STREAM_NAMES, generators)))
@@ -0,0 +1,183 @@
+import argparse
+import math
+import os
+import time
+import numpy as np
+import pandas as pd
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from typing import List
+
+from sweep import Scenario, run_scenario
+
+REPLICATIONS_FOLDER = os.path.join("logs", "replications")
+# KPIs of the StatisticsTracker that are aggregated over the replications (the columns of run_scenario that start with them)
+KPI_PREFIXES = ("distance_", "modal_share_", "completed_requests", "late_requests", "total_lateness")
+CONFIDENCE = 0.95
+
+# ---------------------------------------------------------
+# Student t quantiles, from the regularized incomplete beta function (no scipy dependency)
+
+def incomplete_beta_fraction(a: float, b: float, x: float) -> float:
+    """
+    Continued fraction of the regularized incomplete beta function (modified Lentz's method).
+    """
+    tiny = 1e-300
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    result = d
+    for m in range(1, 300):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            result *= d * c
+        if abs(d * c - 1.0) < 1e-14:
+            break
+    return result
+
+def regularized_incomplete_beta(a: float, b: float, x: float) -> float:
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    log_front = math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1 - x)
+    if x < (a + 1) / (a + b + 2):
+        return math.exp(log_front) * incomplete_beta_fraction(a, b, x) / a
+    return 1.0 - math.exp(log_front) * incomplete_beta_fraction(b, a, 1 - x) / b
+
+def t_cdf(t: float, degrees_of_freedom: int) -> float:
+    tail = 0.5 * regularized_incomplete_beta(degrees_of_freedom / 2, 0.5, degrees_of_freedom / (degrees_of_freedom + t * t))
+    return 1.0 - tail if t > 0 else tail
+
+def t_quantile(probability: float, degrees_of_freedom: int) -> float:
+    """
+    Quantile of the Student t distribution, by bisection on its CDF.
+    """
+    low, high = -1.0, 1.0
+    while t_cdf(low, degrees_of_freedom) > probability:
+        low *= 2
+    while t_cdf(high, degrees_of_freedom) < probability:
+        high *= 2
+    for _ in range(200):
+        middle = (low + high) / 2
+        if t_cdf(middle, degrees_of_freedom) < probability:
+            low = middle
+        else:
+            high = middle
+        if high - low < 1e-10:
+            break
+    return (low + high) / 2
+
+# ---------------------------------------------------------
+
+def summarize(results: pd.DataFrame, confidence: float = CONFIDENCE) -> pd.DataFrame:
+    """
+    Mean, variance and Student t confidence interval of every KPI over the completed replications.
+    """
+    completed = results[results["status"] == "completed"]
+    kpis = [column for column in completed.columns if column.startswith(KPI_PREFIXES)]
+    rows = []
+    for kpi in kpis:
+        values = completed[kpi].dropna().to_numpy(dtype=float)
+        count = len(values)
+        mean = values.mean() if count else math.nan
+        variance = values.var(ddof=1) if count > 1 else math.nan
+        half_width = (t_quantile((1 + confidence) / 2, count - 1) * math.sqrt(variance / count)
+                      if count > 1 else math.inf)
+        rows.append({"kpi": kpi, "replications": count, "mean": mean, "variance": variance,
+                     "std": math.sqrt(variance) if count > 1 else math.nan,
+                     "ci_low": mean - half_width, "ci_high": mean + half_width, "half_width": half_width})
+    return pd.DataFrame(rows)
+
+def precision_reached(summary: pd.DataFrame, target_half_width: float, relative: bool, kpis: List[str] = None) -> bool:
+    """
+    Whether the half width of the confidence interval of the KPIs (all of them if kpis is None) is within the target,
+    as an absolute value or relative to the absolute value of the mean.
+    """
+    if kpis is not None:
+        summary = summary[summary["kpi"].isin(kpis)]
+    if summary.empty:
+        return False
+    half_widths = summary["half_width"].to_numpy(dtype=float)
+    if relative:
+        means = np.abs(summary["mean"].to_numpy(dtype=float))
+        # A KPI that is constant at 0 has a half width of 0 and is precise
+        return bool(np.all((half_widths == 0) | (half_widths <= target_half_width * means)))
+    return bool(np.all(half_widths <= target_half_width))
+
+def run_replications(scenario: Scenario, seed: int, max_replications: int, min_replications: int = 3,
+                     target_half_width: float = None, relative: bool = True, kpis: List[str] = None,
+                     confidence: float = CONFIDENCE, processes: int = None,
+                     log_folder: str = REPLICATIONS_FOLDER) -> tuple:
+    """
+    Run independent replications of a scenario (replication r uses the random streams of (seed, r)) across processes,
+    in batches of the number of processes. Stops early once at least min_replications are completed and the
+    confidence intervals of the KPIs are within target_half_width.
+    Returns:
+        the results of every replication and the summary of the KPIs.
+    """
+    if min_replications < 2 or max_replications < min_replications:
+        raise ValueError(f"Need 2 <= min_replications <= max_replications, got {min_replications} and {max_replications}")
+    processes = processes or os.cpu_count()
+    rows = []
+    summary = None
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                             max_tasks_per_child=1) as executor:
+        while len(rows) < max_replications:
+            batch = range(len(rows), min(len(rows) + processes, max_replications))
+            replications = [replace(scenario, name=f"{scenario.name}_r{r}", seed=seed, replication=r) for r in batch]
+            rows.extend(executor.map(run_scenario, replications, [log_folder] * len(replications)))
+            results = pd.DataFrame(rows)
+            summary = summarize(results, confidence)
+            completed = int((results["status"] == "completed").sum())
+            print(f"{len(rows)} replications ({completed} completed) in {time.perf_counter() - start:.2f} s")
+            if (target_half_width is not None and completed >= min_replications
+                    and precision_reached(summary, target_half_width, relative, kpis)):
+                print(f"Confidence intervals within the target after {len(rows)} replications")
+                break
+    return pd.DataFrame(rows), summary
+
+# ---------------------------------------------------------
+
+def main(arguments: List[str] = None):
+    parser = argparse.ArgumentParser(description="Run seeded replications of a scenario and report confidence "
+                                                 "intervals of the KPIs.")
+    parser.add_argument("--demand", default="Server/instance_files_test/param_demand_test.csv")
+    parser.add_argument("--nodes", default="Server/instance_files_test/param_nodes_test.csv")
+    parser.add_argument("--dist", default="Server/instance_files_test/param_dist_test.csv")
+    parser.add_argument("--vehicles", default="Server/instance_files_test/param_vehicles_test.csv")
+    parser.add_argument("--services", default="Server/instance_files_test/param_services_test.csv")
+    parser.add_argument("--step-size", type=int, default=1)
+    parser.add_argument("--arrival-delay", type=float, default=0.0, help="mean of the random arrival delays")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replications", type=int, default=30, help="maximum number of replications")
+    parser.add_argument("--min-replications", type=int, default=5)
+    parser.add_argument("--target-half-width", type=float, default=None,
+                        help="stop once the CI half width of the KPIs is within this target")
+    parser.add_argument("--absolute", action="store_true", help="the target is absolute instead of relative to the mean")
+    parser.add_argument("--kpis", nargs="+", default=None, help="KPIs of the stopping rule (default: all)")
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--output", default=os.path.join(REPLICATIONS_FOLDER, "summary.csv"))
+    arguments = parser.parse_args(arguments)
+
+    scenario = Scenario(name="replication", demand_file=arguments.demand, nodes_file=arguments.nodes,
+                        dist_file=arguments.dist, vehicles_file=arguments.vehicles, services_file=arguments.services,
+                        step_size=arguments.step_size, arrival_delay_mean=arguments.arrival_delay)
+    results, summary = run_replications(scenario, arguments.seed, arguments.replications, arguments.min_replications,
+                                        arguments.target_half_width, not arguments.absolute, arguments.kpis,
+                                        arguments.confidence, arguments.processes)
+    os.makedirs(os.path.dirname(arguments.output) or ".", exist_ok=True)
+    summary.to_csv(arguments.output, index=False)
+    results.to_csv(os.path.splitext(arguments.output)[0] + "_replications.csv", index=False)
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(summary)
+    print(f"Summary saved to {arguments.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import sqlite3
+import numpy as np
+from typing import Dict, Iterable, List, Tuple
+
+ROUTE_CACHE_PATH = "Server/instance_files/routes.sqlite"
+# Coordinates are rounded to 6 decimals (about 0.1 m) in the cache keys, so that the same location read from different
+# files maps to the same route
+COORDINATE_DIGITS = 6
+
+Coordinates = Tuple[float, float, float, float]     # (origin longitude, origin latitude, destination longitude, destination latitude)
+Route = Tuple[List[List[float]], float]             # (path as [longitude, latitude] points, distance in km)
+
+def route_key(profile: str, coordinates: Coordinates) -> str:
+    """
+    Content address of a route: hash of the profile and the rounded coordinates of its end points.
+    """
+    rounded = ",".join(f"{coordinate:.{COORDINATE_DIGITS}f}" for coordinate in coordinates)
+    return hashlib.sha1(f"{profile}:{rounded}".encode()).hexdigest()
+
+class RouteCache:
+    """
+    On-disk cache of routes in a single SQLite file, indexed by route_key.
+    The path of a route is stored as a blob of little-endian float64 (longitude, latitude) pairs.
+    """
+    def __init__(self, path: str = ROUTE_CACHE_PATH):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS routes ("
+            "key TEXT PRIMARY KEY, profile TEXT NOT NULL, "
+            "origin_longitude REAL, origin_latitude REAL, destination_longitude REAL, destination_latitude REAL, "
+            "distance REAL NOT NULL, path BLOB NOT NULL)"
+        )
+        self.connection.commit()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+
+    def get_many(self, profile: str, coordinates: Iterable[Coordinates]) -> Dict[Coordinates, Route]:
+        """
+        Returns the cached routes of the given coordinates, the coordinates that are not cached are left out.
+        """
+        keys = {route_key(profile, c): c for c in coordinates}
+        routes = {}
+        key_list = list(keys)
+        # SQLite limits the number of parameters of a query
+        for start in range(0, len(key_list), 500):
+            chunk = key_list[start:start + 500]
+            rows = self.connection.execute(
+                f"SELECT key, distance, path FROM routes WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            for key, distance, path in rows:
+                routes[keys[key]] = (np.frombuffer(path, dtype="<f8").reshape(-1, 2).tolist(), distance)
+        return routes
+
+    def put_many(self, profile: str, routes: Dict[Coordinates, Route]):
+        """
+        Store routes in a single transaction.
+        """
+        rows = [
+            (route_key(profile, c), profile, *c, distance, np.asarray(path, dtype="<f8").tobytes())
+            for c, (path, distance) in routes.items()
+        ]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO routes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def close(self):
+        self.connection.close()
@@ -1,31 +1,166 @@
+import asyncio
 import json
+import socket
 import geojson
 import pandas as pd
 import urllib.request
+from typing import Dict, Iterable, List
 
-def get_route(origin_longitude, origin_latitude, dest_longitude, dest_latitude, return_distance=False):
-    url = f"http://router.project-osrm.org/route/v1/driving/{origin_longitude},{origin_latitude};{dest_longitude},{dest_latitude}?geometries=geojson&overview=full"
-    contents = urllib.request.urlopen(url).read()
-    contents = json.loads(contents)
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+from route_cache import RouteCache, Coordinates, Route, ROUTE_CACHE_PATH
+
+# The public demo server of OSRM. Point this to a local OSRM instance (or a stand-in server for tests) to avoid its
+# rate limits.
+OSRM_BASE_URL = "http://router.project-osrm.org"
+OSRM_PROFILE = "driving"
+
+# Concurrent fetching of the routes that are not cached
+MAX_CONCURRENT_REQUESTS = 8
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5         # seconds, doubled after every failed attempt
+REQUEST_TIMEOUT = 30.0      # seconds
+
+def route_url(origin_longitude, origin_latitude, dest_longitude, dest_latitude,
+              base_url: str = OSRM_BASE_URL, profile: str = OSRM_PROFILE) -> str:
+    return f"{base_url}/route/v1/{profile}/{origin_longitude},{origin_latitude};{dest_longitude},{dest_latitude}?geometries=geojson&overview=full"
+
+def parse_route(contents) -> Route:
+    """
+    Extract the path and the distance (in km) from an OSRM route response.
+    """
+    if contents.get('code', 'Ok') != 'Ok' or not contents.get('routes'):
+        raise ValueError(f"OSRM could not find a route: {contents.get('code')} {contents.get('message', '')}")
     total_distance = contents['routes'][0]['legs'][0]['distance'] / 1000 # distance in km
     path = contents['routes'][0]['geometry']['coordinates']
+    return path, total_distance
+
+def get_route(origin_longitude, origin_latitude, dest_longitude, dest_latitude, return_distance=False,
+              base_url: str = OSRM_BASE_URL):
+    url = route_url(origin_longitude, origin_latitude, dest_longitude, dest_latitude, base_url)
+    contents = urllib.request.urlopen(url).read()
+    path, total_distance = parse_route(json.loads(contents))
 
     return path if not return_distance else (path, total_distance)
 
+# ---------------------------------------------------------
+
+class RouteFetchError(RuntimeError):
+    """
+    Some routes could not be fetched. The routes that were fetched are kept in fetched, the errors by coordinates in
+    errors.
+    """
+    def __init__(self, message: str, fetched: Dict[Coordinates, Route], errors: Dict[Coordinates, Exception]):
+        super().__init__(message)
+        self.fetched = fetched
+        self.errors = errors
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, HTTPClientError):
+        # 599 is a connection error or a timeout, 429 is the rate limit of the server
+        return error.code == 599 or error.code == 429 or error.code >= 500
+    # An unknown host does not come back after a retry
+    return isinstance(error, OSError) and not isinstance(error, socket.gaierror)
+
+async def fetch_route(client: AsyncHTTPClient, coordinates: Coordinates, base_url: str, profile: str,
+                      retries: int = MAX_RETRIES) -> Route:
+    url = route_url(*coordinates, base_url=base_url, profile=profile)
+    delay = RETRY_BACKOFF
+    for attempt in range(retries + 1):
+        try:
+            response = await client.fetch(url, request_timeout=REQUEST_TIMEOUT)
+            return parse_route(json.loads(response.body))
+        except Exception as error:
+            if attempt == retries or not is_retryable(error):
+                raise
+            print(f"Route request failed ({error}), retrying in {delay} s")
+            await asyncio.sleep(delay)
+            delay *= 2
+
+async def fetch_routes(coordinates: Iterable[Coordinates], base_url: str = OSRM_BASE_URL, profile: str = OSRM_PROFILE,
+                       max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS,
+                       retries: int = MAX_RETRIES) -> Dict[Coordinates, Route]:
+    """
+    Fetch routes concurrently, with at most max_concurrent_requests requests in flight (over pooled connections).
+    Failed requests are retried with exponential backoff.
+    Raises:
+        RouteFetchError: if some routes still cannot be fetched, with the routes that were fetched.
+    """
+    coordinates = list(coordinates)
+    if not coordinates:
+        return {}
+    # force_instance: the pool size is set per client, the shared client of the IOLoop keeps its own settings
+    client = AsyncHTTPClient(force_instance=True, max_clients=max_concurrent_requests)
+    semaphore = asyncio.Semaphore(max_concurrent_requests)
+
+    async def fetch(c: Coordinates) -> Route:
+        async with semaphore:
+            return await fetch_route(client, c, base_url, profile, retries)
+
+    try:
+        results = await asyncio.gather(*(fetch(c) for c in coordinates), return_exceptions=True)
+    finally:
+        client.close()
+    routes = {c: result for c, result in zip(coordinates, results) if not isinstance(result, BaseException)}
+    errors = {c: result for c, result in zip(coordinates, results) if isinstance(result, BaseException)}
+    if errors:
+        first = next(iter(errors.values()))
+        raise RouteFetchError(f"{len(errors)} of {len(coordinates)} routes could not be fetched from {base_url}: "
+                              f"{type(first).__name__}: {first}", routes, errors)
+    return routes
+
+def get_routes(coordinates: List[Coordinates], cache: RouteCache = None, base_url: str = OSRM_BASE_URL,
+               profile: str = OSRM_PROFILE, max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS) -> Dict[Coordinates, Route]:
+    """
+    Get the routes between pairs of coordinates, from the cache if possible. The routes that are not cached are
+    fetched concurrently and added to the cache.
+    Must be called outside of a running event loop (e.g. before the server starts).
+    Args:
+        coordinates: a list of (origin longitude, origin latitude, destination longitude, destination latitude).
+        cache (RouteCache): the route cache, None to always fetch the routes.
+    Raises:
+        RouteFetchError: if some routes are neither cached nor can be fetched. The routes that were fetched are
+            cached all the same, so that a later run only fetches the rest.
+    """
+    routes = cache.get_many(profile, coordinates) if cache is not None else {}
+    missing = list(dict.fromkeys(c for c in coordinates if c not in routes))
+    if missing:
+        print(f"Fetching {len(missing)} routes ({len(routes)} cached) from {base_url}")
+        try:
+            fetched = asyncio.run(fetch_routes(missing, base_url, profile, max_concurrent_requests))
+        except RouteFetchError as error:
+            if cache is not None:
+                cache.put_many(profile, error.fetched)
+            where = f"in {cache.path}" if cache is not None else "without a route cache"
+            raise RouteFetchError(f"{error} ({len(routes) + len(error.fetched)} of {len(routes) + len(missing)} routes "
+                                  f"are available {where}). Point the base URL to a reachable OSRM server, or fill the "
+                                  f"route cache with cache_local_routes.", error.fetched, error.errors) from None
+        if cache is not None:
+            cache.put_many(profile, fetched)
+        routes.update(fetched)
+    return routes
+
+# ---------------------------------------------------------
+
 def save_route(origin_name, origin_longitude, origin_latitude, dest_name, dest_longitude, dest_latitude, out_folder='instance_files/routes/'):
-    url = f"http://router.project-osrm.org/route/v1/driving/{origin_longitude},{origin_latitude};{dest_longitude},{dest_latitude}?geometries=geojson&overview=full"
+    url = route_url(origin_longitude, origin_latitude, dest_longitude, dest_latitude)
     contents = urllib.request.urlopen(url).read()
     contents = json.loads(contents)
     route = contents['routes'][0]
     with open(f"{out_folder}/{origin_name}_{dest_name}.geojson", 'w') as f:
         geojson.dump(route, f)
 
-def cache_local_routes(out_folder='instance_files/routes/'):
-    cities = pd.read_csv('./instance_files/cities.csv', header=0)
-    for i in range(len(cities)):
-        for j in range(len(cities)):
-            if i != j:
-                save_route(cities.iloc[i]['name'], cities.iloc[i]['lng'], cities.iloc[i]['lat'], cities.iloc[j]['name'], cities.iloc[j]['lng'], cities.iloc[j]['lat'], out_folder)
-
-
-get_route(4.3517, 50.8503, 3.2247, 51.2093)
\ No newline at end of file
+def cache_local_routes(cache_path=ROUTE_CACHE_PATH, cities_path='Server/instance_files/cities.csv', base_url=OSRM_BASE_URL):
+    """
+    Fill the route cache with the routes between every pair of cities.
+    """
+    cities = pd.read_csv(cities_path, header=0)
+    coordinates = [
+        (cities.iloc[i]['lng'], cities.iloc[i]['lat'], cities.iloc[j]['lng'], cities.iloc[j]['lat'])
+        for i in range(len(cities)) for j in range(len(cities)) if i != j
+    ]
+    cache = RouteCache(cache_path)
+    try:
+        get_routes(coordinates, cache, base_url)
+    finally:
+        cache.close()
@@ -0,0 +1,188 @@
+import heapq
+import math
+from abc import ABC, abstractmethod
+from itertools import count
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from common import Event
+
+# An entry in a scheduler is (timestamp, priority, sequence, event). The sequence number is unique and increasing,
+# so events with the same timestamp and priority are returned in the order in which they were scheduled,
+# and the Event objects themselves are never compared.
+SchedulerEntry = Tuple[float, int, int, Event]
+
+
+class EventScheduler(ABC):
+    """
+    Interface of the event schedulers used by the environment.
+    Events are returned ordered by (timestamp, priority, sequence), where a lower priority value is processed first
+    and the sequence number is the insertion order of the event.
+
+    The schedulers are not thread-safe, the environment is the only producer and consumer of its events.
+    """
+    def __init__(self):
+        self._sequence = count()
+
+    def _entry(self, event: Event) -> SchedulerEntry:
+        return (event.timestamp, event.priority, next(self._sequence), event)
+
+    @abstractmethod
+    def put(self, event: Event):
+        """
+        Add an event to the queue.
+        """
+
+    def put_many(self, events: Iterable[Event]):
+        for event in events:
+            self.put(event)
+
+    @abstractmethod
+    def get(self) -> Event:
+        """
+        Remove and return the next event.
+        """
+
+    @abstractmethod
+    def peek(self) -> Event:
+        """
+        The next event, without removing it. None if the queue is empty.
+        """
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """
+        The number of events in the queue.
+        """
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[Event]:
+        """
+        The events of the queue, in no particular order.
+        """
+
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    def qsize(self) -> int:
+        return len(self)
+
+    def print_all_events(self):
+        print("Events in the queue:")
+        for event in sorted(self, key=lambda event: (event.timestamp, event.priority)):
+            print(event)
+
+
+class HeapEventQueue(EventScheduler):
+    """
+    Binary heap scheduler built on heapq, without the locking of queue.PriorityQueue.
+    Bulk loading with put_many appends the events and restores the heap invariant with a single heapify.
+    """
+    def __init__(self):
+        super().__init__()
+        self._heap: List[SchedulerEntry] = []
+
+    def put(self, event: Event):
+        heapq.heappush(self._heap, self._entry(event))
+
+    def put_many(self, events: Iterable[Event]):
+        self._heap.extend(self._entry(event) for event in events)
+        heapq.heapify(self._heap)
+
+    def get(self) -> Event:
+        return heapq.heappop(self._heap)[3]
+
+    def peek(self) -> Event:
+        if not self._heap:
+            return None
+        return self._heap[0][3]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __iter__(self) -> Iterator[Event]:
+        return (entry[3] for entry in self._heap)
+
+
+class CalendarEventQueue(EventScheduler):
+    """
+    Bucketed calendar queue for runs with an integer step size.
+    An event with timestamp t is stored in bucket ceil(t / bucket_width), i.e. in the bucket of the step in which it
+    is processed. Only the indices of the non-empty buckets are kept in a heap, and each bucket is a small heap of its
+    own, so the cost of an operation depends on the number of events per step instead of the total number of events.
+    """
+    def __init__(self, bucket_width: int = 1):
+        super().__init__()
+        if bucket_width <= 0 or int(bucket_width) != bucket_width:
+            raise ValueError(f"The bucket width of a calendar queue must be a positive integer, got {bucket_width}")
+        self.bucket_width = int(bucket_width)
+        self._buckets: Dict[int, List[SchedulerEntry]] = {}
+        self._bucket_heap: List[int] = []
+        self._size = 0
+
+    def _bucket_index(self, timestamp: float) -> int:
+        return math.ceil(timestamp / self.bucket_width)
+
+    def put(self, event: Event):
+        index = self._bucket_index(event.timestamp)
+        bucket = self._buckets.get(index)
+        if bucket is None:
+            bucket = self._buckets[index] = []
+            heapq.heappush(self._bucket_heap, index)
+        heapq.heappush(bucket, self._entry(event))
+        self._size += 1
+
+    def put_many(self, events: Iterable[Event]):
+        touched = set()
+        for event in events:
+            index = self._bucket_index(event.timestamp)
+            bucket = self._buckets.get(index)
+            if bucket is None:
+                bucket = self._buckets[index] = []
+                self._bucket_heap.append(index)
+            bucket.append(self._entry(event))
+            touched.add(index)
+            self._size += 1
+        for index in touched:
+            heapq.heapify(self._buckets[index])
+        heapq.heapify(self._bucket_heap)
+
+    def get(self) -> Event:
+        index = self._bucket_heap[0]
+        bucket = self._buckets[index]
+        entry = heapq.heappop(bucket)
+        if not bucket:
+            del self._buckets[index]
+            heapq.heappop(self._bucket_heap)
+        self._size -= 1
+        return entry[3]
+
+    def peek(self) -> Event:
+        if not self._bucket_heap:
+            return None
+        return self._buckets[self._bucket_heap[0]][0][3]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Event]:
+        return (entry[3] for bucket in self._buckets.values() for entry in bucket)
+
+# ---------------------------------------------------------
+
+SCHEDULERS = {
+    "heap": HeapEventQueue,
+    "calendar": CalendarEventQueue,
+}
+
+def make_event_queue(scheduler: str = "heap", step_size: int = 1) -> EventScheduler:
+    """
+    Create an event scheduler by name.
+    Args:
+        scheduler (str): "heap" for the binary heap, "calendar" for the bucketed calendar queue.
+        step_size (int): step size of the simulation, used as the bucket width of the calendar queue.
+    """
+    if scheduler not in SCHEDULERS:
+        raise ValueError(f"Unknown scheduler: {scheduler}")
+    if scheduler == "calendar":
+        return CalendarEventQueue(bucket_width=step_size)
+    return HeapEventQueue()
@@ -1,16 +1,73 @@
 from dataclasses import asdict
+import argparse
+import cProfile
+import hashlib
+import pstats
 import tornado
+import tornado.locks
+import tornado.websocket
 import asyncio
 import json
 import random
+import os
+import sys
+import time
+from typing import Dict, Optional, Tuple
 from network import build_network
-from environment import build_environment
+from router import RouteFetchError
+from environment import build_environment, read_instance, FIXED_STEP, NEXT_EVENT
 from data_logger import *
+from snapshot_codec import (SNAPSHOT_CONTENT_TYPE, accepts_binary, encode_snapshot, encode_response,
+                            encode_keyframe, encode_delta_frame, choose_content_encoding, compress_body)
+from frames import FrameBuffer, SimulationWorker, FRAME_BUFFER_SIZE, RUN_AHEAD
+from instrumentation import Instrumentation, INSTRUMENTATION_FILE_PATH
+from tracing import Tracer, ConsoleSink, NdjsonSink, LEVELS
 import pandas as pd
 import numpy as np
 
 # ---------------------------------------------------------
 
+# Instance simulated by the server (see sweep.py to run other instances headless)
+INSTANCE_FILES = {
+    "demand_file": 'Server/instance_files_test/param_demand_test.csv',
+    "nodes_file": 'Server/instance_files_test/param_nodes_test.csv',
+    "dist_file": 'Server/instance_files_test/param_dist_test.csv',
+    "vehicles_file": 'Server/instance_files_test/param_vehicles_test.csv',
+    "services_file": 'Server/instance_files_test/param_services_test.csv',
+}
+
+# Write the events and states to logs/*.ndjson during run_simulation instead of keeping them in memory
+STREAM_LOGS = True
+COMPRESS_LOGS = False
+
+# /frames WebSocket: frames per second when the client does not choose a rate, and the maximum number of frames
+# sent to a client that it did not acknowledge yet
+DEFAULT_FRAME_RATE = 1.0
+MAX_FRAMES_IN_FLIGHT = 8
+
+# Browsers keep /setup but revalidate it on every load (answered with 304 Not Modified while the network is the same)
+SETUP_CACHE_CONTROL = "public, no-cache"
+# Serialized /setup responses by level of detail
+setup_responses = {}
+
+# Seconds a request waits for the simulation worker to produce a frame
+FRAME_WAIT_TIMEOUT = 10.0
+
+# Frames computed by the simulation worker (see start_simulation_worker), shared by all the endpoints
+frame_buffer = FrameBuffer(FRAME_BUFFER_SIZE)
+simulation_worker = None
+# Next frame served by /snapshot without a step, and the last frame sent to a client (used by /node and /link)
+snapshot_cursor = 0
+last_served_frame = -1
+# Copy of the instrumentation published by the simulation worker with every frame (see publish_debug_stats), so that
+# /debug/stats does not read the counters while the worker updates them
+debug_stats = None
+
+# pstats output of a run with --profile
+PROFILE_FILE_PATH = os.path.join(FOLDER_NAME, "profile.pstats")
+
+# ---------------------------------------------------------
+
 class SetupHandler(tornado.web.RequestHandler):
     """
     Endpoint that handles setting up the simulation. Provides information such as the nodes and links in the network
@@ -23,18 +80,23 @@ class SetupHandler(tornado.web.RequestHandler):
 
     
     def get(self):
-        # Prepare the data to send (only nodes and links)
-        nodes_data = [asdict(node) for node in network.nodes]  # Convert nodes to dict
-        links_data = [asdict(link) for link in network.links]  # Convert links to dict
-        
-        # Combine into a response
-        response = {
-            "nodes": nodes_data,
-            "links": links_data
-        }
-
-        # Send the response as JSON
-        self.write(json.dumps(response))
+        # ?lod=k simplifies the geometry of the links with the k-th tolerance of network.lod_tolerances (0: full detail,
+        # -1: coarsest)
+        try:
+            response = setup_response(int(self.get_argument("lod", 0)))
+        except ValueError as error:
+            raise tornado.web.HTTPError(400, reason=str(error))
+
+        # The network does not change after initialize(), the responses are serialized once (see precompute_setup)
+        # and clients revalidate their copy with If-None-Match
+        body, headers = response.select(self.request.headers.get("Accept-Encoding"))
+        for name, value in headers.items():
+            self.set_header(name, value)
+        self.set_header("Cache-Control", SETUP_CACHE_CONTROL)
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        self.write(body)
 
 class NodeHandler(tornado.web.RequestHandler):
     """
@@ -49,7 +111,8 @@ class NodeHandler(tornado.web.RequestHandler):
     def get(self):
         # Get the node_id from the query parameters, using a default if it's not provided
         node_id = int(self.get_argument("node_id", None))
-        vehicles = [asdict(vehicle) for vehicle in network.node_vehicles[node_id]]
+        vehicle_matrices = frame_vehicle_matrices(self.get_argument("step", None))
+        vehicles = [asdict(vehicle) for vehicle in network.vehicles_at_node(node_id, vehicle_matrices)]
         self.write(json.dumps(vehicles))
 
 class LinkHandler(tornado.web.RequestHandler):
@@ -66,10 +129,44 @@ class LinkHandler(tornado.web.RequestHandler):
         # Get the node_id from the query parameters, using a default if it's not provided
         link_id = int(self.get_argument("link_id", None))
 
-        vehicles = [asdict(vehicle) for vehicle in network.link_vehicles[link_id]]
+        vehicle_matrices = frame_vehicle_matrices(self.get_argument("step", None))
+        vehicles = [asdict(vehicle) for vehicle in network.vehicles_on_link(link_id, vehicle_matrices)]
 
         self.write(json.dumps(vehicles))
 
+class DebugStatsHandler(tornado.web.RequestHandler):
+    """
+    Request handler that returns the counters and timings of the instrumentation (see instrumentation.py), while the
+    simulation runs.
+    """
+    def set_default_headers(self):
+        # Enable CORS by setting appropriate headers
+        self.set_header("Access-Control-Allow-Origin", "*")
+        self.set_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
+        self.set_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
+
+    def get(self):
+        self.set_header("Content-Type", "application/json")
+        if debug_stats is None:
+            self.write(json.dumps({"enabled": False}))
+            return
+        self.write(json.dumps({"enabled": True, **debug_stats}))
+
+class DebugTraceHandler(tornado.web.RequestHandler):
+    """
+    Request handler that returns the ring buffer of the tracer of the event loop (see tracing.py) as
+    newline-delimited JSON, oldest record first.
+    """
+    def set_default_headers(self):
+        # Enable CORS by setting appropriate headers
+        self.set_header("Access-Control-Allow-Origin", "*")
+        self.set_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
+        self.set_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
+
+    def get(self):
+        self.set_header("Content-Type", "application/x-ndjson")
+        self.write("".join(json.dumps(record) + "\n" for record in environment.tracer.records()))
+
 class SnapshotHandler(tornado.web.RequestHandler):
     def set_default_headers(self):
         # Enable CORS by setting appropriate headers
@@ -77,15 +174,158 @@ class SnapshotHandler(tornado.web.RequestHandler):
         self.set_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
         self.set_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
 
-    def get(self): 
+    async def get(self): 
         # randomize_snapshot()
-        get_snapshot()
-        
-        link_intensites =  [ sum([vehicle.quantity for vehicle in vehicles]) for vehicles in network.link_vehicles] 
-        response = {
-            "link_intensities": link_intensites
-        }
-        self.write(json.dumps(response))
+        # ?step=k returns the frame of step k from the frame buffer (scrubbing, rewinding), without a step every
+        # request returns the next frame, as if the simulation advanced by one step
+        global snapshot_cursor
+        step = self.get_argument("step", None)
+        if step is None:
+            frame = snapshot_cursor
+            if await wait_for_frame(frame):
+                snapshot_cursor += 1
+            else:
+                frame = frame_buffer.end - 1 # the simulation is finished, keep returning the last frame
+            frame = max(frame, frame_buffer.start)
+        else:
+            step = float(step)
+            while not frame_buffer.finished and (frame_buffer.last_step() is None or frame_buffer.last_step() < step):
+                if not await wait_for_frame(frame_buffer.end):
+                    break
+            try:
+                frame = frame_buffer.frame_of_step(step)
+            except IndexError as error:
+                raise tornado.web.HTTPError(404, reason=str(error))
+        if frame < 0:
+            raise tornado.web.HTTPError(404, reason="The simulation produced no frames")
+        mark_served(frame)
+        step, link_intensities = frame_buffer.get(frame)
+
+        # Clients that send "Accept: application/octet-stream" (or ?format=binary) get the binary format of
+        # snapshot_codec, the others get the JSON response
+        if self.get_argument("format", None) == "binary" or accepts_binary(self.request.headers.get("Accept")):
+            self.set_header("Content-Type", SNAPSHOT_CONTENT_TYPE)
+            body = encode_snapshot(step, link_intensities)
+        else:
+            self.set_header("Content-Type", "application/json")
+            link_intensites = link_intensities.tolist()
+            response = {
+                "step": step,
+                "link_intensities": link_intensites
+            }
+            body = json.dumps(response).encode()
+
+        body, headers = encode_response(body, self.request.headers.get("Accept-Encoding"))
+        for name, value in headers.items():
+            self.set_header(name, value)
+        self.write(body)
+
+class FramesHandler(tornado.websocket.WebSocketHandler):
+    """
+    WebSocket that pushes the frames of the simulation to the client, instead of the client polling /snapshot.
+    The client controls the stream with JSON messages:
+        - {"type": "start", "from_frame": k, "rate": r}: stream from frame k (the last frame sent to a client if k is
+          null) at r frames per second (as fast as the client keeps up if r <= 0). The first frame sent is a keyframe,
+          a frame that was dropped from the frame buffer is replaced by the oldest frame of the buffer.
+        - {"type": "rate", "rate": r}, {"type": "pause"}, {"type": "resume"}
+        - {"type": "ack", "frame": k}: frame k was rendered. At most MAX_FRAMES_IN_FLIGHT frames are sent ahead of the
+          last acknowledged frame, and every frame waits for the previous one to be flushed to the socket.
+    Frames are binary messages in the frame format of snapshot_codec: a keyframe, then the changed links of every frame.
+    When the simulation has no more events, a {"type": "end", "frames": n} text message is sent and the stream pauses.
+    """
+    def check_origin(self, origin):
+        # Same policy as the CORS headers of the HTTP endpoints, the visualizer is opened from the file system
+        return True
+
+    def open(self):
+        self.next_frame = 0
+        self.acknowledged = -1
+        self.rate = DEFAULT_FRAME_RATE
+        self.paused = True
+        self.send_keyframe = True
+        self.wake = asyncio.Event()
+        self.stream_task = None
+
+    def on_message(self, message):
+        try:
+            command = json.loads(message)
+            kind = command["type"]
+        except (ValueError, KeyError, TypeError):
+            self.write_message(json.dumps({"type": "error", "message": f"Invalid message: {message}"}))
+            return
+
+        if kind == "start":
+            from_frame = command.get("from_frame")
+            if from_frame is None:
+                from_frame = max(last_served_frame, 0)
+            self.next_frame = int(from_frame)
+            self.acknowledged = self.next_frame - 1
+            self.rate = float(command.get("rate", self.rate))
+            self.send_keyframe = True
+            self.paused = False
+            if self.stream_task is None:
+                self.stream_task = asyncio.ensure_future(self.stream())
+        elif kind == "rate":
+            self.rate = float(command["rate"])
+        elif kind == "pause":
+            self.paused = True
+        elif kind == "resume":
+            self.paused = False
+        elif kind == "ack":
+            self.acknowledged = max(self.acknowledged, int(command["frame"]))
+        else:
+            self.write_message(json.dumps({"type": "error", "message": f"Unknown message type: {kind}"}))
+            return
+        self.wake.set()
+
+    def on_close(self):
+        if self.stream_task is not None:
+            self.stream_task.cancel()
+
+    async def wait_for_message(self, timeout: float = None):
+        try:
+            await asyncio.wait_for(self.wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.wake.clear()
+
+    async def stream(self):
+        next_send_time = time.monotonic()
+        try:
+            while True:
+                if self.paused or self.next_frame - self.acknowledged > MAX_FRAMES_IN_FLIGHT:
+                    await self.wait_for_message()
+                    continue
+                if self.rate > 0:
+                    # Frames are sent on a fixed schedule, a rate change or a late frame restarts the schedule
+                    delay = next_send_time - time.monotonic()
+                    if delay > 0:
+                        await self.wait_for_message(delay)
+                        continue
+                    next_send_time = max(next_send_time + 1 / self.rate, time.monotonic())
+
+                frame = self.next_frame
+                if not await wait_for_frame(frame):
+                    if frame_buffer.finished:
+                        self.paused = True
+                        await self.write_message(json.dumps({"type": "end", "frames": frame_buffer.end}))
+                    continue
+                # The worker may drop frames from the buffer at any time, the frame and its previous frame are only
+                # checked together with the read of the update
+                frame, step, keyframe, link_ids, values = frame_buffer.update(frame, self.send_keyframe)
+                if keyframe:
+                    message = encode_keyframe(frame, step, values)
+                    self.send_keyframe = False
+                else:
+                    message = encode_delta_frame(frame, step, link_ids, values)
+                mark_served(frame)
+                self.next_frame = frame + 1
+                await self.write_message(message, binary=True)
+        except tornado.web.HTTPError as error:
+            # The simulation stopped with an error
+            await self.write_message(json.dumps({"type": "error", "message": error.reason}))
+        except tornado.websocket.WebSocketClosedError:
+            pass
 
 # ---------------------------------------------------------
 
@@ -93,11 +333,16 @@ def make_app():
     return tornado.web.Application([
         (r"/setup", SetupHandler),
         (r"/snapshot", SnapshotHandler),
+        (r"/frames", FramesHandler),
         (r"/node", NodeHandler),
         (r"/link", LinkHandler),
+        (r"/debug/stats", DebugStatsHandler),
+        (r"/debug/trace", DebugTraceHandler),
     ])
 
 async def main():
+    precompute_setup()
+    start_simulation_worker()
     app = make_app()
     app.listen(8888)
     await asyncio.Event().wait()
@@ -134,20 +379,14 @@ def read_data_network():
     return nodes_df, connectivity_df
 
 def read_data_environment():
-    requests_df = pd.read_csv('Server/instance_files_test/param_demand_test.csv')
-    nodes_df = pd.read_csv('Server/instance_files_test/param_nodes_test.csv')
-    vehicles_df = pd.read_csv('Server/instance_files_test/param_vehicles_test.csv')
-
-    with open('Server/instance_files_test/param_dist_test.csv') as f:
-        f.readline().strip().split(',')
-        dist_matrix = pd.read_csv(f, header=None).values
+    requests_df, nodes_df, dist_matrix, vehicles_df, _ = read_instance(**INSTANCE_FILES)
 
     print("Data read successfully")
 
     return requests_df, nodes_df, dist_matrix, vehicles_df
 
 def read_data_services():
-    services_df = pd.read_csv('Server/instance_files_test/param_services_test.csv')
+    services_df = pd.read_csv(INSTANCE_FILES["services_file"])
     return services_df
 
 def randomize_snapshot():
@@ -168,19 +407,147 @@ def randomize_snapshot():
     
     network.update_vehicles({"Empty Truck": empty_trucks, "Container": containers})
 
+class PrecomputedResponse:
+    """
+    A response body that never changes, serialized and compressed once.
+    Every encoding of the body has its own strong ETag (a hash of the uncompressed body, with the encoding as suffix),
+    so that caches can revalidate it with If-None-Match.
+    """
+    def __init__(self, body: bytes, content_type: str = "application/json"):
+        self.content_type = content_type
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.bodies = {None: body, "gzip": compress_body(body, "gzip"), "deflate": compress_body(body, "deflate")}
+        self.etags = {encoding: f'"{digest}"' if encoding is None else f'"{digest}-{encoding}"' for encoding in self.bodies}
+
+    def select(self, accept_encoding: str) -> Tuple[bytes, Dict[str, str]]:
+        """
+        Returns the body to send and the headers to set on the response.
+        """
+        encoding = choose_content_encoding(accept_encoding)
+        headers = {"Content-Type": self.content_type, "Vary": "Accept-Encoding", "ETag": self.etags[encoding]}
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return self.bodies[encoding], headers
+
+def build_setup(lod: int) -> PrecomputedResponse:
+    links_data = network.links_at_lod(lod)
+    # Prepare the data to send (only nodes and links)
+    nodes_data = [asdict(node) for node in network.nodes]  # Convert nodes to dict
+    
+    # Combine into a response
+    response = {
+        "nodes": nodes_data,
+        "links": links_data,
+        "lod": lod % len(network.lod_tolerances),
+        "lod_tolerances": list(network.lod_tolerances)
+    }
+    return PrecomputedResponse(json.dumps(response).encode())
+
+def precompute_setup():
+    """
+    Serialize and compress the /setup responses of all the levels of detail, once the network is built.
+    """
+    setup_responses.clear()
+    for lod in range(len(network.lod_tolerances)):
+        setup_responses[lod] = build_setup(lod)
+
+def setup_response(lod: int) -> PrecomputedResponse:
+    if not -len(network.lod_tolerances) <= lod < len(network.lod_tolerances):
+        raise ValueError(f"Level of detail must be between {-len(network.lod_tolerances)} and {len(network.lod_tolerances) - 1}, got {lod}")
+    lod %= len(network.lod_tolerances)
+    if lod not in setup_responses:
+        setup_responses[lod] = build_setup(lod)
+    return setup_responses[lod]
+
+def read_frame():
+    vehicle_matrices = {name: quantities.copy() for name, quantities in environment.vehicle_matrices.items()}
+    publish_debug_stats()
+    return environment.time, network.link_intensities, vehicle_matrices
+
+def publish_debug_stats():
+    """
+    Publish a copy of the instrumentation of the environment for /debug/stats. Called by the thread that steps the
+    environment, the handler only swaps in the new copy.
+    """
+    global debug_stats
+    if environment.instrumentation is not None:
+        debug_stats = {"time": environment.time, **environment.instrumentation.to_dict()}
+
+def start_simulation_worker(capacity: int = FRAME_BUFFER_SIZE, run_ahead: int = RUN_AHEAD):
+    """
+    Run the simulation in a background thread that fills the frame buffer served by the endpoints.
+    Args:
+        capacity (int): number of frames kept in memory, i.e. how far back clients can rewind.
+        run_ahead (int): number of frames computed ahead of the clients.
+    """
+    global frame_buffer, simulation_worker, snapshot_cursor, last_served_frame, frame_produced, debug_stats
+    frame_buffer = FrameBuffer(capacity)
+    # The requests waiting for a frame wait on the IOLoop, woken up by the worker thread (see wait_for_frame)
+    frame_produced = tornado.locks.Condition()
+    io_loop = tornado.ioloop.IOLoop.current()
+    frame_buffer.add_listener(lambda: io_loop.add_callback(frame_produced.notify_all))
+    snapshot_cursor = 0
+    last_served_frame = -1
+    debug_stats = None
+    publish_debug_stats()
+    simulation_worker = SimulationWorker(frame_buffer, get_snapshot, read_frame, run_ahead)
+    simulation_worker.start()
+
+async def wait_for_frame(frame: int) -> bool:
+    """
+    Wait (without blocking the IOLoop) until the simulation worker produced a frame. The worker notifies the IOLoop
+    of every frame, so a waiting request holds no thread.
+    Returns False if the simulation finished before the frame, or if the frame was not produced in time.
+    """
+    frame_buffer.request(frame)
+    deadline = tornado.ioloop.IOLoop.current().time() + FRAME_WAIT_TIMEOUT
+    while frame >= frame_buffer.end and not frame_buffer.finished:
+        if not await frame_produced.wait(timeout=deadline):
+            break
+    if frame >= frame_buffer.end and frame_buffer.error is not None:
+        raise tornado.web.HTTPError(500, reason=f"The simulation stopped with an error: {frame_buffer.error!r}")
+    return frame < frame_buffer.end
+
+def mark_served(frame: int):
+    global last_served_frame
+    last_served_frame = frame
+
+def frame_vehicle_matrices(step: str = None):
+    """
+    The vehicle matrices of the frame of a step, or of the last frame sent to a client.
+    """
+    if step is not None:
+        try:
+            frame = frame_buffer.frame_of_step(float(step))
+        except IndexError as error:
+            raise tornado.web.HTTPError(404, reason=str(error))
+    elif last_served_frame >= frame_buffer.start:
+        frame = last_served_frame
+    else:
+        return None
+    return frame_buffer.get_vehicle_matrices(frame)
+
 def get_snapshot():
     vehicle_matrix = environment.step()
     if vehicle_matrix is not None:
-        network.update_vehicles(vehicle_matrix)
+        network.update_vehicles(vehicle_matrix, changes=environment.take_matrix_changes())
         return True
     else:
         return False
 
 # ---------------------------------------------------------
 
-def initialize():
+def initialize(instrumentation: Instrumentation = None, tracer: Tracer = None, decision_batch_size: int = 1,
+               decision_processes: int = 0, decision_deadline: float = 0.0, decision_wait: Optional[float] = 0.0):
     """
     Initialize the simulation by reading the data and creating the network and environment objects.
+    Args:
+        instrumentation (Instrumentation): times the environment and the updates of the network, None to run
+            without instrumentation.
+        tracer (Tracer): the tracer of the event loop, None for the default one.
+        decision_batch_size (int): maximum number of requests of a time step decided together (0: all of them).
+        decision_processes (int), decision_deadline (float), decision_wait (float): decision making in worker
+            processes, see build_environment.
     """
     nodes_df_network, connectivity_df = read_data_network()
     requests_df, nodes_df_env, dist_matrix, vehicles_df = read_data_environment()
@@ -189,21 +556,35 @@ def initialize():
     # print("#########################")
     # print(requests_df)
     step_size = 1
+    # NEXT_EVENT skips the steps without events, FIXED_STEP produces every frame for the visualizer
+    advance_mode = FIXED_STEP
 
     network = build_network(nodes_df_network, connectivity_df)
-    environment = build_environment(requests_df, nodes_df_env, dist_matrix, vehicles_df, services_df, step_size)
-
-    create_folder_and_file(FOLDER_NAME, EVENT_FILE, EVENTS_FILE_PATH)
-    create_folder_and_file(FOLDER_NAME, ENVIRONMENT_STATES_FILE, ENVIRONMENT_STATES_FILE_PATH)
-    create_folder_and_file(FOLDER_NAME, VEHICLE_STATES_FILE, VEHICLE_STATES_FILE_PATH)
+    environment = build_environment(requests_df, nodes_df_env, dist_matrix, vehicles_df, services_df, step_size,
+                                    advance_mode=advance_mode, instrumentation=instrumentation,
+                                    tracer=tracer, decision_batch_size=decision_batch_size,
+                                    decision_processes=decision_processes, decision_deadline=decision_deadline,
+                                    decision_wait=decision_wait)
+    if instrumentation is not None:
+        instrumentation.attach_network(network)
+
+    # The streamed logs are written to their own files (see open_log_streams), the JSON logs are not written then
+    if not STREAM_LOGS:
+        create_folder_and_file(FOLDER_NAME, EVENT_FILE, EVENTS_FILE_PATH)
+        create_folder_and_file(FOLDER_NAME, ENVIRONMENT_STATES_FILE, ENVIRONMENT_STATES_FILE_PATH)
+        create_folder_and_file(FOLDER_NAME, VEHICLE_STATES_FILE, VEHICLE_STATES_FILE_PATH)
     create_folder_and_file(FOLDER_NAME, CALCULATIONS_FILE, CALCULATIONS_FILE_PATH)
 
     return network, environment
 
 def run_simulation():
     # asyncio.run(main()) # for debug
+    if STREAM_LOGS:
+        open_log_streams(environment.event_logger, environment.state_logger, 
+                         compress=COMPRESS_LOGS, flush_interval=FLUSH_INTERVAL)
     while get_snapshot():
         pass
+    environment.tracer.close()
     print("Simulation completed")
     
 def save_results():
@@ -213,6 +594,9 @@ def save_results():
     environment.state_logger.log_states()
     # Save overall calculations
     environment.statistics_tracker.log_statistics()
+    # Save the timings, next to the calculations
+    if environment.instrumentation is not None:
+        environment.instrumentation.save(INSTRUMENTATION_FILE_PATH)
     print("Results saved successfully")
 
 def send_results():
@@ -220,10 +604,54 @@ def send_results():
 
 # ---------------------------------------------------------
 
-if __name__ == "__main__":
+def parse_arguments(arguments=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the simulation headless and save its results.")
+    parser.add_argument("--instrument", action="store_true",
+                        help=f"time the event handlers and hot sections, saved to {INSTRUMENTATION_FILE_PATH}")
+    parser.add_argument("--profile", nargs="?", const=PROFILE_FILE_PATH, default=None, metavar="PATH",
+                        help=f"run the simulation under cProfile and save the pstats output (default: {PROFILE_FILE_PATH})")
+    parser.add_argument("--trace-level", default="INFO", type=str.upper, choices=list(LEVELS),
+                        help="lowest level of the trace records of the event loop")
+    parser.add_argument("--trace-console", action="store_true", help="print the trace records")
+    parser.add_argument("--trace-file", default=None, metavar="PATH", help="write the trace records as NDJSON")
+    parser.add_argument("--trace-sample", type=int, default=1, metavar="N",
+                        help="keep one in every N trace records below WARNING")
+    parser.add_argument("--decision-batch", type=int, default=1, metavar="K",
+                        help="decide up to K requests that arrive in the same step together (0: all of them)")
+    parser.add_argument("--decision-processes", type=int, default=0, metavar="N",
+                        help="solve the decisions in N worker processes while the simulation goes on")
+    parser.add_argument("--decision-deadline", type=float, default=0.0, metavar="T",
+                        help="simulated time after which the plans of the worker processes are applied")
+    parser.add_argument("--decision-wait", type=float, default=0.0, metavar="SECONDS",
+                        help="wall-clock seconds to wait for a late solve at its deadline before falling back "
+                             "(default: fall back at once)")
+    return parser.parse_args(arguments)
+
+def make_tracer(arguments: argparse.Namespace) -> Tracer:
+    sinks = []
+    if arguments.trace_console:
+        sinks.append(ConsoleSink())
+    if arguments.trace_file is not None:
+        sinks.append(NdjsonSink(arguments.trace_file))
+    return Tracer(arguments.trace_level, sinks, sample_every=arguments.trace_sample)
 
-    network, environment = initialize()
-    run_simulation()
+if __name__ == "__main__":
+    arguments = parse_arguments()
+
+    try:
+        network, environment = initialize(Instrumentation() if arguments.instrument else None, make_tracer(arguments),
+                                          arguments.decision_batch, arguments.decision_processes,
+                                          arguments.decision_deadline, arguments.decision_wait)
+    except RouteFetchError as error:
+        sys.exit(f"Could not build the network: {error}")
+    if arguments.profile is not None:
+        profiler = cProfile.Profile()
+        profiler.runcall(run_simulation)
+        profiler.dump_stats(arguments.profile)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+        print(f"Profile saved to {arguments.profile}")
+    else:
+        run_simulation()
     save_results()
     send_results()
     
\ No newline at end of file
@@ -0,0 +1,134 @@
+import bisect
+import numpy as np
+from typing import Dict, List, Tuple
+
+from vehicles import Service, ServiceStore
+
+class ServiceIndex:
+    """
+    Index of the present services by origin (and by origin and destination) and departure time, so that the decision
+    making finds the candidate services of a request without scanning the whole timetable.
+
+    The services leaving node o that are not full are kept sorted by departure time, as the parallel lists
+    origin_departures[o] and origin_services[o] (departure times and indices in the present services). The services
+    from o to d are kept in the same way in pair_departures[(o, d)] and pair_services[(o, d)].
+    A query finds its departure window with two binary searches in the lists of its origin (or pair), and filters the
+    services of the window by remaining capacity. A service is removed from the lists when it becomes full (see
+    reserve), so a query costs O(log n + m), where m is the number of services in the window that are not full: for a
+    min_capacity of at most 1 every one of them is a hit, and the query runs in O(log n + hits).
+
+    The remaining capacity of a service is its capacity minus the containers reserved on it by the plans applied so
+    far. The timetable is fixed once the environment is built.
+    """
+    def __init__(self, services: ServiceStore, number_of_nodes: int):
+        self.services = services
+        self.number_of_nodes = number_of_nodes
+        self.reserved = np.zeros(len(services), dtype=np.int64)
+        self._build()
+
+    def _build(self):
+        """
+        Build the lists of the services that are not full.
+        """
+        origins = self.services.origin.astype(np.int64)
+        destinations = self.services.destination.astype(np.int64)
+        departures = self.services.departure_time
+        order = np.lexsort((departures, destinations, origins))
+        order = order[self.remaining_capacity(order) > 0]
+
+        self.origin_departures: List[List[float]] = [[] for _ in range(self.number_of_nodes)]
+        self.origin_services: List[List[int]] = [[] for _ in range(self.number_of_nodes)]
+        by_origin = order[np.lexsort((departures[order], origins[order]))]
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(origins[by_origin], minlength=self.number_of_nodes))))
+        for origin in np.flatnonzero(np.diff(bounds)).tolist():
+            services = by_origin[bounds[origin]:bounds[origin + 1]]
+            self.origin_departures[origin] = departures[services].tolist()
+            self.origin_services[origin] = services.tolist()
+
+        self.pair_departures: Dict[Tuple[int, int], List[float]] = {}
+        self.pair_services: Dict[Tuple[int, int], List[int]] = {}
+        pairs = origins[order] * self.number_of_nodes + destinations[order]
+        starts = np.flatnonzero(np.diff(pairs, prepend=-1))
+        for start, end in zip(starts.tolist(), np.append(starts[1:], len(order)).tolist()):
+            services = order[start:end]
+            pair = (int(origins[services[0]]), int(destinations[services[0]]))
+            self.pair_departures[pair] = departures[services].tolist()
+            self.pair_services[pair] = services.tolist()
+
+    def __len__(self) -> int:
+        return len(self.services)
+
+    def remaining_capacity(self, indices: np.ndarray) -> np.ndarray:
+        return self.services.capacity[indices] - self.reserved[indices]
+
+    def reserve(self, service: Service, containers: int):
+        """
+        Record the containers of a plan on a service. Services that are not present services (generated by the
+        decision making) are not indexed and are ignored.
+        """
+        if service._store is self.services:
+            self._reserve(service.index, containers)
+
+    def _reserve(self, index: int, containers: int):
+        was_open = self.reserved[index] < self.services.capacity[index]
+        self.reserved[index] += containers
+        if was_open and self.reserved[index] >= self.services.capacity[index]:
+            departure = float(self.services.departure_time[index])
+            origin, destination = int(self.services.origin[index]), int(self.services.destination[index])
+            self._remove(self.origin_departures[origin], self.origin_services[origin], departure, index)
+            self._remove(self.pair_departures[(origin, destination)], self.pair_services[(origin, destination)],
+                         departure, index)
+
+    @staticmethod
+    def _remove(departures: List[float], services: List[int], departure: float, index: int):
+        position = bisect.bisect_left(departures, departure)
+        while services[position] != index:
+            position += 1
+        del departures[position]
+        del services[position]
+
+    def set_reserved(self, indices: np.ndarray, containers: np.ndarray):
+        """
+        Replace the reserved capacities by the given ones (of the given services, 0 for the others), as sent to the
+        decision workers.
+        """
+        reserved = np.zeros_like(self.reserved)
+        reserved[indices] = containers
+        increase = reserved - self.reserved
+        if (increase < 0).any():
+            self.reserved = reserved
+            self._build()
+            return
+        for index in np.flatnonzero(increase).tolist():
+            self._reserve(index, int(increase[index]))
+
+    def query(self, origin: int, earliest: float, latest: float, min_capacity: int = 0,
+              destination: int = None) -> np.ndarray:
+        """
+        The services from origin (to destination, if given) departing in [earliest, latest] with a remaining capacity
+        of at least min_capacity (full services are never returned).
+        Returns:
+            the indices of the services in the present services, in increasing departure time.
+        """
+        if not 0 <= origin < self.number_of_nodes:
+            raise ValueError(f"Origin {origin} out of range")
+        if destination is None:
+            departures, services = self.origin_departures[origin], self.origin_services[origin]
+        else:
+            if not 0 <= destination < self.number_of_nodes:
+                raise ValueError(f"Destination {destination} out of range")
+            departures = self.pair_departures.get((origin, destination), [])
+            services = self.pair_services.get((origin, destination), [])
+        first = bisect.bisect_left(departures, earliest)
+        last = bisect.bisect_right(departures, latest)
+        hits = np.array(services[first:last], dtype=np.int64)
+        if min_capacity > 1:
+            hits = hits[self.remaining_capacity(hits) >= min_capacity]
+        return hits
+
+    def query_services(self, origin: int, earliest: float, latest: float, min_capacity: int = 0,
+                       destination: int = None) -> List[Service]:
+        """
+        Same as query, with the services instead of their indices.
+        """
+        return [self.services[i] for i in self.query(origin, earliest, latest, min_capacity, destination).tolist()]
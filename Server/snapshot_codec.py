@@ -0,0 +1,147 @@
+import gzip
+import struct
+import zlib
+import numpy as np
+from typing import Dict, Tuple
+
+# ---------------------------------------------------------
+# Binary format of a snapshot, as sent by /snapshot to clients that accept application/octet-stream:
+#   header: the step as a little-endian float64 (the time of the environment, which need not be an integer),
+#           then 2 little-endian uint32 values (number of links, value type)
+#   body:   the link intensities as a little-endian Uint32Array (value type 0) or Float32Array (value type 1)
+# The header is 16 bytes, so the body is 4-byte aligned and can be viewed as a typed array without copying.
+# ---------------------------------------------------------
+
+SNAPSHOT_CONTENT_TYPE = "application/octet-stream"
+SNAPSHOT_HEADER = struct.Struct("<dII")
+
+UINT32 = 0
+FLOAT32 = 1
+VALUE_DTYPES = {
+    UINT32: np.dtype("<u4"),
+    FLOAT32: np.dtype("<f4"),
+}
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+def encode_snapshot(step: float, link_intensities: np.ndarray) -> bytes:
+    """
+    Encode the link intensities of a step in the binary snapshot format.
+    Integer intensities are sent as uint32, anything else as float32.
+    Args:
+        step (float): the time of the snapshot.
+        link_intensities (np.ndarray): the intensity of every link, indexed by link ID.
+    """
+    link_intensities = np.asarray(link_intensities)
+    value_type = value_type_of(link_intensities)
+    body = link_intensities.astype(VALUE_DTYPES[value_type], copy=False).tobytes()
+    return SNAPSHOT_HEADER.pack(float(step), link_intensities.size, value_type) + body
+
+def decode_snapshot(data: bytes) -> Tuple[float, np.ndarray]:
+    """
+    Decode a binary snapshot into (step, link intensities).
+    """
+    step, number_of_links, value_type = SNAPSHOT_HEADER.unpack_from(data)
+    if value_type not in VALUE_DTYPES:
+        raise ValueError(f"Unknown value type in snapshot header: {value_type}")
+    link_intensities = np.frombuffer(data, dtype=VALUE_DTYPES[value_type], count=number_of_links,
+                                     offset=SNAPSHOT_HEADER.size)
+    return step, link_intensities
+
+# ---------------------------------------------------------
+# Binary format of the frames pushed over the /frames WebSocket:
+#   header: 2 little-endian uint32 values (frame kind, frame number), the step as a little-endian float64, and 2
+#           little-endian uint32 values (number of entries, value type). The header is 24 bytes.
+#   body of a keyframe: the intensities of all the links (number of entries = number of links)
+#   body of a delta:    the IDs of the changed links as uint32, followed by their new intensities
+# ---------------------------------------------------------
+
+FRAME_HEADER = struct.Struct("<IIdII")
+
+KEYFRAME = 0
+DELTA_FRAME = 1
+
+def value_type_of(values: np.ndarray) -> int:
+    if np.issubdtype(values.dtype, np.integer):
+        if values.size and values.min() < 0:
+            raise ValueError("Integer link intensities must be non-negative to be sent as uint32")
+        return UINT32
+    return FLOAT32
+
+def encode_keyframe(frame: int, step: float, link_intensities: np.ndarray) -> bytes:
+    link_intensities = np.asarray(link_intensities)
+    value_type = value_type_of(link_intensities)
+    header = FRAME_HEADER.pack(KEYFRAME, frame, float(step), link_intensities.size, value_type)
+    return header + link_intensities.astype(VALUE_DTYPES[value_type], copy=False).tobytes()
+
+def encode_delta_frame(frame: int, step: float, link_ids: np.ndarray, values: np.ndarray) -> bytes:
+    values = np.asarray(values)
+    value_type = value_type_of(values)
+    header = FRAME_HEADER.pack(DELTA_FRAME, frame, float(step), len(link_ids), value_type)
+    return (header + np.asarray(link_ids).astype("<u4", copy=False).tobytes()
+            + values.astype(VALUE_DTYPES[value_type], copy=False).tobytes())
+
+def decode_frame(data: bytes) -> Tuple[int, int, float, np.ndarray, np.ndarray]:
+    """
+    Decode a frame into (kind, frame number, step, link IDs, values). The link IDs of a keyframe are None.
+    """
+    kind, frame, step, count, value_type = FRAME_HEADER.unpack_from(data)
+    if value_type not in VALUE_DTYPES:
+        raise ValueError(f"Unknown value type in frame header: {value_type}")
+    offset = FRAME_HEADER.size
+    link_ids = None
+    if kind == DELTA_FRAME:
+        link_ids = np.frombuffer(data, dtype="<u4", count=count, offset=offset)
+        offset += 4 * count
+    values = np.frombuffer(data, dtype=VALUE_DTYPES[value_type], count=count, offset=offset)
+    return kind, frame, step, link_ids, values
+
+# ---------------------------------------------------------
+
+def accepts_binary(accept_header: str) -> bool:
+    """
+    Whether the client asked for the binary format in its Accept header.
+    """
+    return SNAPSHOT_CONTENT_TYPE in (accept_header or "")
+
+def choose_content_encoding(accept_encoding: str) -> str:
+    """
+    Pick the compression of a response from the Accept-Encoding header of the request: "gzip", "deflate" or None.
+    Codings with q=0 are refused by the client.
+    """
+    accepted = {}
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ("gzip", "deflate"):
+        if accepted.get(encoding, 0.0) > 0:
+            return encoding
+    return None
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    if encoding == "deflate":
+        return zlib.compress(body, 6)
+    raise ValueError(f"Unknown content encoding: {encoding}")
+
+def encode_response(body: bytes, accept_encoding: str) -> Tuple[bytes, Dict[str, str]]:
+    """
+    Compress a response body if the client accepts it and the body is large enough.
+    Returns:
+        the body to send and the headers to set on the response.
+    """
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    encoding = choose_content_encoding(accept_encoding)
+    if encoding is not None and len(body) >= MIN_COMPRESS_SIZE:
+        body = compress_body(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return body, headers
@@ -0,0 +1,157 @@
+import time
+import numpy as np
+import multiprocessing
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from agents import Shipper
+from common import Request, RequestStore
+from vehicles import Service, ServiceStore
+from service_index import ServiceIndex
+
+# The plan of a request, as returned by Shipper.decision_making: a list of request services, each a list of
+# [is_service_generated, is_container_spawned, amount, service] entries. None if the request gets no plan (yet).
+RequestPlan = Optional[List[List[list]]]
+
+class DecisionSolver(ABC):
+    """
+    Decides the plans of a batch of requests of the same shipper.
+    The environment collects the requests that arrive in a time step (or up to a maximum number of requests, see
+    Environment.decision_batch_size) and hands them to the solver in one call, so that a solver can share its setup
+    and consolidate the loads of the requests of a batch.
+    The service index (see service_index.py) finds the candidate present services of a request without scanning them.
+    """
+    @abstractmethod
+    def solve(self, shipper: Shipper, requests: List[Request], present_services: ServiceStore,
+              service_index: ServiceIndex = None) -> List[RequestPlan]:
+        """
+        Returns:
+            the plan of every request, in the order of the requests.
+        """
+
+    def fallback(self, shipper: Shipper, request: Request, present_services: ServiceStore,
+                 service_index: ServiceIndex = None) -> RequestPlan:
+        """
+        The plan of a request whose solve did not return by its decision deadline (see Environment.decision_deadline).
+        It is computed in the event loop, so it must be cheap. By default there is no fallback plan, and the request
+        stays pending.
+        """
+        return None
+
+class ShipperDecisionSolver(DecisionSolver):
+    """
+    The default solver: the decision making of the shipper, called for every request of the batch in turn.
+    """
+    def solve(self, shipper: Shipper, requests: List[Request], present_services: ServiceStore,
+              service_index: ServiceIndex = None) -> List[RequestPlan]:
+        return [shipper.decision_making(request, present_services=present_services, service_index=service_index)
+                for request in requests]
+
+    def fallback(self, shipper: Shipper, request: Request, present_services: ServiceStore,
+                 service_index: ServiceIndex = None) -> RequestPlan:
+        """
+        The decision making of the shipper, run again in the event loop on the timetable as it is at the deadline
+        (with the capacities reserved since the batch was submitted).
+        """
+        return shipper.decision_making(request, present_services=present_services, service_index=service_index)
+
+# ---------------------------------------------------------
+# Decision making in worker processes.
+# A worker gets the static context of the decisions once, when it starts (see make_decision_executor): the solver, the
+# shippers with the rate arrays of their carriers (a pickled carrier leaves its fleet behind, see Carrier.__getstate__),
+# the timetable of the present services and its index. A batch then only sends its requests, as plain records, and the
+# capacities reserved on the timetable so far.
+# The services of the plans that come back are sent as references: the index of a present service, or the field
+# values of a service generated by the solver, from which the environment rebuilds the plan on its own services.
+# ---------------------------------------------------------
+
+# Index in the present services, or the constructor arguments of a generated Service
+ServiceReference = Union[int, Tuple]
+EncodedPlan = Optional[List[List[list]]]
+# The constructor arguments of a Request
+RequestRecord = Tuple
+
+SERVICE_ARGUMENTS = ("origin", "destination", "departure_time", "arrival_time", "cost", "capacity", "vehicle_id",
+                     "remaining_distance")
+
+def encode_plan(plan: RequestPlan, present_services: ServiceStore) -> EncodedPlan:
+    if plan is None:
+        return None
+    def reference(service: Service) -> ServiceReference:
+        if service._store is present_services:
+            return service.index
+        return tuple(getattr(service, name) for name in SERVICE_ARGUMENTS)
+    return [[[is_service_generated, is_container_spawned, amount, reference(service)]
+             for is_service_generated, is_container_spawned, amount, service in request_service]
+            for request_service in plan]
+
+def decode_plan(encoded_plan: EncodedPlan, present_services: ServiceStore) -> RequestPlan:
+    if encoded_plan is None:
+        return None
+    # The generated services of the plan are the rows of a store of their own
+    generated_services = ServiceStore()
+    def service(reference: ServiceReference) -> Service:
+        if isinstance(reference, tuple):
+            return Service(*reference, store=generated_services)
+        return present_services[reference]
+    return [[[is_service_generated, is_container_spawned, amount, service(reference)]
+             for is_service_generated, is_container_spawned, amount, reference in request_service]
+            for request_service in encoded_plan]
+
+def request_record(request: Request) -> RequestRecord:
+    return (request.id, request.origin, request.destination, request.amount, request.time_window,
+            request.selected_shipper, request.distance, list(request.services or []))
+
+def check_plans(plans: List[RequestPlan], requests: List[Request]):
+    if len(plans) != len(requests):
+        raise ValueError(f"The solver returned {len(plans)} plans for {len(requests)} requests")
+
+# Static context of the decisions in a worker process, set by initialize_worker
+worker_context: Dict[str, Any] = {}
+
+def initialize_worker(solver: DecisionSolver, shippers: List[Shipper], present_services: ServiceStore,
+                      service_index: ServiceIndex):
+    worker_context.update(solver=solver, shippers=shippers, present_services=present_services,
+                          service_index=service_index)
+
+def make_decision_executor(processes: int, solver: DecisionSolver, shippers: List[Shipper],
+                           present_services: ServiceStore, service_index: ServiceIndex = None) -> ProcessPoolExecutor:
+    """
+    Worker processes for solve_in_worker, spawned like the workers of the sweeps (see sweep.py). The static context is
+    pickled once per worker, when the worker starts.
+    """
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=initialize_worker,
+                               initargs=(solver, shippers, present_services, service_index))
+
+def reserved_capacities(service_index: ServiceIndex) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The capacities reserved on the timetable, as (service indices, containers) of the services with reservations.
+    """
+    if service_index is None:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    indices = np.flatnonzero(service_index.reserved)
+    return indices, service_index.reserved[indices]
+
+def solve_in_worker(shipper_id: int, request_records: List[RequestRecord],
+                    reserved: Tuple[np.ndarray, np.ndarray]) -> Tuple[List[EncodedPlan], float]:
+    """
+    Solve a batch in a worker process started by make_decision_executor.
+    Args:
+        reserved: the capacities reserved on the timetable, see reserved_capacities.
+    Returns:
+        the encoded plans of the requests and the wall-clock time of the solve in seconds.
+    """
+    solver: DecisionSolver = worker_context["solver"]
+    present_services: ServiceStore = worker_context["present_services"]
+    service_index: ServiceIndex = worker_context["service_index"]
+    if service_index is not None:
+        service_index.set_reserved(*reserved)
+    batch = RequestStore()
+    requests = [Request(*record, store=batch) for record in request_records]
+    start = time.perf_counter()
+    plans = solver.solve(worker_context["shippers"][shipper_id], requests, present_services, service_index)
+    seconds = time.perf_counter() - start
+    check_plans(plans, requests)
+    return [encode_plan(plan, present_services) for plan in plans], seconds
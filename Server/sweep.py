@@ -0,0 +1,192 @@
+import argparse
+import contextlib
+import itertools
+import os
+import sys
+import time
+import traceback
+import pandas as pd
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, fields
+from typing import Any, Dict, List
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+from environment import build_environment, read_instance, FIXED_STEP, num_shippers, num_lsps, num_carriers
+from random_streams import RandomStreams
+
+SWEEP_FOLDER = os.path.join("logs", "sweep")
+SUMMARY_FILE_PATH = os.path.join(SWEEP_FOLDER, "summary.csv")
+
+# ---------------------------------------------------------
+
+@dataclass
+class Scenario:
+    """
+    One run of the simulation: the files of the instance and the parameters of the environment.
+    """
+    name: str
+    demand_file: str
+    nodes_file: str
+    dist_file: str
+    vehicles_file: str
+    services_file: str
+    step_size: int = 1
+    num_shippers: int = num_shippers
+    num_lsps: int = num_lsps
+    num_carriers: int = num_carriers
+    scheduler: str = "heap"
+    advance_mode: str = FIXED_STEP
+    seed: int = None                    # None: unseeded run
+    replication: int = 0
+    arrival_delay_mean: float = 0.0
+
+def scenario_grid(base: Dict[str, Any], grid: Dict[str, List[Any]]) -> List[Scenario]:
+    """
+    Build the scenarios of all the combinations of the values in grid, the other parameters are taken from base.
+    The name of a scenario lists the values of the parameters that vary.
+    Args:
+        base: the parameters of Scenario shared by all the scenarios.
+        grid: for each varying parameter, the list of its values.
+    """
+    names = [field.name for field in fields(Scenario)]
+    for parameter in list(base) + list(grid):
+        if parameter not in names or parameter == "name":
+            raise ValueError(f"Unknown scenario parameter: {parameter}")
+    varying = [parameter for parameter, values in grid.items() if len(values) > 1]
+
+    scenarios = []
+    for values in itertools.product(*grid.values()):
+        parameters = dict(base, **dict(zip(grid, values)))
+        name = "_".join(f"{parameter}={os.path.splitext(os.path.basename(str(parameters[parameter])))[0]}"
+                        for parameter in varying) or "default"
+        scenarios.append(Scenario(name=name, **parameters))
+    return scenarios
+
+# ---------------------------------------------------------
+
+def peak_memory_mb() -> float:
+    """
+    Peak resident memory of the current process, in MB (None if it cannot be measured on this platform).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+def run_scenario(scenario: Scenario, log_folder: str = SWEEP_FOLDER) -> Dict[str, Any]:
+    """
+    Build and run the environment of a scenario until it has no more events.
+    The output of the simulation is written to <log_folder>/<name>.log.
+    Returns:
+        a row of the summary: the parameters of the scenario, its status, wall time, peak memory and statistics.
+    """
+    row = asdict(scenario)
+    os.makedirs(log_folder, exist_ok=True)
+    start = time.perf_counter()
+    try:
+        with open(os.path.join(log_folder, f"{scenario.name}.log"), "w") as log, contextlib.redirect_stdout(log):
+            random_streams = RandomStreams.from_seed(scenario.seed, scenario.replication)
+            row["seed"] = random_streams.seed # the seed drawn for an unseeded run, to reproduce it
+            requests_df, nodes_df, dist_matrix, vehicles_df, services_df = read_instance(
+                scenario.demand_file, scenario.nodes_file, scenario.dist_file, scenario.vehicles_file, scenario.services_file)
+            environment = build_environment(requests_df, nodes_df, dist_matrix, vehicles_df, services_df,
+                                            scenario.step_size, scheduler=scenario.scheduler,
+                                            advance_mode=scenario.advance_mode, num_shippers=scenario.num_shippers,
+                                            num_lsps=scenario.num_lsps, num_carriers=scenario.num_carriers,
+                                            random_streams=random_streams,
+                                            arrival_delay_mean=scenario.arrival_delay_mean)
+            while environment.step() is not None:
+                pass
+        row["status"] = "completed"
+        row["error"] = None
+        row["final_time"] = environment.time
+        row["events"] = len(environment.event_logger)
+        for status, count in environment.requests.count_by_status().items():
+            row[f"requests_{status.lower()}"] = count
+        statistics = environment.statistics_tracker.to_dict()
+        for vehicle_type, distance in statistics["total_distance_by_vehicle"].items():
+            row[f"distance_{vehicle_type}"] = distance
+        for vehicle_type, share in statistics["modal_share"].items():
+            row[f"modal_share_{vehicle_type}"] = share
+        for kpi in ("completed_requests", "late_requests", "total_lateness"):
+            row[kpi] = statistics[kpi]
+    except Exception as error:
+        row["status"] = "failed"
+        row["error"] = f"{type(error).__name__}: {error}"
+        with open(os.path.join(log_folder, f"{scenario.name}.log"), "a") as log:
+            traceback.print_exc(file=log)
+    row["wall_time"] = time.perf_counter() - start
+    row["peak_memory_mb"] = peak_memory_mb()
+    return row
+
+def run_sweep(scenarios: List[Scenario], processes: int = None, log_folder: str = SWEEP_FOLDER) -> pd.DataFrame:
+    """
+    Run the scenarios in a process pool and collect their results in a summary table.
+    Every scenario runs in a fresh process, so that the environments are isolated and the peak memory of a row is
+    the peak memory of its scenario.
+    Args:
+        processes (int): the number of worker processes (default: the number of CPUs).
+    """
+    names = [scenario.name for scenario in scenarios]
+    if len(set(names)) != len(names):
+        raise ValueError("The names of the scenarios must be unique")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                             max_tasks_per_child=1) as executor:
+        futures = [executor.submit(run_scenario, scenario, log_folder) for scenario in scenarios]
+        rows = []
+        for scenario, future in zip(scenarios, futures):
+            row = future.result()
+            print(f"{scenario.name}: {row['status']} in {row['wall_time']:.2f} s" + (f" ({row['error']})" if row["error"] else ""))
+            rows.append(row)
+    print(f"Ran {len(scenarios)} scenarios in {time.perf_counter() - start:.2f} s")
+    return pd.DataFrame(rows)
+
+# ---------------------------------------------------------
+
+def parse_arguments(arguments: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the simulation headless for every combination of the given "
+                                                 "instance files and parameters.")
+    parser.add_argument("--demand", nargs="+", default=["Server/instance_files_test/param_demand_test.csv"])
+    parser.add_argument("--nodes", nargs="+", default=["Server/instance_files_test/param_nodes_test.csv"])
+    parser.add_argument("--dist", nargs="+", default=["Server/instance_files_test/param_dist_test.csv"])
+    parser.add_argument("--vehicles", nargs="+", default=["Server/instance_files_test/param_vehicles_test.csv"])
+    parser.add_argument("--services", nargs="+", default=["Server/instance_files_test/param_services_test.csv"])
+    parser.add_argument("--step-size", nargs="+", type=int, default=[1])
+    parser.add_argument("--shippers", nargs="+", type=int, default=[num_shippers])
+    parser.add_argument("--lsps", nargs="+", type=int, default=[num_lsps])
+    parser.add_argument("--carriers", nargs="+", type=int, default=[num_carriers])
+    parser.add_argument("--processes", type=int, default=None, help="number of worker processes (default: CPUs)")
+    parser.add_argument("--output", default=SUMMARY_FILE_PATH, help="CSV file of the summary table")
+    return parser.parse_args(arguments)
+
+def main(arguments: List[str] = None):
+    arguments = parse_arguments(arguments)
+    # Every combination of the values is a scenario
+    grid = {
+        "demand_file": arguments.demand,
+        "nodes_file": arguments.nodes,
+        "dist_file": arguments.dist,
+        "vehicles_file": arguments.vehicles,
+        "services_file": arguments.services,
+        "step_size": arguments.step_size,
+        "num_shippers": arguments.shippers,
+        "num_lsps": arguments.lsps,
+        "num_carriers": arguments.carriers,
+    }
+    scenarios = scenario_grid({}, grid)
+    summary = run_sweep(scenarios, arguments.processes)
+    os.makedirs(os.path.dirname(arguments.output) or ".", exist_ok=True)
+    summary.to_csv(arguments.output, index=False)
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(summary.drop(columns=["demand_file", "nodes_file", "dist_file", "vehicles_file", "services_file"]))
+    print(f"Summary saved to {arguments.output}")
+
+if __name__ == "__main__":
+    main()
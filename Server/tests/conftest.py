@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# The modules of the server are imported by name, as when the server runs from the Server folder
+SERVER_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_FOLDER not in sys.path:
+    sys.path.insert(0, SERVER_FOLDER)
+
+INSTANCE_FOLDER = os.path.join(SERVER_FOLDER, "instance_files_test")
+
+@pytest.fixture
+def make_environment():
+    """
+    Factory of environments of the test instance, built with the given options of build_environment.
+    """
+    from environment import build_environment
+
+    def read(name: str) -> pd.DataFrame:
+        return pd.read_csv(os.path.join(INSTANCE_FOLDER, f"param_{name}_test.csv"))
+
+    def make(**options):
+        with open(os.path.join(INSTANCE_FOLDER, "param_dist_test.csv")) as file:
+            file.readline()
+            distances = pd.read_csv(file, header=None).values
+        return build_environment(read("demand"), read("nodes"), distances, read("vehicles"), read("services"), 1,
+                                 **options)
+    return make
@@ -0,0 +1,49 @@
+import numpy as np
+
+from agents import Carrier, LSP, Shipper, RATE_CACHE_SIZE
+from vehicles import VehicleStore, VEHICLE_TYPES
+
+def carrier_with(id: int, types, speeds, unit_costs) -> Carrier:
+    vehicles = VehicleStore(len(types))
+    vehicles.type[:] = [VEHICLE_TYPES.index(vehicle_type) for vehicle_type in types]
+    vehicles.speed[:] = speeds
+    vehicles.unit_cost[:] = unit_costs
+    carrier = Carrier(id)
+    carrier.set_fleet(vehicles, np.arange(len(types)))
+    return carrier
+
+def test_the_vehicles_without_a_speed_are_not_quoted():
+    # The train is the cheapest vehicle per unit of distance if it is given the default speed of a truck
+    carrier = carrier_with(0, ["Truck", "Train"], [50, 60], [100, 1])
+    assert carrier.rates() == (2.0, 1 / 50)
+    assert carrier.rates("Train") == (float("inf"), None)
+
+def test_the_fleet_epoch_of_a_carrier_is_its_own():
+    first, second = carrier_with(0, ["Truck"], [50], [100]), carrier_with(1, ["Truck"], [50], [100])
+    epoch = second.fleet_epoch
+    first.invalidate_quotes()
+    assert second.fleet_epoch == epoch
+
+def test_the_lsp_keeps_the_rates_of_every_vehicle_type_until_a_fleet_changes(monkeypatch):
+    carriers = [carrier_with(0, ["Truck"], [50], [100]), carrier_with(1, ["Truck"], [40], [50])]
+    lsp = LSP(0)
+    lsp.carriers = carriers
+    computed = []
+    monkeypatch.setattr("agents.carrier_rates", lambda carriers, vehicle_type: computed.append(vehicle_type) or
+                        (np.array([1.0, 2.0]), np.array([1.0, 1.0])))
+    for _ in range(3):
+        for vehicle_type in (None, "Truck", "Train"):
+            lsp.best_rates(vehicle_type)
+    assert computed == [None, "Truck", "Train"]
+    carriers[1].invalidate_quotes()
+    lsp.best_rates("Truck")
+    assert computed[-1] == "Truck" and len(computed) == 4
+    for epoch in range(2 * RATE_CACHE_SIZE):
+        carriers[0].invalidate_quotes()
+        lsp.best_rates()
+    assert len(lsp.rate_cache.entries) == RATE_CACHE_SIZE
+
+def test_a_shipper_without_lsps_makes_no_offer():
+    lsp_ids, carrier_ids, prices, times = Shipper(0).quote_requests(np.array([10.0, 20.0]))
+    assert lsp_ids.tolist() == [-1, -1] and carrier_ids.tolist() == [-1, -1]
+    assert np.isinf(prices).all() and np.isnan(times).all()
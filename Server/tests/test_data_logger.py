@@ -0,0 +1,86 @@
+import json
+
+import numpy as np
+import pytest
+
+import data_logger
+from common import Event, Event_Type
+from data_logger import EnvironmentStateLogger, EventLogger, StateReader
+from vehicles import VehicleStore
+
+def run(environment):
+    while environment.step() is not None:
+        pass
+    return environment
+
+def assert_same_states(reader: StateReader, expected: StateReader, steps):
+    for step in steps:
+        state, vehicles = reader.get_state(step)
+        expected_state, expected_vehicles = expected.get_state(step)
+        assert state.keys() == expected_state.keys()
+        assert all(np.array_equal(state[key], expected_state[key]) for key in state)
+        assert vehicles == expected_vehicles
+
+def test_skipped_steps_repeat_the_state_of_the_step_before_them(make_environment):
+    # The fixed steps record every step, the next events record only the steps with events
+    fixed = run(make_environment(advance_mode="fixed"))
+    next_event = run(make_environment(advance_mode="next_event"))
+    assert next_event.state_logger.unchanged_ranges
+    assert_same_states(next_event.state_logger.reader(), fixed.state_logger.reader(), fixed.state_logger.state_frames)
+
+def test_a_delta_holds_the_marked_cells_whose_value_changed():
+    state_logger = EnvironmentStateLogger()
+    state = {"Truck": np.zeros((3, 3), dtype=int), "Train": np.zeros((3, 3), dtype=int)}
+    vehicles = VehicleStore(0)
+    state_logger.save_state(0, state, vehicles)
+    for name, i, j, delta in (("Train", 2, 0, 1), ("Truck", 1, 2, 2), ("Truck", 0, 1, 1), ("Truck", 0, 1, -1)):
+        state_logger.mark_changed(name, i, j, state[name][i, j].item())
+        state[name][i, j] += delta
+    state_logger.save_state(1, state, vehicles)
+    state_logger.save_state(2, state, vehicles)
+
+    # The cell that went back to its value is left out, and the next step has no change
+    assert state_logger.state_frames[1] == {"delta": [[1, 2, "Truck", 2], [2, 0, "Train", 1]]}
+    assert state_logger.state_frames[2] == {"delta": []}
+
+def test_log_states_writes_one_entry_per_skipped_range(make_environment, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_logger, "ENVIRONMENT_STATES_FILE_PATH", str(tmp_path / "environment_states.json"))
+    monkeypatch.setattr(data_logger, "VEHICLE_STATES_FILE_PATH", str(tmp_path / "vehicle_states.json"))
+    state_logger = run(make_environment(advance_mode="next_event")).state_logger
+    state_logger.log_states()
+
+    with open(tmp_path / "environment_states.json") as file:
+        entries = json.load(file)
+    assert len(entries) == len(state_logger.state_frames) + len(state_logger.unchanged_ranges)
+    reader = StateReader.from_files(str(tmp_path / "environment_states.json"), str(tmp_path / "vehicle_states.json"))
+    assert reader.unchanged_ranges == state_logger.unchanged_ranges
+    assert_same_states(reader, state_logger.reader(), range(max(state_logger.state_frames) + 1))
+
+def test_resolve_finds_the_range_of_a_step():
+    reader = StateReader({}, {}, [(20, 30, 5, 15), (2, 8, 2, 0)])
+    assert [reader.resolve(step) for step in (1, 2, 3, 8, 9, 20, 25, 27, 30, 35)] == [1, 0, 3, 0, 9, 15, 15, 27, 15, 35]
+
+def logged_events(event_logger: EventLogger, number_of_events: int) -> list:
+    events = [Event(step, Event_Type.REQUEST_ARRIVED, request_id=step) for step in range(number_of_events)]
+    for event in events:
+        event_logger.save_event(event)
+    return events
+
+def test_a_binary_event_stream_reads_back_its_flushed_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_logger, "FOLDER_NAME", str(tmp_path))
+    monkeypatch.setattr(data_logger, "EVENT_BINARY_FILE_PATH", str(tmp_path / "events.bin"))
+    event_logger = EventLogger(block_size=4)
+    event_logger.open_stream(flush_interval=3600)
+    events = logged_events(event_logger, 10)
+    assert event_logger.event_list == events
+    event_logger.log_events()
+    assert event_logger.event_list == events
+
+def test_a_compressed_event_stream_cannot_be_read_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_logger, "EVENT_STREAM_FILE_PATH", str(tmp_path / "events.ndjson"))
+    event_logger = EventLogger(block_size=4)
+    event_logger.open_stream(compress=True)
+    logged_events(event_logger, 10)
+    with pytest.raises(ValueError):
+        event_logger.records()
+    event_logger.log_events()
@@ -0,0 +1,48 @@
+import math
+
+from common import Request, RequestStore
+from entity_store import APPEND_MIN_CAPACITY
+from vehicles import Service, ServiceStore, Train, Truck, VehicleStore
+
+def test_append_keeps_the_rows_and_the_views_across_growth():
+    store = ServiceStore(2)
+    store.origin[:] = [3, 4]
+    first = store[0]
+    for index in range(2, 3 * APPEND_MIN_CAPACITY):
+        assert store.append() == index
+        store[index].origin = index
+    assert len(store) == len(store.origin) == 3 * APPEND_MIN_CAPACITY
+    assert store.origin[:4].tolist() == [3, 4, 2, 3] and first.origin == 3
+    assert store.requests[-1] is None and store[-1].requests == []
+
+def test_standalone_entities_have_a_store_of_their_own():
+    services = [Service(0, 1, 2, 3, 4.0, 5, 6, 7.0) for _ in range(3)]
+    assert len({id(service._store) for service in services}) == 3
+    assert all(len(service._store) == 1 and service.index == 0 for service in services)
+    truck = Truck(1, "Truck", (0, 0), 2, 1.0, 1.0, 0)
+    assert len(truck._store) == 1 and truck.speed_per_timestep == 60
+
+def test_standalone_entities_can_be_appended_to_a_given_store():
+    store = RequestStore()
+    requests = [Request(id, 0, 2, 10, (0, 5), 0, 12.5, [1], store=store) for id in range(3)]
+    assert len(store) == 3 and store.id.tolist() == [0, 1, 2]
+    assert all(request._store is store for request in requests) and requests[1].time_window == (0, 5)
+
+def test_views_are_equal_only_for_the_same_row():
+    store = ServiceStore()
+    first, second = (Service(0, 1, 2, 3, 4.0, 5, 6, 7.0, store=store) for _ in range(2))
+    third = Service(0, 1, 2, 3, 4.0, 5, 6, 7.0)
+    assert first != second and first != third and first == store[first.index]
+    assert len({first, second, third, store[first.index]}) == 3
+
+def test_only_trucks_have_a_speed():
+    truck = Truck(1, "Truck", (0, 0), 2, 1.0, 1.0, 0)
+    train = Train(2, "Train", (0, 0), 40, 1.0, 1.0, 0)
+    assert truck.speed_per_timestep == 60 and math.isnan(train._store.speed[train.index])
+    assert math.isnan(VehicleStore(1).speed[0])
+
+def test_appended_vehicles_start_dirty():
+    store = VehicleStore(1)
+    store.take_dirty()
+    index = store.append()
+    assert store.take_dirty().tolist() == [index] and not store.dirty.any()
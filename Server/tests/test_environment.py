@@ -0,0 +1,53 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from data_logger import EnvironmentStateLogger
+from environment import build_environment
+from instance_generator import generate_instance
+
+@pytest.fixture(scope="module")
+def instance():
+    return generate_instance(6, 40, 20, 10, 50, seed=3)
+
+def run(instance, **options):
+    with contextlib.redirect_stdout(io.StringIO()):
+        environment = build_environment(*instance, 1, **options)
+        while environment.step() is not None:
+            pass
+    return environment
+
+def kpis(environment) -> dict:
+    # The decision times are wall-clock times
+    return {name: value for name, value in environment.statistics_tracker.to_dict().items()
+            if not name.startswith("decision_seconds")}
+
+@pytest.mark.parametrize("scheduler, advance_mode", [("heap", "next_event"), ("calendar", "fixed"),
+                                                     ("calendar", "next_event")])
+def test_the_schedulers_and_advance_modes_give_the_same_run(instance, scheduler, advance_mode):
+    reference = run(instance, scheduler="heap", advance_mode="fixed")
+    environment = run(instance, scheduler=scheduler, advance_mode=advance_mode)
+    assert kpis(environment) == kpis(reference)
+    assert environment.time == reference.time
+    assert environment.event_logger.records().tolist() == reference.event_logger.records().tolist()
+
+def test_every_recorded_step_is_rebuilt_from_keyframes_and_deltas(instance):
+    with contextlib.redirect_stdout(io.StringIO()):
+        environment = build_environment(*instance, 1)
+    environment.state_logger = EnvironmentStateLogger(keyframe_interval=4)
+    states = {}
+    while environment.step() is not None:
+        states[environment.time] = {name: matrix.copy() for name, matrix in environment.vehicle_matrices.items()}
+    reader = environment.state_logger.reader()
+    assert len(reader.steps) > 8
+    for step in reader.steps:
+        state, vehicles = reader.get_state(step)
+        assert state.keys() == states[step].keys()
+        assert all(np.array_equal(state[name], states[step][name]) for name in state)
+        assert len(vehicles) == len(environment.vehicles) and None not in vehicles
+    # The vehicles of the last step are the vehicles at the end of the run
+    _, vehicles = reader.get_state(reader.steps[-1])
+    assert [vehicle["status"] for vehicle in vehicles] == [vehicle.status.name for vehicle in environment.vehicles]
+    assert [vehicle["number_of_containers"] for vehicle in vehicles] == environment.vehicles.number_of_containers.tolist()
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from frames import FrameBuffer
+
+def filled_buffer(capacity: int, frames: int) -> FrameBuffer:
+    frame_buffer = FrameBuffer(capacity)
+    for frame in range(frames):
+        frame_buffer.append(frame, np.array([frame, 0, frame % 2], dtype=np.float64), {})
+    return frame_buffer
+
+def test_update_sends_the_changed_links_of_a_frame():
+    frame, step, keyframe, link_ids, values = filled_buffer(3, 5).update(3)
+    assert (frame, step, keyframe) == (3, 3, False)
+    assert link_ids.tolist() == [0, 2] and values.tolist() == [3.0, 1.0]
+
+@pytest.mark.parametrize("requested", [0, 1, 2])
+def test_update_of_a_dropped_frame_or_of_a_frame_after_one_is_the_oldest_keyframe(requested):
+    # Frames 0 and 1 were dropped: the frame before 2 is gone too, so a delta of frame 2 cannot be computed
+    frame, step, keyframe, link_ids, values = filled_buffer(3, 5).update(requested)
+    assert (frame, step, keyframe, link_ids) == (2, 2, True, None)
+    assert values.tolist() == [2.0, 0.0, 0.0]
+
+def test_update_returns_a_keyframe_on_request():
+    assert filled_buffer(3, 5).update(4, keyframe=True)[2]
+
+def test_update_of_a_frame_not_produced_yet_raises():
+    with pytest.raises(IndexError):
+        filled_buffer(3, 5).update(5)
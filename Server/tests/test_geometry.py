@@ -0,0 +1,58 @@
+import numpy as np
+
+from geometry import LOD_TOLERANCES, douglas_peucker_significance, merge_segment_chains
+
+def douglas_peucker(points: np.ndarray, tolerance: float) -> list:
+    """
+    The classic recursive Douglas-Peucker: the indices of the points kept with the tolerance.
+    """
+    def simplify(first: int, last: int) -> list:
+        if last - first < 2:
+            return [first]
+        start, end = points[first], points[last]
+        direction = end - start
+        t = np.clip((points[first + 1:last] - start) @ direction / (direction @ direction), 0.0, 1.0)
+        distances = np.linalg.norm(points[first + 1:last] - (start + t[:, None] * direction), axis=1)
+        split = first + 1 + int(np.argmax(distances))
+        if distances[split - first - 1] <= tolerance:
+            return [first]
+        return simplify(first, split) + simplify(split, last)
+    return simplify(0, len(points) - 1) + [len(points) - 1]
+
+def test_the_significance_of_a_point_is_its_distance_to_the_simplified_line():
+    points = np.array([[0.0, 0.0], [1.0, 0.5], [2.0, 1.0], [3.0, 0.5], [4.0, 0.0]])
+    significance = douglas_peucker_significance(points)
+    assert significance[0] == significance[-1] == np.inf
+    assert significance[2] == 1.0
+    # The collinear points are dropped at every level of detail
+    assert significance[1] == significance[3] == 0.0
+
+def test_the_significance_simplifies_like_douglas_peucker_at_every_tolerance():
+    rng = np.random.default_rng(11)
+    for _ in range(20):
+        points = np.cumsum(rng.normal(scale=0.003, size=(rng.integers(2, 60), 2)), axis=0)
+        significance = douglas_peucker_significance(points)
+        for tolerance in LOD_TOLERANCES:
+            assert np.flatnonzero(significance > tolerance).tolist() == douglas_peucker(points, tolerance)
+
+def test_the_segments_used_by_the_same_paths_are_merged():
+    paths = {(0, 1): [0, 1, 2], (0, 2): [0, 1, 3], (2, 1): [4, 2]}
+    assert merge_segment_chains(paths, 5) == [[0, 1], [2], [3], [4]]
+
+def test_the_chains_are_contiguous_runs_of_the_paths_that_use_them():
+    rng = np.random.default_rng(5)
+    number_of_segments = 36
+    paths = {(pair, 0): rng.choice(30, size=rng.integers(1, 8), replace=False).tolist() for pair in range(15)}
+    # Two paths that share a run of segments
+    paths[(15, 0)] = [30, 31, 32, 33]
+    paths[(16, 0)] = [34, 31, 32, 35]
+    chains = merge_segment_chains(paths, number_of_segments)
+
+    assert sorted(segment for chain in chains for segment in chain) == list(range(number_of_segments))
+    assert [31, 32] in chains
+    for chain in chains:
+        users = [{pair for pair, segment_ids in paths.items() if segment in segment_ids} for segment in chain]
+        assert all(user == users[0] for user in users)
+        for pair in users[0]:
+            start = paths[pair].index(chain[0])
+            assert paths[pair][start:start + len(chain)] == chain
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from environment import read_instance
+from instance_generator import (TURNAROUND_TIME, generate_instance, instance_file_paths, read_instance_bundle,
+                                write_instance_bundle, write_instance_csv)
+from vehicles import TRUCK_SPEED
+
+def assert_same_instance(instance, expected):
+    for table, expected_table in zip(instance, expected):
+        if isinstance(expected_table, pd.DataFrame):
+            pd.testing.assert_frame_equal(table, expected_table, check_dtype=False)
+        else:
+            assert np.array_equal(table, expected_table)
+
+def test_a_seed_reproduces_its_instance():
+    assert_same_instance(generate_instance(8, 50, 20, 30, 100, seed=4), generate_instance(8, 50, 20, 30, 100, seed=4))
+    assert not generate_instance(8, 50, 20, 30, 100, seed=5)[0].equals(generate_instance(8, 50, 20, 30, 100, seed=4)[0])
+
+def test_the_requests_can_be_driven_in_their_time_window():
+    requests_df, nodes_df, dist_matrix, _, _ = generate_instance(8, 200, 20, 30, 100, seed=4, num_shippers=3)
+
+    assert (dist_matrix == dist_matrix.T).all() and (np.diag(dist_matrix) == 0).all()
+    assert (dist_matrix[~np.eye(len(nodes_df), dtype=bool)] > 0).all()
+    assert (requests_df["orig"] != requests_df["dest"]).all()
+    assert requests_df["lw"].between(1, 99).all() and requests_df["selected"].between(1, 3).all()
+    travel_times = np.ceil(dist_matrix[requests_df["orig"], requests_df["dest"]] / TRUCK_SPEED)
+    assert (requests_df["uw"] - requests_df["lw"] >= travel_times).all()
+
+def test_every_vehicle_follows_a_consistent_timetable():
+    _, _, _, vehicles_df, services_df = generate_instance(8, 10, 20, 60, 100, seed=4, num_carriers=2)
+
+    assert vehicles_df["carrier_id"].between(0, 1).all()
+    assert (vehicles_df["name"].iloc[:3] == "Truck").all()
+    assert not (vehicles_df["name"].to_numpy()[services_df["vehicle_id"]] == "Truck").any()
+    assert (services_df["departure_time"] >= 2).all()
+    for _, services in services_df.groupby("vehicle_id"):
+        # A vehicle shuttles between two nodes, and leaves again after its turnaround
+        assert (services["origin"].to_numpy()[1:] == services["destination"].to_numpy()[:-1]).all()
+        assert (services["departure_time"].to_numpy()[1:]
+                == services["arrival_time"].to_numpy()[:-1] + TURNAROUND_TIME).all()
+        assert (services["arrival_time"] > services["departure_time"]).all()
+
+def test_an_instance_needs_two_nodes_and_a_horizon():
+    with pytest.raises(ValueError):
+        generate_instance(1, 10, 10, 10, 100)
+    with pytest.raises(ValueError):
+        generate_instance(4, 10, 10, 10, 1)
+    with pytest.raises(ValueError):
+        generate_instance(4, 10, 3, 10, 100)
+
+def test_the_files_of_an_instance_read_back(tmp_path):
+    instance = generate_instance(6, 40, 20, 10, 50, seed=3)
+    paths = write_instance_csv(instance, str(tmp_path), "generated")
+    assert paths == instance_file_paths(str(tmp_path), "generated")
+    assert_same_instance(read_instance(*paths), instance)
+
+    write_instance_bundle(instance, str(tmp_path / "generated.npz"))
+    assert_same_instance(read_instance_bundle(str(tmp_path / "generated.npz")), instance)
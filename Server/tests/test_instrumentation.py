@@ -0,0 +1,76 @@
+import json
+from collections import Counter
+
+import pytest
+
+from common import Event_Type
+from instrumentation import Instrumentation
+
+class CountingEnvironment:
+    """
+    The parts of an environment that the instrumentation attaches to: the time is the number of steps.
+    """
+    def __init__(self):
+        self.time = 0
+        self.events = []
+        self.event_handlers = {}
+        self.event_logger = self.state_logger = self
+
+    def save_event(self):
+        pass
+
+    def save_state(self):
+        pass
+
+    def step(self):
+        self.time += 1
+        return True
+
+def test_the_queue_depth_samples_are_bounded_and_evenly_spaced():
+    environment = CountingEnvironment()
+    instrumentation = Instrumentation(queue_depth_samples=8)
+    instrumentation.attach(environment)
+    for _ in range(1000):
+        environment.step()
+    times = [time for time, _ in instrumentation.queue_depth]
+    interval = instrumentation.queue_depth_interval
+    assert len(times) < 8 and interval == 128
+    assert times == list(range(interval, 1001, interval))
+
+def test_the_handlers_are_counted_per_event_type(make_environment):
+    instrumentation = Instrumentation()
+    environment = make_environment(instrumentation=instrumentation)
+    while environment.step() is not None:
+        pass
+
+    logged = Counter(Event_Type(value).name for value in environment.event_logger.records()["type"].tolist())
+    assert {name: count for name, count in instrumentation.event_counts.items() if count} == logged
+    assert instrumentation.section_calls["event_logger"] == sum(logged.values())
+    # Every step but the last one, which finds no more events, records a state
+    assert instrumentation.section_calls["state_logger"] == instrumentation.section_calls["step"] - 1
+    assert all(instrumentation.event_max_seconds[name] <= instrumentation.event_seconds[name] for name in logged)
+
+def test_a_timed_section_counts_its_calls_even_when_it_raises():
+    instrumentation = Instrumentation()
+    def fail():
+        raise ValueError("No")
+    timed = instrumentation.timed("solve", fail)
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            timed()
+
+    summary = instrumentation.to_dict()["sections"]["solve"]
+    assert summary["calls"] == 2 and summary["max_us"] <= summary["total_seconds"] * 1e6
+
+def test_the_instrumentation_is_saved_as_json(tmp_path):
+    environment = CountingEnvironment()
+    instrumentation = Instrumentation()
+    instrumentation.attach(environment)
+    for _ in range(3):
+        environment.step()
+    instrumentation.save(str(tmp_path / "instrumentation.json"))
+
+    with open(tmp_path / "instrumentation.json") as file:
+        saved = json.load(file)
+    assert saved == json.loads(json.dumps(instrumentation.to_dict()))
+    assert saved["sections"]["step"]["calls"] == 3 and saved["queue_depth"] == [[1, 0], [2, 0], [3, 0]]
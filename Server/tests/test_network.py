@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+from network import build_network
+
+NAMES = ("Truck", "Train")
+
+def line_network(number_of_nodes: int):
+    """
+    A network of the nodes on a line, whose routes go through the nodes in between: the paths share their links.
+    """
+    nodes = pd.DataFrame({"long_name": [f"N{node}" for node in range(number_of_nodes)],
+                          "longitude": np.arange(number_of_nodes, dtype=np.float64),
+                          "latitude": np.zeros(number_of_nodes)})
+    pairs = [(origin, destination) for origin in range(number_of_nodes) for destination in range(number_of_nodes)
+             if origin != destination]
+    connectivity = pd.DataFrame(pairs, columns=["origin", "destination"])
+    step = lambda origin, destination: 1 if destination > origin else -1
+    routes = {(origin, destination): [(float(node), 0.0) for node in range(origin, destination + step(origin, destination),
+                                                                          step(origin, destination))]
+              for origin, destination in pairs}
+    return build_network(nodes, connectivity, routes=routes, merge=False)
+
+def test_the_paths_share_the_links_between_the_nodes():
+    network = line_network(4)
+    assert len(network.links) == 6
+    assert network.paths[(0, 3)] == network.paths[(0, 2)] + network.paths[(2, 3)]
+
+def test_the_incremental_update_matches_a_full_recount():
+    rng = np.random.default_rng(7)
+    network, recount = line_network(5), line_network(5)
+    vehicle_matrices = {name: np.zeros((5, 5), dtype=int) for name in NAMES}
+    network.update_vehicles(vehicle_matrices)
+    for _ in range(200):
+        i, j = rng.integers(5, size=2).tolist()
+        name = NAMES[rng.integers(len(NAMES))]
+        delta = 1 if vehicle_matrices[name][i, j] == 0 else int(rng.choice([-1, 1]))
+        vehicle_matrices[name][i, j] += delta
+        network.update_vehicles(vehicle_matrices, changes=[(i, j, name, delta)])
+
+        # A copy of the matrices is not the matrices of the last update: the intensities are recomputed
+        recount.update_vehicles({name: quantities.copy() for name, quantities in vehicle_matrices.items()})
+        assert network.link_intensities.tolist() == recount.link_intensities.tolist()
+    assert network.link_intensities.any()
+
+def test_the_vehicles_on_a_link_are_the_pairs_whose_path_uses_it():
+    network = line_network(3)
+    vehicle_matrices = {name: np.zeros((3, 3), dtype=int) for name in NAMES}
+    vehicle_matrices["Truck"][0, 2] = 2
+    vehicle_matrices["Train"][1, 2] = 1
+    vehicle_matrices["Train"][1, 1] = 4
+    network.update_vehicles(vehicle_matrices)
+
+    first, second = network.paths[(0, 2)]
+    assert [(vehicle.origin, vehicle.destination) for vehicle in network.vehicles_on_link(first)] == [(0, 2)]
+    assert sorted((vehicle.origin, vehicle.destination) for vehicle in network.vehicles_on_link(second)) == [(0, 2), (1, 2)]
+    assert [vehicle.quantity for vehicle in network.vehicles_at_node(1)] == [4]
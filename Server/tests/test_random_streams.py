@@ -0,0 +1,43 @@
+import contextlib
+import io
+
+import numpy as np
+
+from environment import build_environment
+from instance_generator import generate_instance
+from random_streams import STREAM_NAMES, RandomStreams
+
+def draws(streams: RandomStreams) -> dict:
+    return {name: getattr(streams, name).random(5).tolist() for name in STREAM_NAMES}
+
+def test_a_seeded_replication_reproduces_its_streams():
+    assert draws(RandomStreams.from_seed(3, 1)) == draws(RandomStreams.from_seed(3, 1))
+    first, second = draws(RandomStreams.from_seed(3, 0)), draws(RandomStreams.from_seed(3, 1))
+    assert all(first[name] != second[name] for name in STREAM_NAMES)
+
+def test_the_streams_are_independent():
+    streams, reference = RandomStreams.from_seed(3), RandomStreams.from_seed(3)
+    streams.delays.random(100)
+    assert streams.vehicles.random(5).tolist() == reference.vehicles.random(5).tolist()
+
+def test_an_unseeded_run_keeps_the_seed_it_drew():
+    streams = RandomStreams.from_seed()
+    assert draws(RandomStreams.from_seed(streams.seed)) == draws(streams)
+
+def run(seed: int, replication: int):
+    with contextlib.redirect_stdout(io.StringIO()):
+        environment = build_environment(*generate_instance(6, 40, 20, 10, 50, seed=3), 1,
+                                        random_streams=RandomStreams.from_seed(seed, replication),
+                                        arrival_delay_mean=2.0)
+        while environment.step() is not None:
+            pass
+    return environment
+
+def test_a_seeded_replication_reproduces_its_run():
+    first, again, other = run(5, 0), run(5, 0), run(5, 1)
+
+    assert np.array_equal(first.vehicles.speed, again.vehicles.speed, equal_nan=True)
+    assert first.time == again.time
+    assert first.statistics_tracker.total_distance_by_vehicle == again.statistics_tracker.total_distance_by_vehicle
+    assert np.array_equal(first.event_logger.records(), again.event_logger.records())
+    assert not np.array_equal(first.vehicles.speed, other.vehicles.speed, equal_nan=True)
@@ -0,0 +1,47 @@
+import math
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import INSTANCE_FOLDER
+from replications import precision_reached, run_replications, summarize, t_quantile
+from sweep import Scenario
+
+def test_the_t_quantiles_match_the_tables():
+    assert t_quantile(0.975, 1) == pytest.approx(12.7062, abs=1e-4)
+    assert t_quantile(0.975, 10) == pytest.approx(2.2281, abs=1e-4)
+    assert t_quantile(0.95, 30) == pytest.approx(1.6973, abs=1e-4)
+    assert t_quantile(0.5, 4) == pytest.approx(0.0, abs=1e-6)
+
+def test_the_summary_has_a_confidence_interval_per_kpi():
+    results = pd.DataFrame({"status": ["completed", "completed", "completed", "failed"],
+                            "distance_Truck": [10.0, 12.0, 14.0, math.nan],
+                            "completed_requests": [1, 1, 1, 0], "wall_time": [0.1, 0.2, 0.3, 0.4]})
+    summary = summarize(results).set_index("kpi")
+
+    assert list(summary.index) == ["distance_Truck", "completed_requests"]
+    truck = summary.loc["distance_Truck"]
+    assert truck["replications"] == 3 and truck["mean"] == 12.0 and truck["variance"] == 4.0
+    assert truck["half_width"] == pytest.approx(t_quantile(0.975, 2) * 2 / math.sqrt(3))
+    assert summary.loc["completed_requests", "half_width"] == 0.0
+
+    assert precision_reached(summary.reset_index(), 0.5, relative=True)
+    assert not precision_reached(summary.reset_index(), 0.1, relative=True)
+    assert precision_reached(summary.reset_index(), 0.1, relative=True, kpis=["completed_requests"])
+    assert not precision_reached(summary.reset_index(), 1.0, relative=False)
+
+def test_the_replications_stop_once_the_target_is_reached(tmp_path):
+    scenario = Scenario("test", *(os.path.join(INSTANCE_FOLDER, f"param_{name}_test.csv")
+                                  for name in ("demand", "nodes", "dist", "vehicles", "services")))
+    results, summary = run_replications(scenario, seed=3, max_replications=6, min_replications=2,
+                                        target_half_width=0.01, processes=2, log_folder=str(tmp_path))
+
+    # The test instance has no randomness that changes its KPIs: the first batch is precise
+    assert results["name"].tolist() == ["test_r0", "test_r1"]
+    assert results["replication"].tolist() == [0, 1] and (results["seed"] == 3).all()
+    assert (summary["half_width"] == 0).all()
+
+def test_the_replications_need_two_of_them():
+    with pytest.raises(ValueError):
+        run_replications(None, seed=3, max_replications=5, min_replications=1)
@@ -0,0 +1,134 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import router
+from route_cache import RouteCache
+from router import RouteFetchError, get_routes
+
+ROUTE_PATH = re.compile(r"/route/v1/(\w+)/([-\d.]+),([-\d.]+);([-\d.]+),([-\d.]+)")
+
+class StandInOSRM:
+    """
+    Local stand-in of the OSRM route service. It answers with the straight line between the end points, after a delay
+    so that concurrent requests overlap. The first failures[origin longitude] requests from an origin get a 503, and
+    origins in no_route get the 400 answer of OSRM for a route that does not exist.
+    """
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.failures = {}
+        self.no_route = set()
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def handle(self, request: BaseHTTPRequestHandler):
+        match = ROUTE_PATH.match(request.path)
+        origin_longitude, origin_latitude, destination_longitude, destination_latitude = map(float, match.groups()[1:])
+        with self.lock:
+            self.requests.append(request.path)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            failing = self.failures.get(origin_longitude, 0) > 0
+            if failing:
+                self.failures[origin_longitude] -= 1
+        try:
+            time.sleep(self.delay)
+            if failing:
+                status, body = 503, {"code": "Unavailable"}
+            elif origin_longitude in self.no_route:
+                status, body = 400, {"code": "NoRoute", "message": "Impossible route between points"}
+            else:
+                status, body = 200, {"code": "Ok", "routes": [{
+                    "legs": [{"distance": 1000.0}],
+                    "geometry": {"coordinates": [[origin_longitude, origin_latitude],
+                                                 [destination_longitude, destination_latitude]]}}]}
+            payload = json.dumps(body).encode()
+            request.send_response(status)
+            request.send_header("Content-Type", "application/json")
+            request.send_header("Content-Length", str(len(payload)))
+            request.end_headers()
+            request.wfile.write(payload)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def osrm():
+    stand_in = StandInOSRM()
+    yield stand_in
+    stand_in.close()
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(router, "RETRY_BACKOFF", 0.01)
+
+def coordinates(count: int):
+    return [(float(i), 50.0, float(i) + 0.5, 51.0) for i in range(count)]
+
+def test_fetches_each_missing_route_once_within_the_concurrency_limit(osrm):
+    pairs = coordinates(12)
+    routes = get_routes(pairs + pairs[:4], base_url=osrm.base_url, max_concurrent_requests=3)
+    assert len(osrm.requests) == 12
+    assert 1 < osrm.max_in_flight <= 3
+    assert routes[pairs[5]] == ([[5.0, 50.0], [5.5, 51.0]], 1.0)
+
+def test_retries_unavailable_server(osrm):
+    osrm.failures[2.0] = 2
+    routes = get_routes(coordinates(4), base_url=osrm.base_url)
+    assert len(routes) == 4
+    assert sum("/2.0,50.0;" in path for path in osrm.requests) == 3
+
+def test_cache_hits_are_not_fetched_and_partial_results_are_kept(osrm, tmp_path):
+    cache = RouteCache(str(tmp_path / "routes.sqlite"))
+    try:
+        pairs = coordinates(5)
+        osrm.no_route.add(3.0)
+        with pytest.raises(RouteFetchError, match="1 of 5 routes could not be fetched") as error:
+            get_routes(pairs, cache, base_url=osrm.base_url)
+        assert pairs[3] in error.value.errors
+        # The route without a 400 answer is not retried, the other routes are cached
+        assert sum("/3.0,50.0;" in path for path in osrm.requests) == 1
+        assert len(cache) == 4
+
+        osrm.no_route.clear()
+        osrm.requests.clear()
+        routes = get_routes(pairs, cache, base_url=osrm.base_url)
+        assert osrm.requests == [router.route_url(*pairs[3], base_url="")]
+        assert len(routes) == 5 and len(cache) == 5
+    finally:
+        cache.close()
+
+def test_unreachable_server_uses_the_cache_or_fails_clearly(osrm, tmp_path):
+    cache = RouteCache(str(tmp_path / "routes.sqlite"))
+    try:
+        pairs = coordinates(3)
+        get_routes(pairs, cache, base_url=osrm.base_url)
+        unreachable = "http://127.0.0.1:1"
+        assert get_routes(pairs, cache, base_url=unreachable) == get_routes(pairs, cache, base_url=osrm.base_url)
+        with pytest.raises(RouteFetchError, match="3 of 4 routes are available"):
+            get_routes(pairs + coordinates(4)[3:], cache, base_url=unreachable)
+    finally:
+        cache.close()
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from common import Event, Event_Type
+from scheduler import CalendarEventQueue, EventScheduler, HeapEventQueue, make_event_queue
+
+def random_events(rng: random.Random, number_of_events: int, earliest: float = 0) -> list:
+    # Few distinct timestamps and priorities, so that many events tie
+    return [Event(earliest + rng.choice([0, 0.5, 1, 1, 2, 3.25]), Event_Type.REQUEST_ARRIVED,
+                  request_id=rng.randrange(1000), priority=rng.randrange(3))
+            for _ in range(number_of_events)]
+
+def drain(queue: EventScheduler) -> list:
+    events = []
+    while not queue.empty():
+        assert queue.peek() is not None
+        events.append(queue.get())
+    assert queue.peek() is None
+    return events
+
+@pytest.mark.parametrize("queue_class", [HeapEventQueue, CalendarEventQueue])
+@pytest.mark.parametrize("bulk", [False, True])
+def test_events_come_out_by_time_priority_and_insertion_order(queue_class, bulk):
+    events = random_events(random.Random(7), 500)
+    queue = queue_class()
+    if bulk:
+        queue.put_many(events)
+    else:
+        for event in events:
+            queue.put(event)
+    assert len(queue) == len(events) and sorted(map(id, queue)) == sorted(map(id, events))
+    # sorted is stable, so the ties are in insertion order
+    expected = sorted(events, key=lambda event: (event.timestamp, event.priority))
+    assert [id(event) for event in drain(queue)] == [id(event) for event in expected]
+
+def test_the_heap_and_the_calendar_agree_when_events_are_added_while_processing():
+    rng = random.Random(11)
+    heap, calendar = HeapEventQueue(), CalendarEventQueue()
+    initial = random_events(rng, 50)
+    heap.put_many(initial)
+    calendar.put_many(initial)
+    processed = []
+    while not heap.empty():
+        event = heap.get()
+        assert calendar.get() is event
+        processed.append(event.timestamp)
+        # The handler of an event schedules events at its time or later
+        for new_event in random_events(rng, rng.randrange(3) if len(processed) < 300 else 0, event.timestamp):
+            heap.put(new_event)
+            calendar.put(new_event)
+    assert calendar.empty() and len(processed) >= 300 and processed == sorted(processed)
+
+def test_the_scheduler_interface_is_abstract():
+    with pytest.raises(TypeError):
+        EventScheduler()
+
+def test_invalid_schedulers_are_rejected():
+    with pytest.raises(ValueError):
+        make_event_queue("fifo")
+    with pytest.raises(ValueError):
+        CalendarEventQueue(bucket_width=0.5)
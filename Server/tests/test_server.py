@@ -0,0 +1,147 @@
+import asyncio
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+import tornado.httpclient
+import tornado.httpserver
+import tornado.ioloop
+import tornado.locks
+import tornado.testing
+import tornado.websocket
+
+import server
+from frames import FrameBuffer
+from instrumentation import Instrumentation
+from network import build_network
+from snapshot_codec import KEYFRAME, SNAPSHOT_CONTENT_TYPE, decode_frame, decode_snapshot
+
+def install_frame_buffer() -> FrameBuffer:
+    """
+    Install a frame buffer wired to the IOLoop as start_simulation_worker does, without starting the simulation.
+    """
+    server.frame_buffer = FrameBuffer(8)
+    server.frame_produced = tornado.locks.Condition()
+    io_loop = tornado.ioloop.IOLoop.current()
+    server.frame_buffer.add_listener(lambda: io_loop.add_callback(server.frame_produced.notify_all))
+    return server.frame_buffer
+
+def produce(frame_buffer: FrameBuffer, frames: int, error: BaseException = None):
+    def run():
+        for frame in range(frames):
+            frame_buffer.append(frame, np.zeros(2), {})
+        frame_buffer.finish(error)
+    threading.Timer(0.05, run).start()
+
+def test_waiting_for_frames_holds_no_thread():
+    async def run():
+        frame_buffer = install_frame_buffer()
+        threads = threading.active_count()
+        waiters = [asyncio.ensure_future(server.wait_for_frame(frame % 4)) for frame in range(200)]
+        await asyncio.sleep(0.01)
+        assert threading.active_count() == threads
+        produce(frame_buffer, 3)
+        return await asyncio.gather(*waiters)
+    assert asyncio.run(run()) == [frame % 4 < 3 for frame in range(200)]
+
+def test_waiting_for_a_frame_after_a_failed_simulation_raises():
+    async def run():
+        produce(install_frame_buffer(), 1, RuntimeError("boom"))
+        assert await server.wait_for_frame(0)
+        await server.wait_for_frame(1)
+    with pytest.raises(tornado.web.HTTPError) as error:
+        asyncio.run(run())
+    assert error.value.status_code == 500 and "boom" in error.value.reason
+
+def straight_network(number_of_nodes: int):
+    """
+    A network of the nodes on a line, with a straight route between every two nodes (no routing server).
+    """
+    nodes = pd.DataFrame({"long_name": [f"N{node}" for node in range(number_of_nodes)],
+                          "longitude": np.arange(number_of_nodes, dtype=np.float64),
+                          "latitude": np.zeros(number_of_nodes)})
+    pairs = [(origin, destination) for origin in range(number_of_nodes) for destination in range(number_of_nodes)
+             if origin != destination]
+    connectivity = pd.DataFrame(pairs, columns=["origin", "destination"])
+    routes = {(origin, destination): [(origin, 0.0), (destination, 0.0)] for origin, destination in pairs}
+    return build_network(nodes, connectivity, routes=routes)
+
+@pytest.fixture
+def served_simulation(make_environment, monkeypatch):
+    environment = make_environment()
+    monkeypatch.setattr(server, "environment", environment, raising=False)
+    monkeypatch.setattr(server, "network", straight_network(len(next(iter(environment.vehicle_matrices.values())))), raising=False)
+
+@pytest.fixture
+def instrumented_simulation(make_environment, monkeypatch):
+    environment = make_environment(instrumentation=Instrumentation())
+    monkeypatch.setattr(server, "environment", environment, raising=False)
+    monkeypatch.setattr(server, "network", straight_network(len(next(iter(environment.vehicle_matrices.values())))), raising=False)
+    return environment
+
+async def serve():
+    server.start_simulation_worker()
+    socket, port = tornado.testing.bind_unused_port()
+    http_server = tornado.httpserver.HTTPServer(server.make_app())
+    http_server.add_sockets([socket])
+    return http_server, port
+
+def test_the_snapshots_are_the_frames_of_the_simulation(served_simulation):
+    async def run():
+        http_server, port = await serve()
+        client = tornado.httpclient.AsyncHTTPClient()
+        snapshots = []
+        for _ in range(3):
+            response = await client.fetch(f"http://127.0.0.1:{port}/snapshot",
+                                          headers={"Accept": SNAPSHOT_CONTENT_TYPE})
+            snapshots.append(decode_snapshot(response.body))
+        json_snapshot = json.loads((await client.fetch(f"http://127.0.0.1:{port}/snapshot")).body)
+        http_server.stop()
+        return snapshots, json_snapshot
+    snapshots, json_snapshot = asyncio.run(run())
+    for frame, (step, link_intensities) in enumerate(snapshots):
+        expected_step, expected = server.frame_buffer.get(frame)
+        assert step == expected_step and link_intensities.tolist() == expected.tolist()
+    assert json_snapshot["step"] == server.frame_buffer.get(3)[0]
+
+def test_the_stream_rebuilds_every_frame(served_simulation):
+    async def run():
+        http_server, port = await serve()
+        connection = await tornado.websocket.websocket_connect(f"ws://127.0.0.1:{port}/frames")
+        await connection.write_message(json.dumps({"type": "start", "from_frame": 0, "rate": 0}))
+        intensities, frames = None, []
+        while True:
+            message = await connection.read_message()
+            if isinstance(message, str):
+                break
+            kind, frame, step, link_ids, values = decode_frame(message)
+            if kind == KEYFRAME:
+                intensities = values.copy()
+            else:
+                intensities[link_ids] = values
+            frames.append((frame, step, intensities.tolist()))
+            await connection.write_message(json.dumps({"type": "ack", "frame": frame}))
+        connection.close()
+        http_server.stop()
+        return frames, json.loads(message)
+    frames, end = asyncio.run(run())
+    assert end == {"type": "end", "frames": server.frame_buffer.end}
+    assert [frame for frame, _, _ in frames] == list(range(server.frame_buffer.end))
+    for frame, step, intensities in frames:
+        expected_step, expected = server.frame_buffer.get(frame)
+        assert step == expected_step and intensities == expected.tolist()
+
+def test_the_debug_stats_are_the_copy_published_with_the_last_frame(instrumented_simulation):
+    async def run():
+        http_server, port = await serve()
+        while not server.frame_buffer.finished:
+            await asyncio.sleep(0.01)
+        response = await tornado.httpclient.AsyncHTTPClient().fetch(f"http://127.0.0.1:{port}/debug/stats")
+        http_server.stop()
+        return json.loads(response.body)
+    stats = asyncio.run(run())
+    assert stats == {"enabled": True, **server.debug_stats}
+    assert stats["time"] == server.frame_buffer.get(server.frame_buffer.end - 1)[0]
+    assert stats["sections"]["step"]["calls"] == server.frame_buffer.end
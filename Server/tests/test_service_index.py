@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from service_index import ServiceIndex
+from vehicles import ServiceStore
+
+NUMBER_OF_NODES = 5
+
+def random_services(rng: np.random.Generator, number_of_services: int) -> ServiceStore:
+    services = ServiceStore(number_of_services)
+    services.origin[:] = rng.integers(0, NUMBER_OF_NODES, number_of_services)
+    services.destination[:] = rng.integers(0, NUMBER_OF_NODES, number_of_services)
+    # Integer times, so that many services depart at the same time
+    services.departure_time[:] = rng.integers(0, 50, number_of_services)
+    services.capacity[:] = rng.integers(1, 6, number_of_services)
+    return services
+
+def brute_force(services: ServiceStore, reserved: np.ndarray, origin: int, earliest: float, latest: float,
+                min_capacity: int, destination: int = None) -> set:
+    remaining = services.capacity - reserved
+    mask = ((services.origin == origin) & (services.departure_time >= earliest) & (services.departure_time <= latest)
+            & (remaining > 0) & (remaining >= min_capacity))
+    if destination is not None:
+        mask &= services.destination == destination
+    return set(np.flatnonzero(mask).tolist())
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_the_queries_match_a_scan_of_the_services(seed):
+    rng = np.random.default_rng(seed)
+    services = random_services(rng, 400)
+    index = ServiceIndex(services, NUMBER_OF_NODES)
+    reserved = np.zeros(len(services), dtype=np.int64)
+    for _ in range(20):
+        for service in rng.integers(0, len(services), 15).tolist():
+            containers = int(rng.integers(1, 3))
+            index.reserve(services[service], containers)
+            reserved[service] += containers
+        for _ in range(20):
+            origin = int(rng.integers(0, NUMBER_OF_NODES))
+            destination = int(rng.integers(0, NUMBER_OF_NODES)) if rng.random() < 0.5 else None
+            earliest = float(rng.integers(-5, 50))
+            latest = earliest + float(rng.integers(0, 20))
+            min_capacity = int(rng.integers(0, 4))
+            hits = index.query(origin, earliest, latest, min_capacity, destination)
+            assert set(hits.tolist()) == brute_force(services, reserved, origin, earliest, latest, min_capacity,
+                                                      destination)
+            assert len(set(hits.tolist())) == len(hits)
+            assert np.all(np.diff(services.departure_time[hits]) >= 0)
+
+def test_set_reserved_matches_the_reservations():
+    rng = np.random.default_rng(3)
+    services = random_services(rng, 200)
+    index, replica = ServiceIndex(services, NUMBER_OF_NODES), ServiceIndex(services, NUMBER_OF_NODES)
+    for containers in (1, 3, 1):
+        for service in rng.integers(0, len(services), 40).tolist():
+            index.reserve(services[service], containers)
+        reserved = np.flatnonzero(index.reserved)
+        replica.set_reserved(reserved, index.reserved[reserved])
+        for origin in range(NUMBER_OF_NODES):
+            assert replica.query(origin, 0, 50).tolist() == index.query(origin, 0, 50).tolist()
+    # A decreased reservation (e.g. a replica sent an older state) rebuilds the lists
+    replica.set_reserved(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    fresh = ServiceIndex(services, NUMBER_OF_NODES)
+    assert sorted(replica.query(0, 0, 50).tolist()) == sorted(fresh.query(0, 0, 50).tolist())
+
+def test_services_that_are_not_indexed_are_ignored():
+    services = random_services(np.random.default_rng(4), 10)
+    index = ServiceIndex(services, NUMBER_OF_NODES)
+    index.reserve(ServiceStore(1)[0], 5)
+    assert not index.reserved.any()
+    with pytest.raises(ValueError):
+        index.query(NUMBER_OF_NODES, 0, 10)
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from snapshot_codec import (DELTA_FRAME, FRAME_HEADER, KEYFRAME, SNAPSHOT_HEADER, decode_frame, decode_snapshot,
+                            encode_delta_frame, encode_keyframe, encode_snapshot)
+
+@pytest.mark.parametrize("link_intensities", [np.array([0, 3, 70000], dtype=np.int64),
+                                              np.array([0.5, 2.25, 1e6], dtype=np.float64)])
+@pytest.mark.parametrize("step", [0, 17, 2.5, 5e9])
+def test_a_snapshot_round_trips(step, link_intensities):
+    data = encode_snapshot(step, link_intensities)
+    assert SNAPSHOT_HEADER.size % 4 == 0
+    decoded_step, decoded = decode_snapshot(data)
+    assert decoded_step == step
+    assert decoded.tolist() == link_intensities.tolist()
+
+def test_frames_round_trip():
+    kind, frame, step, link_ids, values = decode_frame(encode_keyframe(3, 4.75, np.array([1, 2, 3])))
+    assert (kind, frame, step, link_ids, values.tolist()) == (KEYFRAME, 3, 4.75, None, [1, 2, 3])
+    kind, frame, step, link_ids, values = decode_frame(encode_delta_frame(4, 6, np.array([0, 9]),
+                                                                          np.array([0.5, 1.5])))
+    assert (kind, frame, step, link_ids.tolist(), values.tolist()) == (DELTA_FRAME, 4, 6.0, [0, 9], [0.5, 1.5])
+    assert FRAME_HEADER.size % 4 == 0
+
+def test_negative_integer_intensities_are_rejected():
+    with pytest.raises(ValueError):
+        encode_snapshot(0, np.array([1, -1]))
@@ -0,0 +1,97 @@
+import contextlib
+import io
+import time
+
+import pytest
+
+from common import Agent_Type, RequestStatus
+from environment import build_environment
+from instance_generator import generate_instance
+from solvers import DecisionSolver, ShipperDecisionSolver
+
+class FailingSolver(ShipperDecisionSolver):
+    """
+    The default solver, whose solves in the worker processes fail: the requests get the fallback plan.
+    """
+    def solve(self, shipper, requests, present_services, service_index=None):
+        raise ValueError("No plan")
+
+class SleepySolver(DecisionSolver):
+    """
+    Takes SECONDS to decide a batch, and has no plan for its requests.
+    """
+    SECONDS = 0.02
+
+    def __init__(self):
+        self.solves = 0
+
+    def solve(self, shipper, requests, present_services, service_index=None):
+        self.solves += 1
+        time.sleep(self.SECONDS)
+        return [None for _ in requests]
+
+def run(environment):
+    while environment.step() is not None:
+        pass
+    return environment
+
+def test_a_solver_must_implement_solve():
+    class IncompleteSolver(DecisionSolver):
+        pass
+    with pytest.raises(TypeError):
+        IncompleteSolver()
+
+    class NoFallbackSolver(DecisionSolver):
+        def solve(self, shipper, requests, present_services, service_index=None):
+            return [None for _ in requests]
+    assert NoFallbackSolver().fallback(None, None, None) is None
+
+def test_the_shipper_fallback_is_its_decision_making(make_environment):
+    environment = make_environment()
+    request = environment.requests[0]
+    shipper = environment.agents[Agent_Type.SHIPPER][request.selected_shipper]
+    fallback = ShipperDecisionSolver().fallback(shipper, request, environment.present_services,
+                                                environment.service_index)
+    [decided] = ShipperDecisionSolver().solve(shipper, [request], environment.present_services,
+                                              environment.service_index)
+    assert [[entry[:3] for entry in request_service] for request_service in fallback] == \
+        [[entry[:3] for entry in request_service] for request_service in decided]
+
+def test_the_plans_of_the_worker_processes_are_applied_at_the_deadline(make_environment):
+    in_loop = run(make_environment())
+    in_workers = run(make_environment(decision_processes=1, decision_deadline=1, decision_wait=None))
+
+    assert in_workers.requests[0].status == RequestStatus.COMPLETED
+    assert in_workers.time == in_loop.time
+    assert in_workers.statistics_tracker.total_distance_by_vehicle == in_loop.statistics_tracker.total_distance_by_vehicle
+    assert in_workers.statistics_tracker.decisions == 1
+    assert in_workers.statistics_tracker.fallback_decisions == 0
+    assert not in_workers.pending_solves
+
+def test_a_failed_solve_gets_the_fallback_plan(make_environment):
+    environment = run(make_environment(solver=FailingSolver(), decision_processes=1, decision_deadline=1,
+                                       decision_wait=None))
+
+    assert environment.requests[0].status == RequestStatus.COMPLETED
+    assert environment.statistics_tracker.decisions == 1
+    assert environment.statistics_tracker.fallback_decisions == 1
+    [warning] = [record for record in environment.tracer.records() if record["level"] == "WARNING"]
+    assert "failed with ValueError('No plan')" in warning["message"]
+
+def test_a_plan_that_comes_back_late_is_not_applied(make_environment):
+    # The plan leaves at time 2, the deadline is at time 4: neither the plan of the worker nor the fallback can be used
+    environment = run(make_environment(decision_processes=1, decision_deadline=2, decision_wait=None))
+
+    assert environment.requests[0].status == RequestStatus.PENDING
+    assert environment.statistics_tracker.fallback_decisions == 1
+
+def test_the_solve_of_a_batch_is_shared_by_its_requests():
+    solver = SleepySolver()
+    with contextlib.redirect_stdout(io.StringIO()):
+        environment = run(build_environment(*generate_instance(6, 40, 20, 10, 10, seed=3), 1, solver=solver,
+                                            decision_batch_size=0))
+    statistics = environment.statistics_tracker
+
+    assert statistics.decisions == 40
+    assert solver.solves < statistics.decisions
+    assert statistics.decision_seconds_total == pytest.approx(solver.solves * SleepySolver.SECONDS, rel=0.5)
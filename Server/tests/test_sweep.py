@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from conftest import INSTANCE_FOLDER
+from sweep import Scenario, run_scenario, run_sweep, scenario_grid
+
+def instance_files():
+    return {f"{name}_file": os.path.join(INSTANCE_FOLDER, f"param_{name}_test.csv")
+            for name in ("demand", "nodes", "dist", "vehicles", "services")}
+
+def test_the_grid_has_a_scenario_per_combination():
+    scenarios = scenario_grid(instance_files(), {"step_size": [1, 2], "scheduler": ["heap", "calendar"], "seed": [3]})
+
+    assert [(scenario.step_size, scenario.scheduler) for scenario in scenarios] == \
+        [(1, "heap"), (1, "calendar"), (2, "heap"), (2, "calendar")]
+    # Only the parameters that vary name the scenarios
+    assert scenarios[1].name == "step_size=1_scheduler=calendar"
+    assert all(scenario.seed == 3 for scenario in scenarios)
+    assert scenario_grid(instance_files(), {})[0].name == "default"
+
+def test_the_grid_rejects_unknown_parameters():
+    with pytest.raises(ValueError):
+        scenario_grid(instance_files(), {"speed": [1, 2]})
+    with pytest.raises(ValueError):
+        scenario_grid(dict(instance_files(), name="run"), {})
+
+def test_a_scenario_row_has_its_statistics(tmp_path):
+    row = run_scenario(Scenario(name="test", seed=3, **instance_files()), str(tmp_path))
+
+    assert row["status"] == "completed" and row["error"] is None
+    assert row["requests_completed"] == row["completed_requests"] == 1
+    assert row["distance_Truck"] == 203.0 and row["final_time"] == 18
+    assert (tmp_path / "test.log").exists()
+
+def test_a_failed_scenario_is_a_row_with_its_error(tmp_path):
+    row = run_scenario(Scenario(name="missing", **dict(instance_files(), demand_file=str(tmp_path / "missing.csv"))),
+                       str(tmp_path))
+
+    assert row["status"] == "failed" and row["error"].startswith("FileNotFoundError")
+    assert "Traceback" in (tmp_path / "missing.log").read_text()
+
+def test_a_sweep_runs_every_scenario_in_a_worker_process(tmp_path):
+    scenarios = scenario_grid(dict(instance_files(), seed=3), {"advance_mode": ["fixed", "next_event"]})
+    summary = run_sweep(scenarios, processes=2, log_folder=str(tmp_path))
+
+    assert summary["name"].tolist() == [scenario.name for scenario in scenarios]
+    assert summary["status"].tolist() == ["completed", "completed"]
+    # Skipping the steps without events does not change the run
+    assert summary["distance_Truck"].nunique() == summary["final_time"].nunique() == 1
+    assert sorted(os.listdir(tmp_path)) == sorted(f"{scenario.name}.log" for scenario in scenarios)
+
+def test_a_sweep_needs_unique_scenario_names(tmp_path):
+    scenario = Scenario(name="twice", **instance_files())
+    with pytest.raises(ValueError):
+        run_sweep([scenario, scenario], log_folder=str(tmp_path))
@@ -0,0 +1,72 @@
+import io
+import json
+
+import pytest
+
+from common import Event_Type
+from tracing import DEBUG, ERROR, INFO, TRACE, WARNING, ConsoleSink, FileSink, NdjsonSink, Tracer, parse_level
+
+class CountingField:
+    """
+    A field that counts how many times it is formatted.
+    """
+    def __init__(self):
+        self.formatted = 0
+
+    def __format__(self, spec):
+        self.formatted += 1
+        return "field"
+
+def test_the_levels_below_the_tracer_level_are_disabled():
+    tracer = Tracer("warning")
+    assert (tracer.trace, tracer.debug, tracer.info, tracer.warning, tracer.error) == (False, False, False, True, True)
+    tracer.emit(INFO, "dropped", 1)
+    tracer.emit(ERROR, "kept at time {time}", 2)
+    assert [record["message"] for record in tracer.records()] == ["kept at time 2"]
+
+    assert parse_level("Trace") == TRACE and parse_level(DEBUG) == DEBUG
+    with pytest.raises(ValueError):
+        parse_level("verbose")
+
+def test_a_record_is_only_formatted_when_it_is_read():
+    tracer = Tracer(DEBUG)
+    field = CountingField()
+    tracer.emit(DEBUG, "Value {field}", 0, field=field)
+    assert field.formatted == 0
+    assert tracer.records()[0]["message"] == "Value field" and field.formatted == 1
+
+def test_the_ring_buffer_keeps_the_last_records_and_samples_below_warning():
+    tracer = Tracer(INFO, buffer_size=4, sample_every=3)
+    for time in range(9):
+        tracer.emit(INFO, "Step {time}", time)
+    tracer.emit(WARNING, "Warning {time}", 9)
+    assert [record["message"] for record in tracer.records()] == ["Step 2", "Step 5", "Step 8", "Warning 9"]
+    with pytest.raises(ValueError):
+        Tracer(sample_every=0)
+
+def test_the_sinks_get_every_kept_record(tmp_path):
+    console = io.StringIO()
+    tracer = Tracer(INFO, sinks=[ConsoleSink(console), FileSink(str(tmp_path / "trace.log")),
+                                 NdjsonSink(str(tmp_path / "trace.ndjson"))])
+    tracer.emit(INFO, "Vehicle {vehicle_id} departed at time {time}", 3, vehicle_id=7)
+    tracer.emit(DEBUG, "dropped", 3)
+    tracer.close()
+
+    assert console.getvalue() == "Vehicle 7 departed at time 3\n"
+    assert (tmp_path / "trace.log").read_text() == "INFO Vehicle 7 departed at time 3\n"
+    [line] = (tmp_path / "trace.ndjson").read_text().splitlines()
+    assert json.loads(line) == {"time": 3, "level": "INFO", "message": "Vehicle 7 departed at time 3", "vehicle_id": 7}
+
+def test_an_error_in_the_event_loop_dumps_the_ring_buffer(make_environment, tmp_path):
+    environment = make_environment(tracer=Tracer(DEBUG, error_dump_path=str(tmp_path / "dump.ndjson")))
+    def fail(event):
+        raise RuntimeError("boom")
+    environment.event_handlers[Event_Type.REQUEST_ARRIVED] = fail
+
+    with pytest.raises(RuntimeError):
+        while environment.step() is not None:
+            pass
+    records = [json.loads(line) for line in (tmp_path / "dump.ndjson").read_text().splitlines()]
+    assert records == environment.tracer.records()
+    assert records[-1]["level"] == "ERROR" and records[-1]["error"] == "RuntimeError('boom')"
+    assert records[-1]["time"] == environment.time and len(records) > 1
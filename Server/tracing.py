@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import numpy as np
+from collections import deque
+from typing import Any, Dict, List, TextIO, Tuple
+
+from data_logger import StreamWriter, FOLDER_NAME, FLUSH_INTERVAL
+
+# ---------------------------------------------------------
+# Structured tracing of the event loop.
+# A trace record is (simulation time, level, message template, fields). The template is only formatted with the
+# fields when the record reaches a sink or is dumped, so a record that is only kept in the ring buffer costs a tuple.
+# Callers check the flag of a level before building a record:
+#
+#     if tracer.info:
+#         tracer.emit(INFO, "Vehicle {vehicle_id} departed at time {time}", self.time, vehicle_id=vehicle_id)
+#
+# so a disabled level costs one attribute lookup, and no arguments are built or formatted.
+# ---------------------------------------------------------
+
+TRACE = 5
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {TRACE: "TRACE", DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+RING_BUFFER_SIZE = 10000
+TRACE_DUMP_FILE_PATH = os.path.join(FOLDER_NAME, "trace_dump.ndjson")
+
+TraceRecord = Tuple[float, int, str, Dict[str, Any]]
+
+def parse_level(level) -> int:
+    """
+    A level given by name (case insensitive) or by number.
+    """
+    if isinstance(level, str):
+        if level.upper() not in LEVELS:
+            raise ValueError(f"Unknown trace level: {level}, expected one of {', '.join(LEVELS)}")
+        return LEVELS[level.upper()]
+    return int(level)
+
+def format_record(record: TraceRecord) -> str:
+    time, level, message, fields = record
+    return message.format(time=time, **fields)
+
+def jsonable(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [jsonable(v) for v in value]
+    return str(value)
+
+def record_to_dict(record: TraceRecord) -> Dict[str, Any]:
+    time, level, message, fields = record
+    return {"time": jsonable(time), "level": LEVEL_NAMES.get(level, level), "message": format_record(record),
+            **{name: jsonable(value) for name, value in fields.items()}}
+
+# ---------------------------------------------------------
+
+class ConsoleSink:
+    """
+    Prints the formatted records, like the print calls of the event loop used to.
+    """
+    def __init__(self, stream: TextIO = None):
+        self.stream = stream
+
+    def write(self, record: TraceRecord):
+        print(format_record(record), file=self.stream or sys.stdout)
+
+    def close(self):
+        pass
+
+class FileSink:
+    """
+    Appends the formatted records to a text file.
+    """
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, record: TraceRecord):
+        self.file.write(f"{LEVEL_NAMES.get(record[1], record[1])} {format_record(record)}\n")
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+class NdjsonSink:
+    """
+    Appends the records as newline-delimited JSON, buffered by a StreamWriter.
+    """
+    def __init__(self, path: str, compress: bool = False, flush_interval: float = FLUSH_INTERVAL):
+        self.writer = StreamWriter(path, compress=compress, flush_interval=flush_interval)
+
+    def write(self, record: TraceRecord):
+        self.writer.write(record_to_dict(record))
+
+    def close(self):
+        self.writer.close()
+
+# ---------------------------------------------------------
+
+class Tracer:
+    """
+    Leveled tracer of the event loop. The records of the enabled levels are kept in a ring buffer of the last
+    buffer_size records, and written to the sinks.
+    Args:
+        level: the lowest enabled level, by name or number.
+        sinks: objects with write(record) and close() methods (ConsoleSink, FileSink, NdjsonSink).
+        sample_every (int): keep one in every sample_every records below WARNING (warnings and errors are always kept).
+        error_dump_path (str): the ring buffer is dumped there when the event loop raises an error (None: no dump).
+    """
+    def __init__(self, level=INFO, sinks: List = None, buffer_size: int = RING_BUFFER_SIZE, sample_every: int = 1,
+                 error_dump_path: str = TRACE_DUMP_FILE_PATH):
+        if sample_every < 1:
+            raise ValueError(f"sample_every must be at least 1, got {sample_every}")
+        self.sinks = list(sinks or [])
+        self.buffer: deque = deque(maxlen=buffer_size)
+        self.sample_every = sample_every
+        self.sampled = 0
+        self.error_dump_path = error_dump_path
+        self.set_level(level)
+
+    def set_level(self, level):
+        self.level = parse_level(level)
+        # Flags checked by the callers before building a record
+        self.trace = self.level <= TRACE
+        self.debug = self.level <= DEBUG
+        self.info = self.level <= INFO
+        self.warning = self.level <= WARNING
+        self.error = self.level <= ERROR
+
+    def emit(self, level: int, message: str, time: float = None, **fields):
+        """
+        Record a message. The message is a format string of the fields (and of time), formatted lazily.
+        """
+        if level < self.level:
+            return
+        if level < WARNING and self.sample_every > 1:
+            self.sampled += 1
+            if self.sampled % self.sample_every:
+                return
+        record = (time, level, message, fields)
+        self.buffer.append(record)
+        for sink in self.sinks:
+            sink.write(record)
+
+    def records(self) -> List[Dict[str, Any]]:
+        """
+        The records of the ring buffer, oldest first, as dictionaries.
+        """
+        return [record_to_dict(record) for record in list(self.buffer)]
+
+    def dump(self, path: str = TRACE_DUMP_FILE_PATH) -> str:
+        """
+        Write the ring buffer to a newline-delimited JSON file.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            for record in self.records():
+                file.write(json.dumps(record) + "\n")
+        return path
+
+    def dump_on_error(self, error: Exception, time: float = None):
+        self.emit(ERROR, "Error at time {time}: {error}", time, error=repr(error))
+        if self.error_dump_path is not None:
+            path = self.dump(self.error_dump_path)
+            print(f"Trace of the last {len(self.buffer)} records saved to {path}", file=sys.stderr)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
@@ -1,12 +1,20 @@
 from enum import Enum
-import queue
+import heapq
 
-from dataclasses import dataclass, field
-import random
+import numpy as np
 from typing import Dict, List, Tuple
 
+from entity_store import ColumnStore, EntityView, column_property, object_column_property
+
 CONTAINER_CAPACITY = 24
 
+# SPEED MIGHT BE CHANGED FROM HERE (Can be done in such a way that the decision making algorithm chooses it)
+TRUCK_SPEED = 60 # km/h, mean speed of the trucks
+TRUCK_SPEED_SPREAD = 10 # km/h, the speed of every truck is drawn uniformly from TRUCK_SPEED +- TRUCK_SPEED_SPREAD
+
+def sample_truck_speeds(rng: np.random.Generator, size: int) -> np.ndarray:
+    return TRUCK_SPEED + rng.integers(-TRUCK_SPEED_SPREAD, TRUCK_SPEED_SPREAD + 1, size=size)
+
 class VehicleStatus(Enum):
     IDLE = 0
     EN_ROUTE = 1
@@ -14,11 +22,38 @@ class VehicleStatus(Enum):
     UNLOADING = 4
 
 
+class ServiceStore(ColumnStore):
+    """
+    Columnar storage of the services. The Service objects handed out by the store are views of its rows.
+    """
+    columns = {
+        "origin": np.int32,
+        "destination": np.int32,
+        "departure_time": np.float64,
+        "arrival_time": np.float64,
+        "cost": np.float64,
+        "capacity": np.int64,
+        "vehicle_id": np.int64,
+        "remaining_distance": np.float64,
+        "requests": object,
+    }
+
+    def view(self, index: int) -> 'Service':
+        return Service._view(self, index)
+
+
 # request id is going to be -1 if the service is not associated with a request
 # a truck would contain a list of services assigned by the research algorithms
-class Service:
-    def __init__(self, origin, destination, departure_time, 
-                 arrival_time, cost, capacity, vehicle_id, remaining_distance):
+class Service(EntityView):
+    __slots__ = ()
+    fields = ("origin", "destination", "departure_time", "arrival_time", "cost", "capacity", "vehicle_id",
+              "remaining_distance", "requests")
+
+    def __init__(self, origin, destination, departure_time,
+                 arrival_time, cost, capacity, vehicle_id, remaining_distance, store: ServiceStore = None):
+        # A service built on its own (e.g. generated by the decision making) is a new row of the given store, or has a
+        # store of its own
+        self._bind_new_row(store, ServiceStore)
         self.origin = origin
         self.destination = destination
         self.departure_time = departure_time
@@ -28,17 +63,46 @@ class Service:
         self.vehicle_id = vehicle_id
         self.remaining_distance = remaining_distance
         self.requests = []
-    
+
+    origin = column_property("origin")
+    destination = column_property("destination")
+    departure_time = column_property("departure_time")
+    arrival_time = column_property("arrival_time")
+    cost = column_property("cost")
+    capacity = column_property("capacity")
+    vehicle_id = column_property("vehicle_id")
+    remaining_distance = column_property("remaining_distance")
+    requests = object_column_property("requests", list)
+
     def __lt__(self, other: 'Service'):
         return self.departure_time < other.departure_time
 
-    
-class ServiceQueue(queue.PriorityQueue):
+
+class ServiceQueue:
+    """
+    Services of a vehicle ordered by departure time. A plain heap, the services of a vehicle are only
+    accessed by the environment.
+    """
+    def __init__(self):
+        self.queue: List[Service] = []
+
+    def put(self, service: Service):
+        heapq.heappush(self.queue, service)
+
+    def get(self) -> Service:
+        return heapq.heappop(self.queue)
+
     def peek(self):
         if self.empty():
             return None
         return self.queue[0]
-    
+
+    def empty(self) -> bool:
+        return not self.queue
+
+    def qsize(self) -> int:
+        return len(self.queue)
+
     def print_all_events(self):
         print("Services in the queue:")
         for service in self.queue:
@@ -59,20 +123,128 @@ class ServiceQueue(queue.PriorityQueue):
 #             return True
 #         return False
 
-@dataclass
-class Vehicle:
-    vehicle_id: int
-    name: str
-    current_location: Tuple[int, int]
-    max_containers: int 
-    unit_cost: float
-    emission_factor: float 
-    carrier_id: int
-    number_of_containers: int = 0
-    services: ServiceQueue = ServiceQueue()
-    containers: Dict[int, int] = field(default_factory=dict)            # Key is request id, value is quantity
-    status: VehicleStatus = VehicleStatus.IDLE
+# Index of the name of a vehicle type is its type code in the VehicleStore
+VEHICLE_TYPES = ("Truck", "Train", "Barge")
 
+class VehicleStore(ColumnStore):
+    """
+    Columnar storage of the fleet. The Vehicle objects handed out by the store are views of its rows,
+    of the class that corresponds to the vehicle type (Truck, Train or Barge).
+    """
+    columns = {
+        "vehicle_id": np.int64,
+        "type": np.int8,                                # index in VEHICLE_TYPES
+        "location_origin": np.int32,                    # current_location is (location_origin, location_destination)
+        "location_destination": np.int32,
+        "max_containers": np.int64,
+        "unit_cost": np.float64,
+        "emission_factor": np.float64,
+        "carrier_id": np.int32,
+        "number_of_containers": np.int64,
+        "status": np.int8,                              # VehicleStatus value
+        "speed": np.float64,                            # km/h, trucks only (nan for the other vehicles)
+        "depot": np.int32,                              # trucks only
+        "long_haul": np.bool_,                          # trucks only
+        "services": object,
+        "containers": object,                           # Key is request id, value is quantity
+        "dirty": np.bool_,                              # changed since the last snapshot, see take_dirty
+    }
+    defaults = {
+        "speed": np.nan,
+        "dirty": True,
+        "depot": -1,
+        "long_haul": True,
+    }
+
+    def __init__(self, size: int = 0):
+        super().__init__(size)
+        # Vehicles whose state changed since the last snapshot (see take_dirty). Every vehicle starts dirty.
+        self.dirty_indices: List[int] = list(range(size))
+
+    def append(self) -> int:
+        index = super().append()
+        self.dirty_indices.append(index)
+        return index
+
+    def mark_dirty(self, index: int):
+        if not self.dirty[index]:
+            self.dirty[index] = True
+            self.dirty_indices.append(index)
+
+    def take_dirty(self) -> np.ndarray:
+        """
+        Returns the sorted indices of the vehicles that changed since the last call, and clears them.
+        """
+        indices = np.array(sorted(self.dirty_indices), dtype=np.int64)
+        self.dirty[indices] = False
+        self.dirty_indices = []
+        return indices
+
+    def view(self, index: int) -> 'Vehicle':
+        return VEHICLE_VIEWS[self.type[index]]._view(self, index)
+
+    def type_mask(self, name: str) -> np.ndarray:
+        return self.type == VEHICLE_TYPES.index(name)
+
+    def count_by_status(self) -> Dict[str, int]:
+        counts = np.bincount(self.status, minlength=max(status.value for status in VehicleStatus) + 1)
+        return {status.name: int(counts[status.value]) for status in VehicleStatus}
+
+    def containers_in_transit(self) -> int:
+        return int(self.number_of_containers[self.status == VehicleStatus.EN_ROUTE.value].sum())
+
+
+class Vehicle(EntityView):
+    __slots__ = ()
+    fields = ("vehicle_id", "name", "current_location", "max_containers", "unit_cost", "emission_factor",
+              "carrier_id", "number_of_containers", "status")
+
+    def __init__(self, vehicle_id: int, name: str, current_location: Tuple[int, int], max_containers: int,
+                 unit_cost: float, emission_factor: float, carrier_id: int, number_of_containers: int = 0,
+                 services: 'ServiceQueue' = None, containers: Dict[int, int] = None,
+                 status: VehicleStatus = VehicleStatus.IDLE, store: VehicleStore = None):
+        # A vehicle built on its own is a new row of the given store, or has a store of its own
+        self._bind_new_row(store, VehicleStore)
+        self._store.type[self._index] = VEHICLE_TYPES.index(name)
+        self.vehicle_id = vehicle_id
+        self.current_location = current_location
+        self.max_containers = max_containers
+        self.unit_cost = unit_cost
+        self.emission_factor = emission_factor
+        self.carrier_id = carrier_id
+        self.number_of_containers = number_of_containers
+        self.services = services if services is not None else ServiceQueue()
+        self.containers = containers if containers is not None else {}
+        self.status = status
+
+    vehicle_id = column_property("vehicle_id")
+    max_containers = column_property("max_containers")
+    unit_cost = column_property("unit_cost")
+    emission_factor = column_property("emission_factor")
+    carrier_id = column_property("carrier_id")
+    number_of_containers = column_property("number_of_containers")
+    services = object_column_property("services", ServiceQueue)
+    containers = object_column_property("containers", dict)
+
+    @property
+    def name(self) -> str:
+        return VEHICLE_TYPES[self._store.type[self._index]]
+
+    @property
+    def current_location(self) -> Tuple[int, int]:
+        return (self._store.location_origin[self._index].item(), self._store.location_destination[self._index].item())
+
+    @current_location.setter
+    def current_location(self, current_location: Tuple[int, int]):
+        self._store.location_origin[self._index], self._store.location_destination[self._index] = current_location
+
+    @property
+    def status(self) -> VehicleStatus:
+        return VehicleStatus(self._store.status[self._index].item())
+
+    @status.setter
+    def status(self, status: VehicleStatus):
+        self._store.status[self._index] = status.value
 
     def load_vehicle(self, request_id: int, amount: int) -> bool:
         if self.number_of_containers < self.max_containers:
@@ -92,11 +264,11 @@ class Vehicle:
                 self.number_of_containers -= 1
                 return True
         return False
-    
+
     def to_dict(self):
         """
         Convert the Vehicle object to a dictionary representation.
-        
+
         Returns:
             dict: A dictionary representation of the Vehicle object.
         """
@@ -113,17 +285,23 @@ class Vehicle:
             "status": self.status.name
         }
 
-@dataclass
 class Truck(Vehicle):
-    depot: int = -1                             
-    long_haul: bool = True
-    # SPEED MIGHT BE CHANGED FROM HERE (Can be done in such a way that the decision making algorithm chooses it)
-    speed_per_timestep: int = 60 + random.randint(-10, 10) # km/h
+    __slots__ = ()
+
+    def __init__(self, *args, depot: int = -1, long_haul: bool = True, speed_per_timestep: int = TRUCK_SPEED, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.depot = depot
+        self.long_haul = long_haul
+        self.speed_per_timestep = speed_per_timestep
+
+    depot = column_property("depot")
+    long_haul = column_property("long_haul")
+    speed_per_timestep = column_property("speed")
 
-@dataclass
 class Train(Vehicle):
-    pass
+    __slots__ = ()
 
-@dataclass
 class Barge(Vehicle):
-    pass
\ No newline at end of file
+    __slots__ = ()
+
+VEHICLE_VIEWS = (Truck, Train, Barge)